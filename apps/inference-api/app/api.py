@@ -1,16 +1,40 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import math
+import time
+import zipfile
+from collections.abc import AsyncIterator
 from typing import Annotated
 from uuid import uuid4
 
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile, status
-from fastapi.responses import FileResponse
+from commonforms.exceptions import EncryptedPdfError, InvalidPageSelectionError
+from fastapi import APIRouter, File, Form, Header, HTTPException, Request, UploadFile, status
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import ValidationError
 
+from .batches import batch_status, extract_pdfs, is_zip, result_files, stream_zip
 from .config import settings
-from .jobs import Job, JobStatus, QueueFullError
-from .schemas import JobCreateResponse, JobErrorModel, JobStatusResponse, PrepareOptions
+from .events import snapshot
+from .jobs import (
+    TERMINAL_STATUSES,
+    Batch,
+    Job,
+    JobBusyError,
+    JobStatus,
+    QueueFullError,
+    UploadLimitError,
+)
+from .schemas import (
+    BatchDocument,
+    BatchStatusResponse,
+    FieldsResponse,
+    JobCreateResponse,
+    JobErrorModel,
+    JobStatusResponse,
+    PrepareOptions,
+)
 from .storage import JobPaths, storage
 from .worker import JobManager
 
@@ -18,58 +42,274 @@ logger = logging.getLogger(__name__)
 
 PDF_MIME_TYPES = {"application/pdf", "application/x-pdf"}
 CHUNK_SIZE = 1 << 20  # 1 MiB
+# comment lines keep idle event streams from being cut by proxies
+KEEPALIVE_SECONDS = 15.0
 
 
 def create_router(job_manager: JobManager) -> APIRouter:
     router = APIRouter()
 
+    async def submit_upload(
+        request: Request,
+        file: UploadFile,
+        options: PrepareOptions | None,
+        client_id: str | None,
+        *,
+        head: bytes = b"",
+    ) -> Job:
+        job_id = uuid4().hex
+        paths = storage.job_paths(job_id)
+
+        try:
+            await _persist_upload(file, paths, head=head)
+        except ValueError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(exc),
+            ) from exc
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Failed to persist upload for job %s", job_id)
+            storage.delete_job(job_id)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Unable to store uploaded file.",
+            ) from exc
+
+        try:
+            return await job_manager.submit_job(
+                job_id,
+                paths,
+                options,
+                client_id=client_id or (request.client.host if request.client else None),
+            )
+        except QueueFullError as exc:
+            storage.delete_job(job_id)
+            raise _queue_full(exc) from exc
+
     @router.post(
         "/jobs",
         response_model=JobCreateResponse,
         status_code=status.HTTP_202_ACCEPTED,
     )
     async def create_job(
+        request: Request,
         file: UploadFile = File(...),
         options: Annotated[str | None, Form()] = None,
+        client_id: Annotated[str | None, Header(alias="X-Client-Id")] = None,
     ) -> JobCreateResponse:
-        if file.content_type and file.content_type.lower() not in PDF_MIME_TYPES:
-            raise HTTPException(
-                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-                detail="Only PDF uploads are supported.",
-            )
+        _check_content_type(file)
+        parsed_options = _parse_options(options)
+
+        try:
+            job = await submit_upload(request, file, parsed_options, client_id)
+        finally:
+            await file.close()
+
+        return _job_create_response(job)
+
+    async def process_inline(
+        request: Request,
+        file: UploadFile,
+        options: PrepareOptions | None,
+        client_id: str | None,
+    ) -> Response:
+        max_bytes = int(settings.sync_max_mb * 1_048_576)
+        detect_only = options is not None and options.output == "json"
+
+        try:
+            # read one byte past the limit to tell whether the upload fits
+            head = await file.read(max_bytes + 1)
+            # with out-of-process workers the API never runs the detector itself
+            if len(head) <= max_bytes and job_manager.queue is None:
+                try:
+                    result = await job_manager.prepare_inline(head, options)
+                except EncryptedPdfError as exc:
+                    raise HTTPException(
+                        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        detail=str(exc) or "Encrypted PDF detected.",
+                    ) from exc
+                except InvalidPageSelectionError as exc:
+                    raise HTTPException(
+                        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        detail=str(exc),
+                    ) from exc
+                if result is not None and detect_only:
+                    return Response(content=result, media_type="application/json")
+                if result is not None:
+                    return Response(
+                        content=result,
+                        media_type="application/pdf",
+                        headers={"Content-Disposition": 'attachment; filename="prepared.pdf"'},
+                    )
+
+            job = await submit_upload(request, file, options, client_id, head=head)
+        finally:
+            await file.close()
+
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=_job_create_response(job).model_dump(mode="json"),
+            headers={"Location": f"/jobs/{job.job_id}"},
+        )
+
+    @router.post(
+        "/prepare",
+        response_class=Response,
+        responses={
+            200: {
+                "content": {"application/pdf": {}},
+                "description": "The fillable PDF, for uploads within the inline limits.",
+            },
+            202: {
+                "model": JobCreateResponse,
+                "description": "The upload was too large to process inline and became a job.",
+            },
+        },
+    )
+    async def prepare(
+        request: Request,
+        file: UploadFile = File(...),
+        options: Annotated[str | None, Form()] = None,
+        client_id: Annotated[str | None, Header(alias="X-Client-Id")] = None,
+    ) -> Response:
+        _check_content_type(file)
+        return await process_inline(request, file, _parse_options(options), client_id)
+
+    @router.post(
+        "/detect",
+        response_class=Response,
+        responses={
+            200: {
+                "model": FieldsResponse,
+                "description": "Detected fields, for uploads within the inline limits.",
+            },
+            202: {
+                "model": JobCreateResponse,
+                "description": "The upload was too large to process inline and became a "
+                "detection-only job; its result is the same JSON.",
+            },
+        },
+    )
+    async def detect(
+        request: Request,
+        file: UploadFile = File(...),
+        options: Annotated[str | None, Form()] = None,
+        client_id: Annotated[str | None, Header(alias="X-Client-Id")] = None,
+    ) -> Response:
+        _check_content_type(file)
+        parsed_options = _parse_options(options) or PrepareOptions()
+        parsed_options = parsed_options.model_copy(update={"output": "json"})
+        return await process_inline(request, file, parsed_options, client_id)
 
+    @router.post(
+        "/batches",
+        response_model=BatchStatusResponse,
+        status_code=status.HTTP_202_ACCEPTED,
+    )
+    async def create_batch(
+        request: Request,
+        files: list[UploadFile] = File(...),
+        options: Annotated[str | None, Form()] = None,
+        client_id: Annotated[str | None, Header(alias="X-Client-Id")] = None,
+    ) -> BatchStatusResponse:
         parsed_options = _parse_options(options)
-        job_id = uuid4().hex
-        paths = storage.job_paths(job_id)
+        max_bytes = settings.max_upload_mb * 1_048_576
+        documents: list[tuple[str, JobPaths]] = []
 
         try:
-            try:
-                await _persist_upload(file, paths)
-            except ValueError as exc:
+            for upload in files:
+                remaining = settings.batch_max_documents - len(documents)
+                if is_zip(upload.filename, upload.content_type):
+                    documents += await asyncio.to_thread(
+                        extract_pdfs,
+                        upload.file,
+                        storage,
+                        max_bytes=max_bytes,
+                        max_documents=remaining,
+                    )
+                    continue
+
+                _check_content_type(upload)
+                if remaining <= 0:
+                    raise UploadLimitError(
+                        f"A batch holds at most {settings.batch_max_documents} documents."
+                    )
+                paths = storage.job_paths(uuid4().hex)
+                documents.append((upload.filename or f"{paths.job_id}.pdf", paths))
+                await _persist_upload(upload, paths)
+
+            if not documents:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="No PDF documents in the upload.",
+                )
+            batch = Batch(
+                batch_id=uuid4().hex,
+                documents={paths.job_id: filename for filename, paths in documents},
+            )
+            jobs = await job_manager.submit_batch(
+                batch,
+                [paths for _, paths in documents],
+                parsed_options,
+                client_id=client_id or (request.client.host if request.client else None),
+            )
+        except (Exception, asyncio.CancelledError) as exc:
+            # nothing of a failed (or abandoned) batch is kept
+            for _, paths in documents:
+                storage.delete_job(paths.job_id)
+            if isinstance(exc, UploadLimitError):
                 raise HTTPException(
                     status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                     detail=str(exc),
                 ) from exc
-            except Exception as exc:  # noqa: BLE001
-                logger.exception("Failed to persist upload for job %s", job_id)
-                storage.delete_job(job_id)
+            if isinstance(exc, ValidationError):
                 raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Unable to store uploaded file.",
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail=exc.errors(),
                 ) from exc
-
-            try:
-                job = await job_manager.submit_job(job_id, paths, parsed_options)
-            except QueueFullError as exc:
-                storage.delete_job(job_id)
+            if isinstance(exc, zipfile.BadZipFile):
                 raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail=str(exc),
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Unable to read the zip archive.",
                 ) from exc
+            if isinstance(exc, QueueFullError):
+                raise _queue_full(exc) from exc
+            raise
         finally:
-            await file.close()
+            for upload in files:
+                await upload.close()
 
-        return _job_create_response(job)
+        return _batch_status_response(batch, jobs)
+
+    @router.get(
+        "/batches/{batch_id}",
+        response_model=BatchStatusResponse,
+    )
+    async def get_batch(batch_id: str) -> BatchStatusResponse:
+        found = await job_manager.get_batch(batch_id)
+        if found is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch not found.")
+        return _batch_status_response(*found)
+
+    @router.get("/batches/{batch_id}/result")
+    async def download_batch(batch_id: str) -> StreamingResponse:
+        found = await job_manager.get_batch(batch_id)
+        if found is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch not found.")
+        batch, jobs = found
+        if batch_status(jobs) != "completed":
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Result not ready.")
+        files = result_files(batch, jobs)
+        if not files:
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="Generated PDFs have expired.",
+            )
+        return StreamingResponse(
+            stream_zip(files),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{batch_id}.zip"'},
+        )
 
     @router.get(
         "/jobs/{job_id}",
@@ -81,6 +321,79 @@ def create_router(job_manager: JobManager) -> APIRouter:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
         return _job_status_response(job)
 
+    @router.delete("/jobs/{job_id}", status_code=status.HTTP_204_NO_CONTENT)
+    async def delete_job(job_id: str) -> Response:
+        if await job_manager.get_job(job_id) is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+        # a running job is stopped before its files are deleted
+        await job_manager.remove_job(job_id)
+        storage.delete_job(job_id)
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    @router.post(
+        "/jobs/{job_id}/retry",
+        response_model=JobCreateResponse,
+        status_code=status.HTTP_202_ACCEPTED,
+    )
+    async def retry_job(job_id: str) -> JobCreateResponse:
+        job = await job_manager.get_job(job_id)
+        if job is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+        if job.status is not JobStatus.FAILED:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Only failed jobs can be retried.",
+            )
+        if not storage.job_paths(job_id).input_path.exists():
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="The uploaded PDF has expired.",
+            )
+        try:
+            retried = await job_manager.retry_job(job)
+        except JobBusyError as exc:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
+        except QueueFullError as exc:
+            raise _queue_full(exc) from exc
+        return _job_create_response(retried)
+
+    @router.post(
+        "/jobs/{job_id}/rerun",
+        response_model=JobCreateResponse,
+        status_code=status.HTTP_202_ACCEPTED,
+    )
+    async def rerun_job(job_id: str, options: PrepareOptions | None = None) -> JobCreateResponse:
+        job = await job_manager.get_job(job_id)
+        if job is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+        if job.status not in TERMINAL_STATUSES:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="The job is still running.",
+            )
+        if not storage.job_paths(job_id).input_path.exists():
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="The uploaded PDF has expired.",
+            )
+        try:
+            rerun = await job_manager.retry_job(job, options)
+        except JobBusyError as exc:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
+        except QueueFullError as exc:
+            raise _queue_full(exc) from exc
+        return _job_create_response(rerun)
+
+    @router.get("/jobs/{job_id}/events")
+    async def job_events(job_id: str) -> StreamingResponse:
+        if await job_manager.get_job(job_id) is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+        return StreamingResponse(
+            _event_stream(job_manager, job_id),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     @router.get("/jobs/{job_id}/result")
     async def download_result(job_id: str):
         job = await job_manager.get_job(job_id)
@@ -93,6 +406,8 @@ def create_router(job_manager: JobManager) -> APIRouter:
                 status_code=status.HTTP_410_GONE,
                 detail="Generated PDF has expired.",
             )
+        if job.output_path.suffix == ".json":
+            return FileResponse(path=job.output_path, media_type="application/json")
         return FileResponse(
             path=job.output_path,
             media_type="application/pdf",
@@ -102,6 +417,72 @@ def create_router(job_manager: JobManager) -> APIRouter:
     return router
 
 
+async def _event_stream(job_manager: JobManager, job_id: str) -> AsyncIterator[str]:
+    """
+    Stream a job's state as Server-Sent Events until it finishes: a `status`
+    event for the current state and every stage change, and `progress` events
+    in between. The final event carries the `download_url` (or the error).
+    """
+    # queue workers, and other API processes sharing the job store, run jobs
+    # out of this process's sight, so their changes can only be seen by
+    # re-reading the store
+    shared = job_manager.queue is not None or job_manager.store.shared
+    timeout = settings.queue_poll_interval_seconds if shared else KEEPALIVE_SECONDS
+
+    with job_manager.events.subscribe(job_id) as updates:
+        # subscribe before reading the current state so no change is missed
+        job = await job_manager.get_job(job_id)
+        if job is None:
+            return
+        last = snapshot(job)
+        last_sent = time.monotonic()
+        yield _sse_event("status", last)
+
+        while last.status not in TERMINAL_STATUSES:
+            try:
+                job = await asyncio.wait_for(updates.get(), timeout=timeout)
+            except TimeoutError:
+                current = await job_manager.get_job(job_id)
+                if current is None:
+                    # removed while it was being watched
+                    return
+                job = snapshot(current) if current.updated_at != last.updated_at else None
+
+            if job is None:
+                if time.monotonic() - last_sent >= KEEPALIVE_SECONDS:
+                    yield ": keep-alive\n\n"
+                    last_sent = time.monotonic()
+                continue
+
+            yield _sse_event("status" if job.status is not last.status else "progress", job)
+            last = job
+            last_sent = time.monotonic()
+
+
+def _sse_event(event: str, job: Job) -> str:
+    payload = _job_status_response(job).model_dump_json()
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def _queue_full(exc: QueueFullError) -> HTTPException:
+    headers = None
+    if exc.retry_after is not None:
+        headers = {"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(exc),
+        headers=headers,
+    )
+
+
+def _check_content_type(file: UploadFile) -> None:
+    if file.content_type and file.content_type.lower() not in PDF_MIME_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Only PDF uploads are supported.",
+        )
+
+
 def _parse_options(raw_options: str | None) -> PrepareOptions | None:
     if raw_options is None:
         return None
@@ -115,11 +496,15 @@ def _parse_options(raw_options: str | None) -> PrepareOptions | None:
         ) from exc
 
 
-async def _persist_upload(upload: UploadFile, paths: JobPaths) -> None:
+async def _persist_upload(upload: UploadFile, paths: JobPaths, *, head: bytes = b"") -> None:
+    """Write the upload to the job's input path; `head` is what was already read from it."""
     max_bytes = settings.max_upload_mb * 1_048_576
-    total = 0
+    total = len(head)
+    if total > max_bytes:
+        raise UploadLimitError("Uploaded file exceeds size limit.")
 
     with paths.input_path.open("wb") as buffer:
+        buffer.write(head)
         while True:
             chunk = await upload.read(CHUNK_SIZE)
             if not chunk:
@@ -128,7 +513,7 @@ async def _persist_upload(upload: UploadFile, paths: JobPaths) -> None:
             if total > max_bytes:
                 buffer.close()
                 paths.input_path.unlink(missing_ok=True)
-                raise ValueError("Uploaded file exceeds size limit.")
+                raise UploadLimitError("Uploaded file exceeds size limit.")
             buffer.write(chunk)
 
     await upload.close()
@@ -139,9 +524,20 @@ def _job_create_response(job: Job) -> JobCreateResponse:
         job_id=job.job_id,
         status=job.status,
         progress=job.progress,
+        **_estimates(job),
     )
 
 
+def _estimates(job: Job) -> dict:
+    estimate = job.metadata.get("estimate")
+    if not estimate or job.status in TERMINAL_STATUSES:
+        return {}
+    return {
+        "estimated_start_at": estimate["start_at"],
+        "estimated_finish_at": estimate["finish_at"],
+    }
+
+
 def _job_status_response(job: Job) -> JobStatusResponse:
     error = JobErrorModel(type=job.error.error_type, detail=job.error.detail) if job.error else None
     download_url = None
@@ -155,11 +551,39 @@ def _job_status_response(job: Job) -> JobStatusResponse:
         message=job.message,
         error=error,
         download_url=download_url,
+        cascade=job.metadata.get("cascade"),
+        dedupe=job.metadata.get("dedupe"),
+        memory=job.metadata.get("memory"),
+        runs=job.metadata.get("runs", 1),
+        resumed_from=job.metadata.get("resumed_from"),
+        **_estimates(job),
+    )
+
+
+def _batch_status_response(batch: Batch, jobs: list[Job]) -> BatchStatusResponse:
+    batch_state = batch_status(jobs)
+    documents = [
+        BatchDocument(
+            filename=batch.documents[job.job_id],
+            **_job_status_response(job).model_dump(),
+        )
+        for job in jobs
+    ]
+    download_url = None
+    if batch_state == "completed":
+        download_url = _build_download_url(batch.batch_id, prefix="batches")
+
+    return BatchStatusResponse(
+        batch_id=batch.batch_id,
+        status=batch_state,
+        progress=sum(job.progress for job in jobs) / len(jobs) if jobs else 1.0,
+        documents=documents,
+        download_url=download_url,
     )
 
 
-def _build_download_url(job_id: str) -> str:
+def _build_download_url(job_id: str, *, prefix: str = "jobs") -> str:
     if settings.base_download_url:
         base = settings.base_download_url.rstrip("/")
-        return f"{base}/jobs/{job_id}/result"
-    return f"/jobs/{job_id}/result"
+        return f"{base}/{prefix}/{job_id}/result"
+    return f"/{prefix}/{job_id}/result"
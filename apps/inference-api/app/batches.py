@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import io
+import zipfile
+from collections.abc import Iterator
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO
+from uuid import uuid4
+
+from .jobs import TERMINAL_STATUSES, Batch, Job, JobStatus, UploadLimitError
+from .storage import JobPaths, StorageManager
+
+CHUNK_SIZE = 1 << 20  # 1 MiB
+ZIP_MIME_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+
+def is_zip(filename: str | None, content_type: str | None) -> bool:
+    if content_type and content_type.lower() in ZIP_MIME_TYPES:
+        return True
+    return bool(filename) and filename.lower().endswith(".zip")
+
+
+def extract_pdfs(
+    archive_file: BinaryIO,
+    storage: StorageManager,
+    *,
+    max_bytes: int,
+    max_documents: int,
+) -> list[tuple[str, JobPaths]]:
+    """
+    Copy every PDF in a zip archive into a new job directory and return the
+    member file names with their job paths. Raises UploadLimitError if a member is
+    larger than `max_bytes` (measured while copying, not trusted from the
+    archive) or there are more than `max_documents` PDFs, and
+    zipfile.BadZipFile for archives that can't be read.
+    """
+    extracted: list[tuple[str, JobPaths]] = []
+    try:
+        with zipfile.ZipFile(archive_file) as archive:
+            for info in archive.infolist():
+                name = PurePosixPath(info.filename)
+                if info.is_dir() or name.suffix.lower() != ".pdf" or "__MACOSX" in name.parts:
+                    continue
+                if len(extracted) >= max_documents:
+                    raise UploadLimitError(f"A batch holds at most {max_documents} documents.")
+
+                paths = storage.job_paths(uuid4().hex)
+                extracted.append((name.name, paths))
+                with archive.open(info) as source, paths.input_path.open("wb") as target:
+                    _copy_limited(source, target, max_bytes)
+    except Exception:
+        for _, paths in extracted:
+            storage.delete_job(paths.job_id)
+        raise
+    return extracted
+
+
+def _copy_limited(source: BinaryIO, target: BinaryIO, max_bytes: int) -> None:
+    total = 0
+    while chunk := source.read(CHUNK_SIZE):
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadLimitError("Uploaded file exceeds size limit.")
+        target.write(chunk)
+
+
+def batch_status(jobs: list[Job]) -> str:
+    statuses = [job.status for job in jobs]
+    if all(status in TERMINAL_STATUSES for status in statuses):
+        return "completed" if JobStatus.READY in statuses else "failed"
+    if all(status is JobStatus.QUEUED for status in statuses):
+        return "queued"
+    return "processing"
+
+
+def result_files(batch: Batch, jobs: list[Job]) -> list[tuple[str, Path]]:
+    """Archive names and paths of the results of a batch's successful jobs."""
+    files: list[tuple[str, Path]] = []
+    seen: set[str] = set()
+    for job in jobs:
+        if job.status is not JobStatus.READY or not job.output_path:
+            continue
+        if not job.output_path.exists():
+            continue
+        # the file name came from the client; keep only its last component so
+        # the archive can't write outside the directory it is extracted to
+        base = PurePosixPath(batch.documents[job.job_id].replace("\\", "/")).name
+        if base in ("", ".."):
+            base = job.job_id
+        # detection-only jobs produce JSON rather than a PDF
+        name = PurePosixPath(base).with_suffix(job.output_path.suffix)
+        archive_name = str(name)
+        counter = 1
+        while archive_name in seen:
+            archive_name = f"{name.stem}-{counter}{name.suffix}"
+            counter += 1
+        seen.add(archive_name)
+        files.append((archive_name, job.output_path))
+    return files
+
+
+class _ZipBuffer(io.RawIOBase):
+    """Write-only sink that hands out what zipfile wrote since the last drain."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(files: list[tuple[str, Path]]) -> Iterator[bytes]:
+    """
+    Zip `files` on the fly. The sink isn't seekable, so zipfile writes data
+    descriptors after each member and nothing has to be buffered beyond one
+    chunk; PDFs are already compressed, so members are stored as-is.
+    """
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, path in files:
+            with path.open("rb") as source, archive.open(name, "w", force_zip64=True) as target:
+                while chunk := source.read(CHUNK_SIZE):
+                    target.write(chunk)
+                    yield buffer.drain()
+            yield buffer.drain()
+    yield buffer.drain()
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import os
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO
+
+import numpy as np
+from commonforms.export import DetectionWriter, read_detections
+from commonforms.utils import BoundingBox, Detections, PageGeometry, Widget
+
+from .jobs import TERMINAL_STATUSES, Job, JobError, JobStatus
+from .storage import JobPaths
+
+logger = logging.getLogger(__name__)
+
+# bumped whenever the layout of metadata.json or the detections file changes;
+# checkpoints of another version are ignored
+CHECKPOINT_VERSION = 2
+DETECTIONS_FILE = "detections.npz"
+LEASE_FILE = "lease"
+WIDGET_TYPES = ("TextBox", "ChoiceButton", "Signature")
+
+
+def save_state(job: Job, paths: JobPaths, **extra: Any) -> None:
+    """
+    Write the job's state to `metadata.json` in its directory, keeping what
+    earlier checkpoints recorded (such as the detections) unless `extra`
+    replaces it. The file is replaced atomically, so a crash mid-write leaves
+    the previous checkpoint intact.
+    """
+    state = load_state(paths) or {}
+    state.update(extra)
+    state.update(
+        version=CHECKPOINT_VERSION,
+        job_id=job.job_id,
+        status=job.status.value,
+        progress=job.progress,
+        message=job.message,
+        error=asdict(job.error) if job.error else None,
+        output_path=str(job.output_path) if job.output_path else None,
+        created_at=job.created_at.isoformat(),
+        updated_at=job.updated_at.isoformat(),
+        metadata=job.metadata,
+    )
+    _write_json(paths.metadata_path, state)
+
+
+def checkpoint_state(job: Job, paths: JobPaths) -> None:
+    """`save_state` for callers that carry on regardless, e.g. when the job was removed."""
+    try:
+        save_state(job, paths)
+    except OSError:
+        logger.warning("Unable to checkpoint job %s", job.job_id, exc_info=True)
+
+
+def load_state(paths: JobPaths) -> dict[str, Any] | None:
+    """The saved state of a job, or None if there is none (or it is unreadable)."""
+    try:
+        state = json.loads(paths.metadata_path.read_text())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        logger.warning("Ignoring unreadable checkpoint %s", paths.metadata_path)
+        return None
+    if not isinstance(state, dict) or state.get("version") != CHECKPOINT_VERSION:
+        return None
+    return state
+
+
+def job_from_state(state: dict[str, Any]) -> Job:
+    error = state.get("error")
+    output_path = state.get("output_path")
+    return Job(
+        job_id=state["job_id"],
+        status=JobStatus(state["status"]),
+        progress=state["progress"],
+        message=state.get("message"),
+        error=JobError(**error) if error else None,
+        output_path=Path(output_path) if output_path else None,
+        created_at=datetime.fromisoformat(state["created_at"]),
+        updated_at=datetime.fromisoformat(state["updated_at"]),
+        metadata=state.get("metadata") or {},
+    )
+
+
+def save_detections(
+    job: Job,
+    paths: JobPaths,
+    widgets: dict[int, list[Widget]],
+    geometry: dict[int, PageGeometry],
+    key: dict[str, Any],
+    reports: dict[str, Any],
+    *,
+    min_confidence: float,
+) -> None:
+    """
+    Checkpoint the DETECTING stage: the detected widgets as a columnar
+    `detections.npz` (see commonforms.export) and, in metadata.json, the
+    geometry of every selected page, the options the detections depend on
+    and the detection `reports` (job metadata such as the dedupe counts),
+    so a later run with the same options can skip rendering and detection.
+    The widgets go down to `min_confidence`, so runs asking for any higher
+    threshold can reuse them too.
+    """
+    detections_path = paths.base_dir / DETECTIONS_FILE
+    partial = detections_path.with_suffix(".partial")
+    with DetectionWriter(partial, WIDGET_TYPES) as writer:
+        for page_ix, page_widgets in sorted(widgets.items()):
+            writer.add_page(job.job_id, page_ix, geometry[page_ix], _arrays(page_widgets))
+    os.replace(partial, detections_path)
+
+    save_state(
+        job,
+        paths,
+        detection={
+            "key": key,
+            "file": DETECTIONS_FILE,
+            "min_confidence": min_confidence,
+            "reports": reports,
+            "geometry": {str(page_ix): asdict(page) for page_ix, page in geometry.items()},
+        },
+    )
+
+
+def has_detections(paths: JobPaths, key: dict[str, Any], confidence: float) -> bool:
+    """Whether `load_detections` would find detections to reuse (without reading them)."""
+    return _usable_detection(paths, key, confidence) is not None
+
+
+def load_detections(
+    paths: JobPaths, key: dict[str, Any], confidence: float
+) -> tuple[dict[int, list[Widget]], dict[int, PageGeometry], dict[str, Any]] | None:
+    """
+    Widgets, page geometry and reports saved by `save_detections`, or None
+    if there are none, they were made with different options, or they don't
+    go down to `confidence`. Widgets below `confidence` are still included.
+    """
+    detection = _usable_detection(paths, key, confidence)
+    if detection is None:
+        return None
+    try:
+        columns = read_detections(paths.base_dir / detection["file"])
+    except (OSError, ValueError, KeyError):
+        logger.warning("Ignoring unreadable detections of job %s", paths.job_id)
+        return None
+
+    widgets: dict[int, list[Widget]] = {}
+    for page_ix, widget_type, score, x0, y0, x1, y1 in zip(
+        columns["page"].tolist(),
+        columns["widget_type"].tolist(),
+        columns["confidence"].tolist(),
+        columns["x0"].tolist(),
+        columns["y0"].tolist(),
+        columns["x1"].tolist(),
+        columns["y1"].tolist(),
+    ):
+        # rows keep the reading order the detector sorted each page into
+        widgets.setdefault(page_ix, []).append(
+            Widget(
+                widget_type=widget_type,
+                bounding_box=BoundingBox(x0=x0, y0=y0, x1=x1, y1=y1),
+                page=page_ix,
+                confidence=score,
+            )
+        )
+    geometry = {
+        int(page_ix): PageGeometry(**page) for page_ix, page in detection["geometry"].items()
+    }
+    return widgets, geometry, detection["reports"]
+
+
+class JobLease:
+    """
+    An exclusive flock on a file in a job's directory, held by the process
+    that has the job queued or running. The kernel drops it when that process
+    exits, however it exits, so a job whose lease can be taken isn't being
+    run by any process sharing the storage directory.
+    """
+
+    def __init__(self, handle: BinaryIO) -> None:
+        self._handle = handle
+
+    def release(self) -> None:
+        self._handle.close()
+
+
+def acquire_lease(paths: JobPaths) -> JobLease | None:
+    """Take the job's lease, or return None if another holder has it."""
+    handle = (paths.base_dir / LEASE_FILE).open("ab")
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return None
+    return JobLease(handle)
+
+
+def interrupted_jobs(storage_dir: Path) -> list[dict[str, Any]]:
+    """Saved states of jobs that were still queued or running, oldest first."""
+    states = []
+    for job_dir in storage_dir.iterdir():
+        if not (job_dir / "metadata.json").is_file():
+            continue
+        state = load_state(JobPaths(job_id=job_dir.name, base_dir=job_dir))
+        if state is None or JobStatus(state["status"]) in TERMINAL_STATUSES:
+            continue
+        if (job_dir / "input.pdf").is_file():
+            states.append(state)
+    return sorted(states, key=lambda state: state["created_at"])
+
+
+def _usable_detection(
+    paths: JobPaths, key: dict[str, Any], confidence: float
+) -> dict[str, Any] | None:
+    detection = (load_state(paths) or {}).get("detection")
+    if not detection or detection["key"] != key or confidence < detection["min_confidence"]:
+        return None
+    return detection
+
+
+def _arrays(widgets: list[Widget]) -> Detections:
+    boxes = np.array(
+        [
+            [w.bounding_box.x0, w.bounding_box.y0, w.bounding_box.x1, w.bounding_box.y1]
+            for w in widgets
+        ],
+        dtype=np.float32,
+    ).reshape(-1, 4)
+    classes = np.array([WIDGET_TYPES.index(w.widget_type) for w in widgets], dtype=np.uint8)
+    scores = np.array([w.confidence for w in widgets], dtype=np.float32)
+    return Detections(boxes, classes, scores)
+
+
+def _write_json(path: Path, payload: dict[str, Any]) -> None:
+    partial = path.with_suffix(".partial")
+    partial.write_text(json.dumps(payload, default=str))
+    os.replace(partial, path)
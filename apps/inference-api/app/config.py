@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import List
+from typing import List, Literal
 import tempfile
 
 from pydantic import Field
@@ -17,20 +17,90 @@ class Settings(BaseSettings):
     )
 
     job_storage_dir: Path = Path(tempfile.gettempdir()) / "commonforms_jobs"
+    # "sqlite" shares job state between uvicorn worker processes on one machine
+    job_store: Literal["memory", "sqlite"] = "memory"
+    job_store_path: Path | None = None
+    # "queue" hands jobs to `commonforms-worker` processes through a durable
+    # SQLite queue (implies the sqlite job store) instead of running them here
+    executor: Literal["inline", "queue"] = "inline"
+    # with the inline executor, requeue at startup the jobs a previous
+    # process left queued or running (from the state saved in their job
+    # directories); a job is only resumed once its directory lease is free,
+    # so processes sharing one storage dir don't run each other's jobs
+    resume_interrupted_jobs: bool = True
+    queue_lease_seconds: float = 120.0
+    # how often queue workers, and inline jobs on a shared (sqlite) job store,
+    # check the store for jobs deleted by another process, and how often
+    # progress streams re-read it for changes made by other processes
+    queue_poll_interval_seconds: float = 0.5
+    # "stub" replaces the detector with one that sleeps stub_page_latency_ms
+    # per page and loads no model, for load tests of the API itself
+    detector_backend: Literal["ffdnet", "stub"] = "ffdnet"
+    stub_page_latency_ms: float = 50.0
     default_model: str = "FFDNet-L"
     device: str | int = "cpu"
     fast_mode: bool = False
     keep_existing_fields: bool = False
     use_signature_fields: bool = False
     confidence: float = 0.3
+    # jobs detect down to this confidence and apply their own threshold
+    # afterwards, so rerunning one with a lower threshold (down to the floor)
+    # reuses its detections; None detects at the requested threshold. Off by
+    # default since dedupe then also merges the sub-threshold boxes, which
+    # moves the ones that are kept
+    rerun_confidence_floor: float | None = None
     image_size: int = 1600
+    render_grayscale: bool = False
+    # load the default detector on every processing thread and run a warm-up
+    # inference at startup; /ready reports 503 until that is done
+    preload_models: bool = False
+    # screen every page with FFDNet-S and run the default model only on pages
+    # whose detections look ambiguous
+    cascade: bool = False
+    # merge duplicate detections of the same field after detection
+    dedupe: bool = True
+    # skip detection on blank (and, keeping existing fields, fielded) pages;
+    # off by default, like the library
+    prefilter: bool = False
+    prefilter_blank_variance: float = 2.0
+    prefilter_skip_image_only: bool = False
     max_concurrent_jobs: int = 2
+    # memory one job may use on top of the loaded models, estimated from its
+    # page sizes before rendering; bigger jobs are detected in smaller
+    # batches, a few pages at a time, or at a lower resolution (down to
+    # memory_min_image_size), and fail if none of that fits; None disables
+    # the check. Two jobs at the default fit a 4 GB machine with the models
+    memory_budget_mb: float | None = 1536.0
+    memory_min_image_size: int = 960
+    # how long DELETE /jobs/{id} waits for a running job to stop at its next
+    # page boundary before removing its files anyway
+    cancel_timeout_seconds: float = 30.0
+    # reject jobs that wouldn't finish within this many seconds of queued
+    # work (measured in Letter pages at the observed processing rate)
+    admission_max_seconds: float = 600.0
+    # processing rate, in Letter pages per second per job, assumed until
+    # jobs have been measured
+    admission_default_pages_per_second: float = 0.5
+    # waiting jobs run shortest-first; a job gains one Letter page of priority
+    # per second waited for every unit of aging rate
+    scheduler_aging_rate: float = 1.0
+    # pick the next job from the client with the fewest jobs running
+    scheduler_fair_share: bool = False
     queue_size: int = 100
     cleanup_ttl_seconds: int = 3600
     cleanup_interval_seconds: int = 600
     cors_origins: List[str] = Field(default_factory=list)
     base_download_url: str | None = None
     max_upload_mb: int = 20
+    # documents per POST /batches request (each one is held to max_upload_mb)
+    batch_max_documents: int = 100
+    # POST /prepare answers with the PDF itself for uploads up to this size
+    # and page count, and falls back to a job otherwise
+    sync_max_mb: float = 2.0
+    sync_max_pages: int = 3
+    # threads that answer those requests, each with its own detector, apart
+    # from the max_concurrent_jobs threads that run jobs
+    inline_threads: int = 1
 
 
 settings = Settings()
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import replace
+
+from .jobs import Job
+
+
+class JobEvents:
+    """
+    Fans job state changes out to async subscribers (the SSE streams).
+
+    Jobs change on processing threads, so each change is handed to the
+    subscriber's event loop with `call_soon_threadsafe`; a stream sleeps until
+    its job actually changes instead of polling the job store.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscribers: dict[str, set[tuple[asyncio.AbstractEventLoop, asyncio.Queue[Job]]]] = (
+            defaultdict(set)
+        )
+
+    @contextmanager
+    def subscribe(self, job_id: str) -> Iterator[asyncio.Queue[Job]]:
+        """Receive a snapshot of the job after each of its state changes."""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers[job_id].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(job_id)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._subscribers[job_id]
+
+    def publish(self, job: Job) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(job.job_id, ()))
+        if not subscribers:
+            return
+
+        copy = snapshot(job)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, copy)
+            except RuntimeError:
+                # the subscriber's loop has shut down
+                continue
+
+
+def snapshot(job: Job) -> Job:
+    """A detached copy of `job`; the live object keeps changing on other threads."""
+    return replace(job, on_change=None, metadata=dict(job.metadata))
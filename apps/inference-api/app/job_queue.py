@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from .config import Settings
+from .job_store import job_database_path
+from .schemas import PrepareOptions
+
+
+@dataclass(slots=True)
+class QueuedJob:
+    job_id: str
+    options: PrepareOptions | None
+
+
+class JobQueue:
+    """
+    Durable queue of jobs waiting for an out-of-process inference worker.
+
+    Entries live in SQLite, so they survive API and worker restarts. A worker
+    claims an entry with a lease that it renews while processing; if the
+    worker dies, the lease runs out and another worker picks the job up.
+
+    Entries are claimed shortest-first with aging, in the same order as
+    `JobScheduler` uses for inline jobs.
+    """
+
+    def __init__(
+        self, path: Path, *, lease_seconds: float = 120.0, aging_rate: float = 1.0
+    ) -> None:
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.aging_rate = aging_rate
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS job_queue (
+                    job_id TEXT PRIMARY KEY,
+                    options TEXT,
+                    enqueued_at REAL NOT NULL,
+                    claimed_by TEXT,
+                    lease_expires_at REAL,
+                    cost REAL NOT NULL DEFAULT 1.0
+                )
+                """
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(job_queue)")}
+            if "cost" not in columns:
+                # queues created before jobs were costed
+                self._conn.execute(
+                    "ALTER TABLE job_queue ADD COLUMN cost REAL NOT NULL DEFAULT 1.0"
+                )
+
+    def enqueue(self, job_id: str, options: PrepareOptions | None, *, cost: float = 1.0) -> None:
+        payload = options.model_dump_json(exclude_none=True) if options else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_queue (job_id, options, enqueued_at, cost) "
+                "VALUES (?, ?, ?, ?)",
+                (job_id, payload, time.time(), cost),
+            )
+
+    def claim(self, worker_id: str) -> QueuedJob | None:
+        """Take the next unclaimed (or abandoned) entry, or None if there is none."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    """
+                    SELECT job_id, options FROM job_queue
+                    WHERE claimed_by IS NULL OR lease_expires_at < ?
+                    ORDER BY cost + ? * enqueued_at, enqueued_at
+                    LIMIT 1
+                    """,
+                    (now, self.aging_rate),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE job_queue SET claimed_by = ?, lease_expires_at = ? WHERE job_id = ?",
+                        (worker_id, now + self.lease_seconds, row[0]),
+                    )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+        if row is None:
+            return None
+        job_id, payload = row
+        options = PrepareOptions.model_validate_json(payload) if payload else None
+        return QueuedJob(job_id=job_id, options=options)
+
+    def renew(self, job_id: str, worker_id: str) -> bool:
+        """Extend a lease. Returns False if `worker_id` no longer holds it."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE job_queue SET lease_expires_at = ? WHERE job_id = ? AND claimed_by = ?",
+                (time.time() + self.lease_seconds, job_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+    def complete(self, job_id: str, worker_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM job_queue WHERE job_id = ? AND claimed_by = ?", (job_id, worker_id)
+            )
+
+    def remove(self, job_id: str) -> None:
+        """Drop a job that hasn't been claimed yet."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM job_queue WHERE job_id = ? AND claimed_by IS NULL", (job_id,)
+            )
+
+    def depth(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM job_queue").fetchone()
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_job_queue(settings: Settings) -> JobQueue | None:
+    if settings.executor != "queue":
+        return None
+    return JobQueue(
+        job_database_path(settings),
+        lease_seconds=settings.queue_lease_seconds,
+        aging_rate=settings.scheduler_aging_rate,
+    )
@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import heapq
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from .config import Settings
+from .jobs import TERMINAL_STATUSES, Batch, Job, JobError, JobStatus, QueueFullError
+
+
+class JobStore(ABC):
+    """Where job state lives. Every mutation of a stored job is persisted."""
+
+    # whether other processes see (and change) the same jobs
+    shared = False
+
+    @abstractmethod
+    def add(self, job: Job, *, max_active: int | None = None) -> None:
+        """Store a new job, raising QueueFullError if max_active jobs are running."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Job | None: ...
+
+    @abstractmethod
+    def list_jobs(self) -> list[Job]: ...
+
+    @abstractmethod
+    def remove(self, job_id: str) -> None: ...
+
+    @abstractmethod
+    def save(self, job: Job) -> None:
+        """Persist the current state of a job."""
+
+    @abstractmethod
+    def active_count(self) -> int: ...
+
+    @abstractmethod
+    def status_counts(self) -> dict[JobStatus, int]: ...
+
+    @abstractmethod
+    def expired(self, cutoff: datetime) -> list[str]:
+        """Ids of finished jobs last updated before `cutoff`, oldest first."""
+
+    @abstractmethod
+    def add_batch(self, batch: Batch) -> None: ...
+
+    @abstractmethod
+    def get_batch(self, batch_id: str) -> Batch | None: ...
+
+    @abstractmethod
+    def remove_batch(self, batch_id: str) -> None: ...
+
+    def close(self) -> None:
+        return None
+
+
+class InMemoryJobStore(JobStore):
+    """
+    Process-local store; jobs are only visible to the process that created them.
+
+    Per-status counts are kept up to date on every state transition, so the
+    admission check doesn't scan the registry, and finished jobs are pushed
+    onto a heap ordered by `updated_at`, so cleanup only touches the jobs
+    that have actually expired.
+    """
+
+    def __init__(self) -> None:
+        self.jobs: dict[str, Job] = {}
+        self.batches: dict[str, Batch] = {}
+        # jobs are updated from processing threads as well as the event loop
+        self._lock = threading.Lock()
+        self._statuses: dict[str, JobStatus] = {}
+        self._counts: Counter[JobStatus] = Counter()
+        self._expiry: list[tuple[datetime, str]] = []
+
+    def add(self, job: Job, *, max_active: int | None = None) -> None:
+        with self._lock:
+            if max_active and self._active_count() >= max_active:
+                raise QueueFullError("Job queue is at capacity.")
+            self.jobs[job.job_id] = job
+            self._track(job)
+        job.on_change = self.save
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> list[Job]:
+        return list(self.jobs.values())
+
+    def remove(self, job_id: str) -> None:
+        with self._lock:
+            if self.jobs.pop(job_id, None) is None:
+                return
+            self._counts[self._statuses.pop(job_id)] -= 1
+
+    def save(self, job: Job) -> None:
+        # the stored object *is* the live job; only the indexes need updating
+        with self._lock:
+            if self.jobs.get(job.job_id) is job:
+                self._track(job)
+
+    def active_count(self) -> int:
+        with self._lock:
+            return self._active_count()
+
+    def status_counts(self) -> dict[JobStatus, int]:
+        with self._lock:
+            return {status: count for status, count in self._counts.items() if count}
+
+    def expired(self, cutoff: datetime) -> list[str]:
+        job_ids = []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] < cutoff:
+                updated_at, job_id = heapq.heappop(self._expiry)
+                job = self.jobs.get(job_id)
+                # entries go stale when a job is removed or updated again
+                if job is None or job.updated_at != updated_at:
+                    continue
+                if job.status in TERMINAL_STATUSES:
+                    job_ids.append(job_id)
+        return job_ids
+
+    def add_batch(self, batch: Batch) -> None:
+        self.batches[batch.batch_id] = batch
+
+    def get_batch(self, batch_id: str) -> Batch | None:
+        return self.batches.get(batch_id)
+
+    def remove_batch(self, batch_id: str) -> None:
+        self.batches.pop(batch_id, None)
+
+    def _active_count(self) -> int:
+        return sum(
+            count for status, count in self._counts.items() if status not in TERMINAL_STATUSES
+        )
+
+    def _track(self, job: Job) -> None:
+        previous = self._statuses.get(job.job_id)
+        if previous is not job.status:
+            if previous is not None:
+                self._counts[previous] -= 1
+            self._counts[job.status] += 1
+            self._statuses[job.job_id] = job.status
+        if job.status in TERMINAL_STATUSES:
+            heapq.heappush(self._expiry, (job.updated_at, job.job_id))
+
+
+class SqliteJobStore(JobStore):
+    """
+    SQLite-backed store shared by every worker process on a machine.
+
+    The database runs in WAL mode so readers never block the writer, and each
+    state transition is a single-row upsert, so another process answering
+    ``GET /jobs/{id}`` always sees a consistent snapshot of the job.
+    """
+
+    shared = True
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # jobs are updated from processing threads as well as the event loop
+        self._conn = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL,
+                    message TEXT,
+                    error_type TEXT,
+                    error_detail TEXT,
+                    output_path TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    metadata TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_expiry ON jobs (status, updated_at)"
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS batches (
+                    batch_id TEXT PRIMARY KEY,
+                    documents TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+                """
+            )
+
+    def add(self, job: Job, *, max_active: int | None = None) -> None:
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so the capacity
+            # check and the insert are atomic across processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if max_active and self._active_count() >= max_active:
+                    raise QueueFullError("Job queue is at capacity.")
+                self._upsert(job)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        job.on_change = self.save
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def list_jobs(self) -> list[Job]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at").fetchall()
+        return [_row_to_job(row) for row in rows]
+
+    def remove(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def save(self, job: Job) -> None:
+        # an UPDATE rather than an upsert, so the last state changes of a job
+        # that is removed while still processing don't bring its row back
+        with self._lock:
+            job_id, *values = _job_values(job)
+            self._conn.execute(
+                """
+                UPDATE jobs SET status = ?, progress = ?, message = ?, error_type = ?,
+                    error_detail = ?, output_path = ?, created_at = ?, updated_at = ?,
+                    metadata = ?
+                WHERE job_id = ?
+                """,
+                (*values, job_id),
+            )
+
+    def active_count(self) -> int:
+        with self._lock:
+            return self._active_count()
+
+    def status_counts(self) -> dict[JobStatus, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        return {JobStatus(status): count for status, count in rows}
+
+    def expired(self, cutoff: datetime) -> list[str]:
+        placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT job_id FROM jobs WHERE status IN ({placeholders}) AND updated_at < ? "
+                "ORDER BY updated_at",
+                [*(status.value for status in TERMINAL_STATUSES), cutoff.isoformat()],
+            ).fetchall()
+        return [job_id for (job_id,) in rows]
+
+    def add_batch(self, batch: Batch) -> None:
+        documents = json.dumps(batch.documents)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO batches VALUES (?, ?, ?)",
+                (batch.batch_id, documents, batch.created_at.isoformat()),
+            )
+
+    def get_batch(self, batch_id: str) -> Batch | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT documents, created_at FROM batches WHERE batch_id = ?", (batch_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        documents, created_at = row
+        return Batch(
+            batch_id=batch_id,
+            documents=json.loads(documents),
+            created_at=datetime.fromisoformat(created_at),
+        )
+
+    def remove_batch(self, batch_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM batches WHERE batch_id = ?", (batch_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _active_count(self) -> int:
+        placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+        (count,) = self._conn.execute(
+            f"SELECT COUNT(*) FROM jobs WHERE status NOT IN ({placeholders})",
+            [status.value for status in TERMINAL_STATUSES],
+        ).fetchone()
+        return count
+
+    def _upsert(self, job: Job) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", _job_values(job)
+        )
+
+
+def _job_values(job: Job) -> tuple[Any, ...]:
+    return (
+        job.job_id,
+        job.status.value,
+        job.progress,
+        job.message,
+        job.error.error_type if job.error else None,
+        job.error.detail if job.error else None,
+        str(job.output_path) if job.output_path else None,
+        job.created_at.isoformat(),
+        job.updated_at.isoformat(),
+        json.dumps(job.metadata, default=str),
+    )
+
+
+def _row_to_job(row: tuple[Any, ...]) -> Job:
+    (
+        job_id,
+        status,
+        progress,
+        message,
+        error_type,
+        error_detail,
+        output_path,
+        created_at,
+        updated_at,
+        metadata,
+    ) = row
+    return Job(
+        job_id=job_id,
+        status=JobStatus(status),
+        progress=progress,
+        message=message,
+        error=JobError(error_type, error_detail) if error_type else None,
+        output_path=Path(output_path) if output_path else None,
+        created_at=datetime.fromisoformat(created_at),
+        updated_at=datetime.fromisoformat(updated_at),
+        metadata=json.loads(metadata),
+    )
+
+
+def job_database_path(settings: Settings) -> Path:
+    return settings.job_store_path or settings.job_storage_dir / "jobs.sqlite3"
+
+
+def create_job_store(settings: Settings) -> JobStore:
+    # out-of-process workers report progress through the shared database
+    if settings.job_store == "sqlite" or settings.executor == "queue":
+        return SqliteJobStore(job_database_path(settings))
+    return InMemoryJobStore()
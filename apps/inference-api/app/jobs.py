@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from collections.abc import Callable
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import StrEnum
@@ -27,10 +28,25 @@ STAGE_PROGRESS: dict[JobStatus, float] = {
     JobStatus.FAILED: 1.0,
 }
 
+TERMINAL_STATUSES = {JobStatus.READY, JobStatus.FAILED}
+
 
 class QueueFullError(RuntimeError):
     """Raised when the job queue is at capacity."""
 
+    def __init__(self, message: str, *, retry_after: float | None = None) -> None:
+        super().__init__(message)
+        # seconds until the backlog should have room again, if known
+        self.retry_after = retry_after
+
+
+class JobBusyError(RuntimeError):
+    """Raised when a job is already queued or running, here or in another process."""
+
+
+class UploadLimitError(ValueError):
+    """Raised when an upload is larger, or holds more documents, than allowed."""
+
 
 @dataclass(slots=True)
 class JobError:
@@ -38,6 +54,14 @@ class JobError:
     detail: str | None = None
 
 
+@dataclass(slots=True)
+class Batch:
+    batch_id: str
+    # member job ids mapped to the uploaded file names, in upload order
+    documents: dict[str, str]
+    created_at: datetime = field(default_factory=datetime.utcnow)
+
+
 @dataclass(slots=True)
 class Job:
     job_id: str
@@ -49,6 +73,8 @@ class Job:
     created_at: datetime = field(default_factory=datetime.utcnow)
     updated_at: datetime = field(default_factory=datetime.utcnow)
     metadata: dict[str, Any] = field(default_factory=dict)
+    # set by the job store so every state transition is persisted
+    on_change: Callable[[Job], None] | None = field(default=None, repr=False, compare=False)
 
     def update(
         self,
@@ -64,6 +90,8 @@ class Job:
         if message is not None:
             self.message = message
         self.updated_at = datetime.utcnow()
+        if self.on_change is not None:
+            self.on_change(self)
 
     def mark_stage(self, stage: JobStatus, message: str | None = None) -> None:
         self.update(status=stage, message=message)
@@ -78,12 +106,12 @@ class Job:
         self.error = JobError(error_type, detail)
         self.update(status=JobStatus.FAILED, progress=1.0, message=message)
 
-    def advance_stage(self, stage: JobStatus, fraction: float) -> None:
+    def advance_stage(self, stage: JobStatus, fraction: float, message: str | None = None) -> None:
         start = self._stage_start(stage)
         end = STAGE_PROGRESS.get(stage, start)
         clamped_fraction = max(0.0, min(fraction, 1.0))
         progress = start + (end - start) * clamped_fraction
-        self.update(progress=progress)
+        self.update(progress=progress, message=message)
 
     def complete_stage(self, stage: JobStatus) -> None:
         self.update(progress=STAGE_PROGRESS.get(stage, self.progress))
@@ -0,0 +1,396 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import itertools
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+from collections.abc import Awaitable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+try:
+    import httpx
+except ImportError:
+    # only the `loadtest` (or `dev`) extra installs it; main() says so
+    httpx = None
+
+# per-endpoint latencies are reported under these names
+SUBMIT = "POST /jobs"
+POLL = "GET /jobs/{id}"
+DOWNLOAD = "GET /jobs/{id}/result"
+ENDPOINTS = (SUBMIT, POLL, DOWNLOAD)
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class LoadReport:
+    """What one load run observed, from the client's side."""
+
+    target_rate: float
+    # seconds from the first submission until the last job finished
+    elapsed: float = 0.0
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    # submissions answered with 503 (queue full, or over the admission limit)
+    rejected: int = 0
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    # submission to downloaded result, for completed jobs
+    job_seconds: list[float] = field(default_factory=list)
+    # submission until a poll first saw the job past "queued"
+    queue_wait: list[float] = field(default_factory=list)
+    # jobs submitted but not yet finished, sampled every poll interval
+    in_flight: list[int] = field(default_factory=list)
+    retry_after: list[float] = field(default_factory=list)
+
+    def summary(self) -> dict[str, Any]:
+        requests = sum(len(latencies) for latencies in self.latencies.values())
+        elapsed = self.elapsed or 1.0
+        return {
+            "target_rate": self.target_rate,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "throughput": {
+                "jobs_per_second": round(self.completed / elapsed, 3),
+                "requests_per_second": round(requests / elapsed, 3),
+            },
+            "jobs": {
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "seconds": _distribution(self.job_seconds),
+            },
+            "endpoints": {
+                endpoint: {
+                    "requests": len(self.latencies[endpoint]),
+                    "errors": self.errors[endpoint],
+                    "seconds": _distribution(self.latencies[endpoint]),
+                }
+                for endpoint in ENDPOINTS
+            },
+            "queue": {
+                "wait_seconds": _distribution(self.queue_wait),
+                "max_in_flight": max(self.in_flight, default=0),
+                "mean_in_flight": round(sum(self.in_flight) / len(self.in_flight), 2)
+                if self.in_flight
+                else 0.0,
+                "retry_after_seconds": _distribution(self.retry_after),
+            },
+        }
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """The nearest-rank `q`th percentile of `values`, or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(len(ordered) * q / 100))
+    return ordered[rank - 1]
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    pdf: bytes,
+    *,
+    rate: float,
+    duration: float,
+    poll_interval: float = 0.1,
+    options: dict[str, Any] | None = None,
+    poisson: bool = False,
+    seed: int | None = None,
+) -> LoadReport:
+    """
+    Submit `pdf` as a job `rate` times a second for `duration` seconds, poll
+    each job until it finishes and download its result. Arrivals are open
+    loop: they keep to the schedule however slowly the API answers, so a
+    saturated API shows up as queueing and rejections rather than a lower
+    offered rate. With `poisson`, gaps between arrivals are exponential.
+    """
+    report = LoadReport(target_rate=rate)
+    rng = random.Random(seed)
+    jobs: set[asyncio.Task[None]] = set()
+    in_flight = [0]
+
+    async def sample() -> None:
+        while True:
+            report.in_flight.append(in_flight[0])
+            await asyncio.sleep(poll_interval)
+
+    sampler = asyncio.create_task(sample())
+    started = time.perf_counter()
+    due = 0.0
+    for arrivals in itertools.count(1):
+        if due >= duration:
+            break
+        await asyncio.sleep(max(0.0, started + due - time.perf_counter()))
+        job = asyncio.create_task(_run_job(client, report, in_flight, pdf, options, poll_interval))
+        jobs.add(job)
+        job.add_done_callback(jobs.discard)
+        due = due + rng.expovariate(rate) if poisson else arrivals / rate
+
+    while jobs:
+        await asyncio.gather(*jobs)
+    report.elapsed = time.perf_counter() - started
+    sampler.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await sampler
+    return report
+
+
+async def _run_job(
+    client: httpx.AsyncClient,
+    report: LoadReport,
+    in_flight: list[int],
+    pdf: bytes,
+    options: dict[str, Any] | None,
+    poll_interval: float,
+) -> None:
+    submitted = time.perf_counter()
+    report.submitted += 1
+    response = await _timed(
+        report,
+        SUBMIT,
+        client.post(
+            "/jobs",
+            files={"file": ("load.pdf", pdf, "application/pdf")},
+            data={"options": json.dumps(options)} if options else None,
+        ),
+    )
+    if response is None:
+        return
+    if response.status_code == 503:
+        report.rejected += 1
+        if "Retry-After" in response.headers:
+            report.retry_after.append(float(response.headers["Retry-After"]))
+        return
+    if response.status_code != 202:
+        report.errors[SUBMIT] += 1
+        return
+
+    job_id = response.json()["job_id"]
+    in_flight[0] += 1
+    try:
+        queued = True
+        while True:
+            await asyncio.sleep(poll_interval)
+            response = await _timed(report, POLL, client.get(f"/jobs/{job_id}"))
+            if response is None or response.status_code != 200:
+                if response is not None:
+                    report.errors[POLL] += 1
+                return
+            status = response.json()
+            if queued and status["status"] != "queued":
+                queued = False
+                report.queue_wait.append(time.perf_counter() - submitted)
+            if status["status"] == "failed":
+                report.failed += 1
+                return
+            if status["status"] == "ready":
+                break
+
+        response = await _timed(report, DOWNLOAD, client.get(status["download_url"]))
+        if response is None or response.status_code != 200:
+            if response is not None:
+                report.errors[DOWNLOAD] += 1
+            return
+        report.completed += 1
+        report.job_seconds.append(time.perf_counter() - submitted)
+    finally:
+        in_flight[0] -= 1
+
+
+async def _timed(
+    report: LoadReport, endpoint: str, request: Awaitable[httpx.Response]
+) -> httpx.Response | None:
+    """Await `request` and record its latency; transport errors count as errors."""
+    started = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError:
+        report.errors[endpoint] += 1
+        return None
+    report.latencies[endpoint].append(time.perf_counter() - started)
+    return response
+
+
+def _distribution(values: list[float]) -> dict[str, float | None]:
+    summary = {f"p{q}": percentile(values, q) for q in PERCENTILES}
+    summary["max"] = max(values, default=None)
+    return {key: None if value is None else round(value, 4) for key, value in summary.items()}
+
+
+def format_report(summary: dict[str, Any]) -> str:
+    def ms(value: float | None) -> str:
+        return "-" if value is None else f"{value * 1000:.1f}"
+
+    jobs, queue = summary["jobs"], summary["queue"]
+    lines = [
+        (
+            f"{'endpoint':<22} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8} {'max ms':>8}"
+        )
+    ]
+    for endpoint, stats in summary["endpoints"].items():
+        seconds = stats["seconds"]
+        lines.append(
+            f"{endpoint:<22} {stats['requests']:>8} {stats['errors']:>6} "
+            + " ".join(f"{ms(seconds[key]):>8}" for key in ("p50", "p95", "p99", "max"))
+        )
+    job_seconds, wait = jobs["seconds"], queue["wait_seconds"]
+    lines += [
+        "",
+        (
+            f"jobs: {jobs['submitted']} submitted at {summary['target_rate']}/s, "
+            f"{jobs['completed']} completed, {jobs['failed']} failed, {jobs['rejected']} rejected"
+        ),
+        (
+            f"throughput: {summary['throughput']['jobs_per_second']} jobs/s, "
+            f"{summary['throughput']['requests_per_second']} requests/s "
+            f"over {summary['elapsed_seconds']}s"
+        ),
+        (
+            f"job latency ms: p50 {ms(job_seconds['p50'])}, p95 {ms(job_seconds['p95'])}, "
+            f"p99 {ms(job_seconds['p99'])}"
+        ),
+        (
+            f"queue wait ms: p50 {ms(wait['p50'])}, p95 {ms(wait['p95'])}, p99 {ms(wait['p99'])}; "
+            f"in flight: max {queue['max_in_flight']}, mean {queue['mean_in_flight']}"
+        ),
+    ]
+    return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def local_server(env: dict[str, str], *, startup_timeout: float = 30.0) -> Iterator[str]:
+    """
+    Run the API under uvicorn in a subprocess, with `env` on top of this
+    process's environment and job files in a temporary directory, and yield
+    its base URL.
+    """
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    with tempfile.TemporaryDirectory(prefix="commonforms-loadtest-") as storage_dir:
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "app.main:app",
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(port),
+                "--log-level",
+                "warning",
+            ],
+            cwd=Path(__file__).resolve().parents[1],
+            env={**os.environ, "COMMONFORMS_JOB_STORAGE_DIR": storage_dir, **env},
+        )
+        url = f"http://127.0.0.1:{port}"
+        try:
+            deadline = time.monotonic() + startup_timeout
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+                try:
+                    if httpx.get(f"{url}/ready").status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"The API didn't become ready within {startup_timeout}s")
+                time.sleep(0.1)
+            yield url
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = ArgumentParser(
+        prog="commonforms-loadtest",
+        description="Drive POST /jobs, polling and downloads at a target rate and report "
+        "throughput, per-endpoint latency and queueing",
+    )
+    parser.add_argument("pdf", type=Path, help="PDF uploaded as every job")
+    parser.add_argument(
+        "--url",
+        help="API to load; by default a local uvicorn is started with the stub detector",
+    )
+    parser.add_argument("--rate", type=float, default=5.0, help="Jobs submitted per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to submit for")
+    parser.add_argument("--poisson", action="store_true", help="Exponential arrival gaps")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="Seconds between polls")
+    parser.add_argument("--options", help='Job options as JSON, e.g. \'{"output": "json"}\'')
+    parser.add_argument(
+        "--stub-latency-ms",
+        type=float,
+        default=50.0,
+        help="Per-page detector latency of the local server",
+    )
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Extra environment for the local server, e.g. COMMONFORMS_JOB_STORE=sqlite",
+    )
+    parser.add_argument("--seed", type=int, help="Seed for --poisson arrivals")
+    parser.add_argument("--output", type=Path, help="Also write the report as JSON here")
+    args = parser.parse_args(argv)
+    if httpx is None:
+        sys.exit(
+            "commonforms-loadtest needs httpx: install the API with its `loadtest` extra, "
+            "e.g. `uv sync --extra loadtest`"
+        )
+
+    pdf = args.pdf.read_bytes()
+    options = json.loads(args.options) if args.options else None
+
+    async def load(url: str) -> LoadReport:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60.0) as client:
+            return await run_load(
+                client,
+                pdf,
+                rate=args.rate,
+                duration=args.duration,
+                poll_interval=args.poll_interval,
+                options=options,
+                poisson=args.poisson,
+                seed=args.seed,
+            )
+
+    if args.url:
+        report = asyncio.run(load(args.url))
+    else:
+        env = {
+            "COMMONFORMS_DETECTOR_BACKEND": "stub",
+            "COMMONFORMS_STUB_PAGE_LATENCY_MS": str(args.stub_latency_ms),
+            **dict(item.split("=", 1) for item in args.env),
+        }
+        with local_server(env) as url:
+            report = asyncio.run(load(url))
+
+    summary = report.summary()
+    print(format_report(summary))
+    if args.output:
+        args.output.write_text(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,36 +4,57 @@ import asyncio
 from contextlib import asynccontextmanager, suppress
 from datetime import datetime, timedelta
 import logging
+import time
+from typing import Any
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 
 from .api import create_router
 from .config import settings
-from .jobs import JobStatus
+from .job_queue import create_job_queue
+from .job_store import create_job_store
 from .storage import storage
 from .worker import JobManager
 
 logger = logging.getLogger(__name__)
 
-TERMINAL_STATUSES = {JobStatus.READY, JobStatus.FAILED}
+# when the app module was imported, as the start of the startup timings
+IMPORTED_AT = time.perf_counter()
+
+job_manager = JobManager(
+    storage,
+    store=create_job_store(settings),
+    queue=create_job_queue(settings),
+)
 
 
-job_manager = JobManager(storage)
+# what /ready reports; filled in by the lifespan
+readiness: dict[str, Any] = {"ready": False}
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     cleanup_task: asyncio.Task[None] | None = None
+    preload_task: asyncio.Task[None] | None = None
     try:
         if settings.cleanup_ttl_seconds > 0:
             cleanup_task = asyncio.create_task(_cleanup_loop())
+        # with the queue executor, models live in the worker processes
+        if settings.preload_models and job_manager.queue is None:
+            preload_task = asyncio.create_task(_preload_models(time.perf_counter()))
+        else:
+            readiness.update(ready=True, models=[])
+        # queued jobs survive a restart in the queue itself
+        if settings.resume_interrupted_jobs and job_manager.queue is None:
+            await job_manager.resume_interrupted()
         yield
     finally:
-        if cleanup_task:
-            cleanup_task.cancel()
-            with suppress(asyncio.CancelledError):
-                await cleanup_task
+        for task in (cleanup_task, preload_task):
+            if task:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
         await job_manager.shutdown()
 
 
@@ -59,18 +80,56 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check(response: Response):
+    if not readiness["ready"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "failed" if readiness.get("error") else "starting", **readiness}
+    return {"status": "ready", **readiness}
+
+
+async def _preload_models(started: float) -> None:
+    readiness.update(ready=False, error=None)
+    model = f"{settings.default_model} ({'onnx' if settings.fast_mode else 'pt'})"
+    if settings.cascade:
+        model = f"FFDNet-S -> {model}"
+    try:
+        await job_manager.processor.warm_up(
+            settings.default_model,
+            device=settings.device,
+            fast=settings.fast_mode,
+            cascade=settings.cascade,
+        )
+    except Exception as exc:
+        logger.exception("Failed to preload %s", model)
+        readiness["error"] = f"{type(exc).__name__}: {exc}"
+        return
+
+    finished = time.perf_counter()
+    readiness.update(
+        ready=True,
+        models=[model],
+        threads=job_manager.processor.threads,
+        inline_threads=job_manager.processor.inline_threads,
+        warm_up_seconds=round(finished - started, 3),
+        startup_seconds=round(finished - IMPORTED_AT, 3),
+    )
+    logger.info(
+        "Preloaded %s on %d processing and %d inline threads in %.1fs",
+        model,
+        job_manager.processor.threads,
+        job_manager.processor.inline_threads,
+        finished - started,
+    )
+
+
 async def _cleanup_loop() -> None:
     ttl = settings.cleanup_ttl_seconds
     interval = max(5, settings.cleanup_interval_seconds)
     while True:
         await asyncio.sleep(interval)
         cutoff = datetime.utcnow() - timedelta(seconds=ttl)
-        jobs = await job_manager.list_jobs()
-        for job in jobs:
-            if job.status not in TERMINAL_STATUSES:
-                continue
-            if job.updated_at >= cutoff:
-                continue
-            storage.delete_job(job.job_id)
-            await job_manager.remove_job(job.job_id)
-            logger.info("Cleaned up job %s", job.job_id)
+        for job_id in await job_manager.expired_jobs(cutoff):
+            storage.delete_job(job_id)
+            await job_manager.remove_job(job_id)
+            logger.info("Cleaned up job %s", job_id)
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import os
+import resource
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Literal, Self
+
+MB = 1 << 20
+# detector working memory per input pixel of every page in a batch on the
+# accurate path (test-time augmentation runs each page at three scales);
+# measured on CPU for FFDNet-S and -L at 960-1600 pixels, rounded up
+ACCURATE_BYTES_PER_PIXEL = 56
+# the fast (ONNX) path runs one page at a time at 1216 pixels
+FAST_DETECTOR_BYTES = 140 * MB
+# image sizes stay multiples of the detector's largest stride
+IMAGE_SIZE_STEP = 32
+# batch sizes tried when the whole document doesn't fit in one batch
+BATCH_SIZES = (32, 16, 8, 4, 2, 1)
+
+Strategy = Literal["full", "batched", "streamed", "reduced"]
+
+
+class MemoryBudgetError(RuntimeError):
+    """Raised when a job can't be processed within the per-job memory budget."""
+
+
+@dataclass(slots=True)
+class MemoryPlan:
+    strategy: Strategy
+    estimated_bytes: int
+    budget_bytes: int | None
+    image_size: int
+    # pages handed to the detector at once; None means all of them
+    batch_size: int | None = None
+    # pages rendered at a time (and dropped once detected); None renders
+    # every page up front
+    render_batch: int | None = None
+
+
+def estimate_peak(
+    page_sizes: list[tuple[float, float]],
+    *,
+    image_size: int,
+    fast: bool,
+    grayscale: bool,
+    batch_size: int | None = None,
+    render_batch: int | None = None,
+) -> int:
+    """
+    Estimate the memory a job needs on top of the loaded model: the rendered
+    page bitmaps held at once (pages render at 72 DPI, one pixel per point)
+    plus the detector's working memory for one batch.
+    """
+    if not page_sizes:
+        return 0
+    channels = 1 if grayscale else 3
+    # largest pages first, so a window of them bounds any window of pages
+    bitmaps = sorted((int(width * height * channels) for width, height in page_sizes), reverse=True)
+    held = sum(bitmaps[:render_batch] if render_batch else bitmaps)
+
+    batch = 1 if fast else min(batch_size or len(bitmaps), len(bitmaps))
+    # grayscale bitmaps are expanded to three channels on the way in
+    expanded = batch * bitmaps[0] * 3 if grayscale else 0
+    if fast:
+        return held + expanded + FAST_DETECTOR_BYTES
+    return held + expanded + batch * image_size * image_size * ACCURATE_BYTES_PER_PIXEL
+
+
+def plan_memory(
+    page_sizes: list[tuple[float, float]],
+    *,
+    image_size: int,
+    fast: bool,
+    grayscale: bool,
+    budget_bytes: int | None,
+    min_image_size: int,
+) -> MemoryPlan:
+    """
+    Pick the cheapest way to process a job within `budget_bytes`, degrading
+    step by step: every page at once, then smaller detector batches, then
+    rendering and detecting a few pages at a time, then lower resolution.
+    Raises MemoryBudgetError if even one page at `min_image_size` won't fit.
+    """
+
+    def fits(batch_size: int | None, render_batch: int | None, size: int) -> int | None:
+        estimate = estimate_peak(
+            page_sizes,
+            image_size=size,
+            fast=fast,
+            grayscale=grayscale,
+            batch_size=batch_size,
+            render_batch=render_batch,
+        )
+        if budget_bytes is None or estimate <= budget_bytes:
+            return estimate
+        return None
+
+    pages = len(page_sizes)
+    estimate = fits(None, None, image_size)
+    if estimate is not None:
+        return MemoryPlan("full", estimate, budget_bytes, image_size)
+
+    batch_sizes = [size for size in BATCH_SIZES if size < pages]
+    if not fast:
+        for batch_size in batch_sizes:
+            estimate = fits(batch_size, None, image_size)
+            if estimate is not None:
+                return MemoryPlan("batched", estimate, budget_bytes, image_size, batch_size)
+
+    for batch_size in batch_sizes:
+        estimate = fits(batch_size, batch_size, image_size)
+        if estimate is not None:
+            return MemoryPlan(
+                "streamed",
+                estimate,
+                budget_bytes,
+                image_size,
+                None if fast else batch_size,
+                batch_size,
+            )
+
+    # the ONNX models only run at 1216, so fast jobs can't trade resolution
+    size = image_size
+    while not fast and size - IMAGE_SIZE_STEP >= min_image_size:
+        size = max(min_image_size, (size * 7 // 8) // IMAGE_SIZE_STEP * IMAGE_SIZE_STEP)
+        estimate = fits(1, 1, size)
+        if estimate is not None:
+            return MemoryPlan("reduced", estimate, budget_bytes, size, 1, 1)
+
+    needed = estimate_peak(
+        page_sizes,
+        image_size=size,
+        fast=fast,
+        grayscale=grayscale,
+        batch_size=1,
+        render_batch=1,
+    )
+    raise MemoryBudgetError(
+        f"The document needs an estimated {needed / MB:.0f} MB even one page at a time, "
+        f"over the per-job memory budget of {budget_bytes / MB:.0f} MB."
+    )
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes, or 0 where it can't be read."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class PeakRssMonitor:
+    """
+    Sample the process RSS on a background thread while a job runs. Jobs
+    share the process, so the peak covers everything running alongside; the
+    RSS at the start tells what was already in use.
+    """
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.start_bytes = 0
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> Self:
+        self.start_bytes = self.peak_bytes = current_rss()
+        if self.start_bytes:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.start_bytes:
+            self.peak_bytes = max(self.peak_bytes, current_rss())
+        else:
+            # no /proc (e.g. macOS): fall back to the lifetime peak
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak_bytes = peak if sys.platform == "darwin" else peak * 1024
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, current_rss())
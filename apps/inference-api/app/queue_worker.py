@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from argparse import ArgumentParser
+from uuid import uuid4
+
+from commonforms.cancellation import CancellationToken
+from commonforms.exceptions import ProcessingCancelledError
+
+from .checkpoint import checkpoint_state
+from .config import settings
+from .job_queue import JobQueue, QueuedJob
+from .job_store import JobStore, SqliteJobStore, job_database_path
+from .jobs import Job, JobStatus
+from .storage import StorageManager
+from .worker import JobProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class QueueWorker:
+    """
+    Pulls jobs from the durable queue and runs them with a warm JobProcessor.
+
+    Progress is reported by writing each job state transition to the shared
+    job store, where the API process reads it back.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        queue: JobQueue,
+        storage: StorageManager,
+        *,
+        poll_interval: float | None = None,
+    ) -> None:
+        self.store = store
+        self.queue = queue
+        self.storage = storage
+        self.poll_interval = poll_interval or settings.queue_poll_interval_seconds
+        self.worker_id = f"{os.getpid()}-{uuid4().hex[:8]}"
+        self.processor = JobProcessor(storage)
+
+    def warm_up(self) -> None:
+        """Load the default detector so the first job doesn't pay for it."""
+        self.processor.warm_detector(
+            settings.default_model,
+            device=settings.device,
+            fast=settings.fast_mode,
+            cascade=settings.cascade,
+        )
+
+    def run(self, stop: threading.Event) -> None:
+        logger.info("Worker %s waiting for jobs", self.worker_id)
+        while not stop.is_set():
+            if not self.run_once():
+                stop.wait(self.poll_interval)
+
+    def run_once(self) -> bool:
+        """Process the next queued job, if any. Returns whether a job was run."""
+        queued = self.queue.claim(self.worker_id)
+        if queued is None:
+            return False
+
+        try:
+            self._process(queued)
+        finally:
+            # a no-op if the lease was lost and another worker holds the entry
+            self.queue.complete(queued.job_id, self.worker_id)
+        return True
+
+    def _process(self, queued: QueuedJob) -> None:
+        job = self.store.get(queued.job_id)
+        if job is None:
+            # removed (e.g. expired) while it was waiting in the queue
+            return
+
+        paths = self.storage.job_paths(job.job_id)
+        done = threading.Event()
+        lost = threading.Event()
+        cancel = CancellationToken()
+
+        def save(changed: Job) -> None:
+            # once the lease is lost another worker owns the job's state
+            if not lost.is_set():
+                self.store.save(changed)
+
+        job.on_change = save
+        heartbeat = threading.Thread(
+            target=self._renew_lease, args=(job.job_id, done, cancel, lost), daemon=True
+        )
+        heartbeat.start()
+        try:
+            self.processor.process_sync(job, paths, queued.options, cancel)
+        except ProcessingCancelledError:
+            if lost.is_set():
+                logger.warning("Stopped job %s after losing its lease", job.job_id)
+            else:
+                job.mark_failed("Cancelled", "Job was cancelled.")
+                logger.info("Job %s cancelled", job.job_id)
+        except Exception as exc:
+            if job.status is not JobStatus.FAILED:
+                job.mark_failed(type(exc).__name__, str(exc))
+            logger.exception("Job %s failed", job.job_id)
+        finally:
+            done.set()
+            heartbeat.join()
+            if not lost.is_set():
+                checkpoint_state(job, paths)
+
+    def _renew_lease(
+        self,
+        job_id: str,
+        done: threading.Event,
+        cancel: CancellationToken,
+        lost: threading.Event,
+    ) -> None:
+        # the API deletes a job from the store to cancel it, so check for that
+        # every poll interval and renew the lease every third of its length
+        renew_every = self.queue.lease_seconds / 3
+        renewed = time.monotonic()
+        while not done.wait(min(self.poll_interval, renew_every)):
+            if self.store.get(job_id) is None:
+                cancel.cancel()
+                return
+            if time.monotonic() - renewed >= renew_every:
+                if not self.queue.renew(job_id, self.worker_id):
+                    # the lease ran out and another worker claimed the job;
+                    # stop before both write the same output
+                    lost.set()
+                    cancel.cancel()
+                    return
+                renewed = time.monotonic()
+
+
+def run_worker(poll_interval: float | None = None) -> None:
+    logging.basicConfig(level=logging.INFO)
+    database = job_database_path(settings)
+    queue = JobQueue(
+        database,
+        lease_seconds=settings.queue_lease_seconds,
+        aging_rate=settings.scheduler_aging_rate,
+    )
+    store = SqliteJobStore(database)
+    worker = QueueWorker(store, queue, StorageManager(), poll_interval=poll_interval)
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    worker.warm_up()
+    try:
+        worker.run(stop)
+    finally:
+        queue.close()
+        store.close()
+
+
+def main() -> None:
+    parser = ArgumentParser(
+        prog="commonforms-worker",
+        description="Run CommonForms inference jobs from the API's local job queue",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Number of worker processes to run (default: 1)",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=None,
+        help="Seconds to wait between polls of an empty queue",
+    )
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker(args.poll_interval)
+        return
+
+    # each process loads its own models and claims jobs independently
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(args.poll_interval,))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
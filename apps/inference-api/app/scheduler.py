@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pypdfium2
+from commonforms.document import PDFIUM_LOCK
+from commonforms.utils import select_pages
+
+# area of a US Letter page in PDF points; job cost is measured in these
+LETTER_AREA = 612 * 792
+
+
+@dataclass(slots=True)
+class JobCost:
+    pages: int
+    work_units: float
+
+
+def estimate_cost(pdf_path: Path, pages: str | None = None) -> JobCost:
+    """
+    Estimate the work in a job as its page count and page area in Letter-page
+    units. Only the cross-reference table and page sizes are read, no page
+    content is parsed.
+    """
+    # uploads are costed on their own threads, alongside running jobs
+    with PDFIUM_LOCK:
+        try:
+            document = pypdfium2.PdfDocument(pdf_path)
+        except pypdfium2._helpers.misc.PdfiumError:  # type: ignore[attr-defined]
+            # the processor will reject the file right away; treat it as cheap
+            return JobCost(pages=1, work_units=1.0)
+
+        try:
+            page_indices = select_pages(pages, len(document))
+            area = 0.0
+            for page_ix in page_indices:
+                width, height = document.get_page_size(page_ix)
+                area += width * height
+            return JobCost(pages=len(page_indices), work_units=area / LETTER_AREA)
+        except ValueError:
+            return JobCost(pages=1, work_units=1.0)
+        finally:
+            document.close()
+
+
+@dataclass(order=True, slots=True)
+class _Entry:
+    key: float
+    sequence: int
+    job_id: str = field(compare=False)
+    client_id: str | None = field(compare=False)
+
+
+class JobScheduler:
+    """
+    Shortest-job-first queue with aging and optional per-client fairness.
+
+    A job's priority is its cost minus `aging_rate` cost units for every
+    second it has waited. Because every waiting job ages at the same rate,
+    that ordering equals ordering by `cost + aging_rate * enqueued_at`, a key
+    that never changes, so a plain heap keeps it. With `fair_share`, the next
+    job comes from the client with the fewest running jobs, shortest first
+    within that client, so one client's burst can't take every slot.
+    """
+
+    def __init__(self, *, aging_rate: float = 1.0, fair_share: bool = False) -> None:
+        self.aging_rate = aging_rate
+        self.fair_share = fair_share
+        self._heaps: dict[str | None, list[_Entry]] = defaultdict(list)
+        self._entries: dict[str, _Entry] = {}
+        self._running: dict[str | None, int] = defaultdict(int)
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self._entries
+
+    def push(self, job_id: str, cost: float, client_id: str | None = None) -> None:
+        client = client_id if self.fair_share else None
+        entry = _Entry(
+            key=cost + self.aging_rate * time.monotonic(),
+            sequence=next(self._sequence),
+            job_id=job_id,
+            client_id=client,
+        )
+        self._entries[job_id] = entry
+        heapq.heappush(self._heaps[client], entry)
+
+    def pop(self) -> str | None:
+        """Take the next job to run and count it as running for its client."""
+        heads = {}
+        for client, heap in list(self._heaps.items()):
+            # drop entries removed while they were waiting
+            while heap and self._entries.get(heap[0].job_id) is not heap[0]:
+                heapq.heappop(heap)
+            if heap:
+                heads[client] = heap[0]
+            else:
+                del self._heaps[client]
+        if not heads:
+            return None
+
+        client = min(heads, key=lambda c: (self._running[c], heads[c]))
+        entry = heapq.heappop(self._heaps[client])
+        del self._entries[entry.job_id]
+        self._running[client] += 1
+        return entry.job_id
+
+    def remove(self, job_id: str) -> bool:
+        """Forget a waiting job; returns whether it was waiting."""
+        return self._entries.pop(job_id, None) is not None
+
+    def finished(self, client_id: str | None) -> None:
+        client = client_id if self.fair_share else None
+        self._running[client] = max(0, self._running[client] - 1)
+
+    def clear(self) -> None:
+        self._heaps.clear()
+        self._entries.clear()
+
+
+class ThroughputMeter:
+    """
+    Rolling processing rate, in work units per second of one processing slot,
+    over the last `window` finished jobs. Until a job has finished, the rate
+    is `default_rate`.
+    """
+
+    def __init__(self, *, default_rate: float = 1.0, window: int = 50) -> None:
+        self.default_rate = default_rate
+        self._samples: deque[tuple[float, float]] = deque(maxlen=window)
+
+    @property
+    def rate(self) -> float:
+        seconds = sum(sample[1] for sample in self._samples)
+        if not self._samples or seconds <= 0:
+            return self.default_rate
+        return sum(sample[0] for sample in self._samples) / seconds
+
+    def record(self, work_units: float, seconds: float) -> None:
+        if work_units > 0 and seconds > 0:
+            self._samples.append((work_units, seconds))
@@ -1,6 +1,10 @@
 from __future__ import annotations
 
-from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Literal
+
+from commonforms.utils import PageFields, parse_page_ranges
+from pydantic import BaseModel, Field, field_validator
 
 from .jobs import JobStatus
 
@@ -16,12 +20,58 @@ class JobResponseBase(BaseModel):
     progress: float = Field(
         ..., ge=0.0, le=1.0, description="Fraction of work completed in the range [0,1]."
     )
+    estimated_start_at: datetime | None = Field(
+        None, description="When processing is expected to start (UTC), while the job is pending."
+    )
+    estimated_finish_at: datetime | None = Field(
+        None, description="When the job is expected to finish (UTC), while it is pending."
+    )
 
 
 class JobCreateResponse(JobResponseBase):
     """Response returned when a job is enqueued."""
 
 
+class EscalatedPage(BaseModel):
+    page: int = Field(..., description="Zero-based page index.")
+    reasons: list[str] = Field(
+        ...,
+        description="Why the page went to the large model: 'low_confidence', 'class_overlap', "
+        "'dense' or 'empty'.",
+    )
+
+
+class CascadeSummary(BaseModel):
+    detected_pages: int = Field(..., description="Pages the small model screened.")
+    escalated_pages: int = Field(..., description="Pages also run through the large model.")
+    escalation_rate: float = Field(..., ge=0.0, le=1.0)
+    escalated: list[EscalatedPage]
+
+
+class DedupeSummary(BaseModel):
+    before: int = Field(..., description="Detections returned by the model.")
+    after: int = Field(..., description="Detections left once duplicates were merged.")
+
+
+class MemorySummary(BaseModel):
+    strategy: Literal["full", "batched", "streamed", "reduced"] = Field(
+        ...,
+        description="How the job was fit into the memory budget: all pages at once, smaller "
+        "detector batches, a few pages rendered at a time, or a lower resolution.",
+    )
+    budget_mb: float | None = Field(None, description="Per-job memory budget, if any.")
+    estimated_mb: float = Field(..., description="Estimated peak memory of the chosen strategy.")
+    image_size: int = Field(..., description="Detector input size the job ran at.")
+    batch_size: int | None = Field(None, description="Pages per detector batch (None: all).")
+    render_batch: int | None = Field(
+        None, description="Pages rendered at a time (None: all up front)."
+    )
+    start_rss_mb: float | None = Field(None, description="Process RSS when the job started.")
+    peak_rss_mb: float | None = Field(
+        None, description="Highest process RSS seen while the job ran, once it has finished."
+    )
+
+
 class JobStatusResponse(JobResponseBase):
     message: str | None = Field(None, description="Optional human-readable progress message.")
     error: JobErrorModel | None = Field(None, description="Error metadata when the job fails.")
@@ -29,6 +79,41 @@ class JobStatusResponse(JobResponseBase):
         None,
         description="URL to download the generated PDF when the job is ready.",
     )
+    cascade: CascadeSummary | None = Field(
+        None, description="Escalations of a cascade job, once detection has finished."
+    )
+    dedupe: DedupeSummary | None = Field(
+        None,
+        description="Detection counts around duplicate suppression, once detection has finished.",
+    )
+    memory: MemorySummary | None = Field(
+        None, description="Memory plan and measured peak RSS, once processing has started."
+    )
+    runs: int = Field(1, description="Times the job has been run, counting retries and restarts.")
+    resumed_from: JobStatus | None = Field(
+        None, description="Stage whose saved output this run reused instead of redoing it."
+    )
+
+
+class BatchDocument(JobStatusResponse):
+    filename: str = Field(..., description="Name of the uploaded file or zip member.")
+
+
+class BatchStatusResponse(BaseModel):
+    batch_id: str = Field(..., description="Server-generated batch identifier.")
+    status: Literal["queued", "processing", "completed", "failed"] = Field(
+        ...,
+        description="'completed' once every document has finished and at least one succeeded; "
+        "'failed' if every document failed.",
+    )
+    progress: float = Field(
+        ..., ge=0.0, le=1.0, description="Mean progress of the documents in the batch."
+    )
+    documents: list[BatchDocument] = Field(..., description="Per-document status, in upload order.")
+    download_url: str | None = Field(
+        None,
+        description="URL of a zip of every successfully processed document, once the batch is done.",
+    )
 
 
 class PrepareOptions(BaseModel):
@@ -47,6 +132,40 @@ class PrepareOptions(BaseModel):
         None, ge=0.0, le=1.0, description="Detection confidence threshold."
     )
     image_size: int | None = Field(None, gt=0, description="Image size to use during inference.")
+    pages: str | None = Field(
+        None,
+        description="1-based pages to run detection on, e.g. '1-3,7' (default: all pages).",
+    )
+    prefilter: bool | None = Field(
+        None, description="Skip detection on blank or already-fielded pages."
+    )
+    cascade: bool | None = Field(
+        None,
+        description="Run FFDNet-S on every page and the requested model only on pages where "
+        "the small model's detections are ambiguous.",
+    )
+    dedupe: bool | None = Field(
+        None, description="Merge overlapping duplicate detections of the same field."
+    )
+    output: Literal["pdf", "json"] | None = Field(
+        None,
+        description="'json' returns the detected fields instead of writing a fillable PDF.",
+    )
 
     class Config:
         extra = "forbid"
+
+    @field_validator("pages")
+    @classmethod
+    def _validate_pages(cls, value: str | None) -> str | None:
+        if value is not None:
+            parse_page_ranges(value)
+        return value
+
+
+class FieldsResponse(BaseModel):
+    """Detected fields, returned instead of a PDF for `output: "json"`."""
+
+    pages: list[PageFields] = Field(
+        ..., description="Detected widgets and page geometry for every selected page."
+    )
@@ -21,6 +21,10 @@ class JobPaths:
     def output_path(self) -> Path:
         return self.base_dir / "output.pdf"
 
+    @property
+    def fields_path(self) -> Path:
+        return self.base_dir / "fields.json"
+
     @property
     def metadata_path(self) -> Path:
         return self.base_dir / "metadata.json"
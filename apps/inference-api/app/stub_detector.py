@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Callable
+
+from commonforms.cancellation import CancellationToken
+from commonforms.dedupe import DedupeReport
+from commonforms.utils import BoundingBox, Page, Widget
+
+
+class StubDetector:
+    """
+    Stands in for FFDNetDetector when `detector_backend` is "stub": no model
+    is loaded, every page takes `page_latency` seconds and yields one text
+    box. Load tests use it to measure the API's own overhead (uploads,
+    scheduling, rendering, writing, downloads) apart from inference.
+    """
+
+    def __init__(self, page_latency: float) -> None:
+        self.page_latency = page_latency
+        self.last_cascade = None
+        self.dedupe_policy = None
+        self.last_dedupe = DedupeReport()
+
+    def extract_widgets(
+        self,
+        pages: list[Page],
+        confidence: float = 0.3,
+        image_size: int = 1600,
+        on_page: Callable[[int, int], None] | None = None,
+        cancel: CancellationToken | None = None,
+        batch_size: int | None = None,
+    ) -> dict[int, list[Widget]]:
+        box = BoundingBox(x0=0.1, y0=0.1, x1=0.5, y1=0.15)
+        widgets = {}
+        for position, page in enumerate(pages):
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            time.sleep(self.page_latency)
+            page_ix = page.index if page.index is not None else position
+            widgets[page_ix] = [
+                Widget(widget_type="TextBox", bounding_box=box, page=page_ix, confidence=0.9)
+            ]
+            if on_page is not None:
+                on_page(position + 1, len(pages))
+        return widgets
@@ -1,26 +1,62 @@
 from __future__ import annotations
 
 import asyncio
+import functools
+import io
 import logging
 import os
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
 from pathlib import Path
-from typing import Dict, TypedDict
+from typing import Any, BinaryIO, Literal, TypedDict, TypeVar
 
-import formalpdf
+import numpy as np
 import pypdfium2
 
-from commonforms.exceptions import EncryptedPdfError
+from commonforms.cancellation import CancellationToken
+from commonforms.cascade import CascadeReport
+from commonforms.dedupe import DedupeReport
+from commonforms.document import DocumentSession
+from commonforms.exceptions import (
+    EncryptedPdfError,
+    InvalidPageSelectionError,
+    ProcessingCancelledError,
+)
 from commonforms.form_creator import PyPdfFormCreator
-from commonforms.inference import FFDNetDetector, render_pdf
+from commonforms.inference import FFDNetDetector, page_fields, render_pdf
+from commonforms.prefilter import PageFilter, SkipDecision, filter_pages
+from commonforms.utils import Page, PageSelection, Widget
 
+from .checkpoint import (
+    JobLease,
+    acquire_lease,
+    checkpoint_state,
+    has_detections,
+    interrupted_jobs,
+    job_from_state,
+    load_detections,
+    save_detections,
+)
 from .config import settings
-from .jobs import Job, JobStatus, QueueFullError
-from .schemas import PrepareOptions
+from .events import JobEvents
+from .job_queue import JobQueue
+from .job_store import InMemoryJobStore, JobStore
+from .jobs import TERMINAL_STATUSES, Batch, Job, JobBusyError, JobStatus, QueueFullError
+from .memory import MB, MemoryBudgetError, MemoryPlan, PeakRssMonitor, plan_memory
+from .scheduler import JobCost, JobScheduler, ThroughputMeter, estimate_cost
+from .schemas import FieldsResponse, PrepareOptions
 from .storage import JobPaths, StorageManager
+from .stub_detector import StubDetector
 
 logger = logging.getLogger(__name__)
 
-TERMINAL_STATUSES = {JobStatus.READY, JobStatus.FAILED}
+T = TypeVar("T")
+
+# job metadata written by the DETECTING stage, saved with its detections
+DETECTION_REPORTS = ("prefilter", "cascade", "dedupe", "memory")
 
 
 class MergedOptions(TypedDict):
@@ -33,79 +69,426 @@ class MergedOptions(TypedDict):
     use_signature_fields: bool
     confidence: float
     image_size: int
+    pages: str | None
+    prefilter: bool
+    cascade: bool
+    dedupe: bool
+    output: Literal["pdf", "json"]
 
 
 class JobManager:
-    """In-memory job registry and dispatcher."""
+    """Job registry and dispatcher; job state lives in a pluggable JobStore."""
 
     def __init__(
         self,
         storage: StorageManager,
         *,
+        store: JobStore | None = None,
+        queue: JobQueue | None = None,
         max_concurrent_jobs: int | None = None,
         queue_size: int | None = None,
     ) -> None:
         self.storage = storage
+        self.store = store or InMemoryJobStore()
+        # with a queue, jobs are handed to out-of-process workers
+        # (`commonforms-worker`) instead of running in this process
+        self.queue = queue
         self.max_concurrent_jobs = max(1, (max_concurrent_jobs or settings.max_concurrent_jobs))
         self.queue_size = queue_size or settings.queue_size
-        self.jobs: Dict[str, Job] = {}
-        self.tasks: Dict[str, asyncio.Task[None]] = {}
+        self.tasks: dict[str, asyncio.Task[None]] = {}
+        # running jobs stop at the next page boundary once their token is cancelled
+        self.cancellations: dict[str, CancellationToken] = {}
         self.lock = asyncio.Lock()
-        self.semaphore = asyncio.Semaphore(self.max_concurrent_jobs)
+        # waiting jobs are started shortest-first as running ones finish
+        self.scheduler = JobScheduler(
+            aging_rate=settings.scheduler_aging_rate,
+            fair_share=settings.scheduler_fair_share,
+        )
+        self.pending: dict[str, tuple[Job, JobPaths, PrepareOptions | None, str | None]] = {}
+        # leases on the job directories of waiting and running jobs; other API
+        # processes sharing the storage directory don't resume leased jobs
+        self.leases: dict[str, JobLease] = {}
+        # admission control: work units of every waiting or running job, when
+        # the running ones started, and how fast work has been getting done
+        self.backlog: dict[str, float] = {}
+        self.started: dict[str, float] = {}
+        self.throughput = ThroughputMeter(default_rate=settings.admission_default_pages_per_second)
+        self.events = JobEvents()
         self.processor = JobProcessor(storage)
 
-    async def submit_job(self, job_id: str, paths: JobPaths, options: PrepareOptions | None) -> Job:
+    async def submit_job(
+        self,
+        job_id: str,
+        paths: JobPaths,
+        options: PrepareOptions | None,
+        *,
+        client_id: str | None = None,
+    ) -> Job:
+        (job,) = await self._submit([(job_id, paths)], options, client_id=client_id)
+        return job
+
+    async def submit_batch(
+        self,
+        batch: Batch,
+        paths: list[JobPaths],
+        options: PrepareOptions | None,
+        *,
+        client_id: str | None = None,
+    ) -> list[Job]:
+        """
+        Submit the documents of a batch as one unit: they are admitted (or
+        rejected) together and scheduled by the batch's total cost, so they
+        run back to back on the same warm detectors.
+        """
+        entries = list(zip(batch.documents, paths))
+        return await self._submit(entries, options, client_id=client_id, batch=batch)
+
+    async def retry_job(self, job: Job, options: PrepareOptions | None = None) -> Job:
+        """
+        Run a job again on its stored input, with its original options updated
+        by those set in `options`. Stages whose saved outputs still apply (the
+        detections, when only post-detection options changed) are not redone.
+        """
+        merged = dict(job.metadata.get("options") or {})
+        if options is not None:
+            merged.update(options.model_dump(exclude_none=True))
+        options = PrepareOptions.model_validate(merged) if merged else None
+        paths = self.storage.job_paths(job.job_id)
+        (retried,) = await self._submit(
+            [(job.job_id, paths)], options, client_id=None, previous=job
+        )
+        return retried
+
+    async def resume_interrupted(self) -> list[Job]:
+        """
+        Requeue the jobs that were still queued or running when a previous
+        process stopped, as found in the state saved in their job directories.
+        Jobs whose lease is held by another live process are left to it.
+        """
+        states = await asyncio.to_thread(interrupted_jobs, self.storage.base_dir)
+        resumed = []
+        for state in states:
+            async with self.lock:
+                job = self.store.get(state["job_id"])
+            if job is not None and job.status in TERMINAL_STATUSES:
+                continue
+            try:
+                resumed.append(await self.retry_job(job or job_from_state(state)))
+            except JobBusyError:
+                continue
+            except QueueFullError:
+                logger.warning("Not enough room to resume job %s", state["job_id"])
+                continue
+            logger.info("Resuming job %s interrupted by a restart", state["job_id"])
+        return resumed
+
+    async def _submit(
+        self,
+        entries: list[tuple[str, JobPaths]],
+        options: PrepareOptions | None,
+        *,
+        client_id: str | None,
+        batch: Batch | None = None,
+        previous: Job | None = None,
+    ) -> list[Job]:
+        # the uploads are already on disk; sizing them up only reads the xref
+        # and page sizes, but keep the pdfium calls off the event loop anyway
+        pages = options.pages if options else None
+        costs = await asyncio.to_thread(
+            lambda: [estimate_cost(paths.input_path, pages) for _, paths in entries]
+        )
+        if previous is not None and await asyncio.to_thread(
+            self.processor.has_detections, entries[0][1], options
+        ):
+            # a rerun that reuses the saved detections only writes the output
+            costs = [JobCost(pages=cost.pages, work_units=0.0) for cost in costs]
+        total_units = sum(cost.work_units for cost in costs)
+
         async with self.lock:
-            if self.queue_size and self._active_job_count() >= self.queue_size:
-                raise QueueFullError("Job queue is at capacity.")
+            jobs: list[Job] = []
+            leased: list[str] = []
+            try:
+                if previous is not None:
+                    # the caller checked the job's status before sizing it up
+                    # off the lock; a concurrent retry or rerun may have
+                    # resubmitted it since
+                    current = self.store.get(previous.job_id)
+                    if current is not None and current.updated_at != previous.updated_at:
+                        raise JobBusyError(f"Job {previous.job_id} is already queued or running.")
+                if self.queue is None:
+                    # queue workers hold leases of their own on the durable queue
+                    for job_id, paths in entries:
+                        self._take_lease(job_id, paths)
+                        leased.append(job_id)
+                for (job_id, _), cost in zip(entries, costs):
+                    job = Job(job_id=job_id)
+                    job.metadata["options"] = (
+                        options.model_dump(exclude_none=True) if options else {}
+                    )
+                    job.metadata["cost"] = {
+                        "pages": cost.pages,
+                        "work_units": round(cost.work_units, 3),
+                    }
+                    if batch is not None:
+                        job.metadata["batch_id"] = batch.batch_id
+                    if previous is not None:
+                        # a job run again keeps its identity and batch
+                        job.created_at = previous.created_at
+                        job.metadata["runs"] = previous.metadata.get("runs", 1) + 1
+                        if "batch_id" in previous.metadata:
+                            job.metadata["batch_id"] = previous.metadata["batch_id"]
+                    # raises QueueFullError when queue_size jobs are already in flight
+                    self.store.add(job, max_active=self.queue_size)
+                    jobs.append(job)
+                if self.queue is None:
+                    start, finish = self._admit(total_units)
+                else:
+                    for job in jobs:
+                        self.queue.enqueue(job.job_id, options, cost=total_units)
+                if batch is not None:
+                    self.store.add_batch(batch)
+            except Exception:
+                for job in jobs:
+                    self.store.remove(job.job_id)
+                    if self.queue is not None:
+                        self.queue.remove(job.job_id)
+                for job_id in leased:
+                    self._release_lease(job_id)
+                if previous is not None and jobs:
+                    # put back the job that was to be run again
+                    self.store.add(previous)
+                raise
+
+            for job, (_, paths) in zip(jobs, entries):
+                self._observe(job)
+                # the saved state lets a restarted process pick the job up again
+                checkpoint_state(job, paths)
+            if self.queue is not None:
+                return jobs
 
-            job = Job(job_id=job_id)
-            job.metadata["options"] = options.model_dump(exclude_none=True) if options else {}
-            self.jobs[job_id] = job
-            task = asyncio.create_task(self._run_job(job, paths, options))
+            for job, (_, paths), cost in zip(jobs, entries, costs):
+                job.metadata["estimate"] = {"start_at": start, "finish_at": finish}
+                self.pending[job.job_id] = (job, paths, options, client_id)
+                self.backlog[job.job_id] = cost.work_units
+                self.scheduler.push(job.job_id, total_units, client_id)
+            self._dispatch()
+            return jobs
+
+    def _take_lease(self, job_id: str, paths: JobPaths) -> None:
+        if job_id in self.leases:
+            raise JobBusyError(f"Job {job_id} is already queued or running.")
+        lease = acquire_lease(paths)
+        if lease is None:
+            raise JobBusyError(f"Job {job_id} is queued or running in another process.")
+        self.leases[job_id] = lease
+
+    def _release_lease(self, job_id: str) -> None:
+        lease = self.leases.pop(job_id, None)
+        if lease is not None:
+            lease.release()
+
+    def _admit(self, work_units: float) -> tuple[datetime, datetime]:
+        """
+        Estimate when a job of `work_units` would start and finish, raising
+        QueueFullError (with a Retry-After) if it would finish later than
+        `admission_max_seconds` from now behind the work already queued.
+        """
+        rate = self.throughput.rate
+        now = time.monotonic()
+        # what is left of the running jobs, plus the waiting jobs that
+        # shortest-first would run before this one
+        running = sum(
+            max(0.0, self.backlog[job_id] - (now - started) * rate)
+            for job_id, started in self.started.items()
+        )
+        waiting = sum(
+            units
+            for job_id, units in self.backlog.items()
+            if job_id not in self.started and units <= work_units
+        )
+        if len(self.started) < self.max_concurrent_jobs and not self.pending:
+            start_in = 0.0
+        else:
+            start_in = (running + waiting) / (rate * self.max_concurrent_jobs)
+        finish_in = start_in + work_units / rate
+
+        if self.backlog and finish_in > settings.admission_max_seconds:
+            raise QueueFullError(
+                "Too much work is queued; try again later.",
+                retry_after=finish_in - settings.admission_max_seconds,
+            )
+        submitted = _utcnow()
+        return (
+            submitted + timedelta(seconds=start_in),
+            submitted + timedelta(seconds=finish_in),
+        )
+
+    def _observe(self, job: Job) -> None:
+        """Publish every state change of `job` after the store has saved it."""
+        persist = job.on_change
+
+        def on_change(changed: Job) -> None:
+            if persist is not None:
+                persist(changed)
+            self.events.publish(changed)
+
+        job.on_change = on_change
+
+    def _dispatch(self) -> None:
+        """Start waiting jobs while there are free processing slots."""
+        while len(self.tasks) < self.max_concurrent_jobs:
+            job_id = self.scheduler.pop()
+            if job_id is None:
+                return
+            job, paths, options, client_id = self.pending.pop(job_id)
+            self.started[job_id] = time.monotonic()
+            started_at = _utcnow()
+            seconds = self.backlog.get(job_id, 0.0) / self.throughput.rate
+            job.metadata["estimate"] = {
+                "start_at": started_at,
+                "finish_at": started_at + timedelta(seconds=seconds),
+            }
+            cancel = self.cancellations[job_id] = CancellationToken()
+            task = asyncio.create_task(self._run_job(job, paths, options, cancel))
             self.tasks[job_id] = task
-            task.add_done_callback(lambda _: self.tasks.pop(job_id, None))
-            return job
+            task.add_done_callback(
+                lambda _, job=job, client_id=client_id: self._finished(job, client_id)
+            )
 
-    async def _run_job(self, job: Job, paths: JobPaths, options: PrepareOptions | None) -> None:
+    def _finished(self, job: Job, client_id: str | None) -> None:
+        self.tasks.pop(job.job_id, None)
+        self.cancellations.pop(job.job_id, None)
+        self._release_lease(job.job_id)
+        work_units = self.backlog.pop(job.job_id, 0.0)
+        started = self.started.pop(job.job_id, None)
+        # failed jobs usually stop early, so only finished ones say how fast
+        # work gets done
+        if started is not None and job.status is JobStatus.READY:
+            self.throughput.record(work_units, time.monotonic() - started)
+        self.scheduler.finished(client_id)
+        self._dispatch()
+
+    async def _run_job(
+        self,
+        job: Job,
+        paths: JobPaths,
+        options: PrepareOptions | None,
+        cancel: CancellationToken,
+    ) -> None:
+        watcher = None
+        if self.store.shared:
+            watcher = asyncio.create_task(self._watch_removal(job.job_id, cancel))
         try:
-            async with self.semaphore:
-                await self.processor.process(job, paths, options)
+            await self.processor.process(job, paths, options, cancel=cancel)
+        except ProcessingCancelledError:
+            job.mark_failed("Cancelled", "Job was cancelled.")
+            logger.info("Job %s cancelled", job.job_id)
         except Exception as exc:  # noqa: BLE001
             if job.status is not JobStatus.FAILED:
                 job.mark_failed(type(exc).__name__, str(exc))
             logger.exception("Job %s failed", job.job_id)
         finally:
-            self._touch(paths.base_dir)
+            if watcher is not None:
+                watcher.cancel()
+            # a job removed while it ran (by a process sharing the store, or
+            # after cancel_timeout_seconds) keeps no files
+            if self.store.get(job.job_id) is not None:
+                checkpoint_state(job, paths)
+                self._touch(paths.base_dir)
+
+    async def _watch_removal(self, job_id: str, cancel: CancellationToken) -> None:
+        """
+        Cancel a running job once it is gone from the store. Another API
+        process sharing the store deletes the job there (and its files)
+        without reaching this process's processing thread, which then stops
+        at its next page boundary, as queue workers do.
+        """
+        while True:
+            await asyncio.sleep(settings.queue_poll_interval_seconds)
+            if self.store.get(job_id) is None:
+                logger.info("Job %s was removed by another process; stopping it", job_id)
+                cancel.cancel()
+                return
 
-    def _active_job_count(self) -> int:
-        return sum(1 for job in self.jobs.values() if job.status not in TERMINAL_STATUSES)
+    async def prepare_inline(self, data: bytes, options: PrepareOptions | None) -> bytes | None:
+        """Process a small upload in memory; None means it should become a job."""
+        return await self.processor.run_inline(self.processor.prepare_bytes, data, options)
 
     async def get_job(self, job_id: str) -> Job | None:
         async with self.lock:
-            return self.jobs.get(job_id)
+            return self.store.get(job_id)
 
     async def list_jobs(self) -> list[Job]:
         async with self.lock:
-            return list(self.jobs.values())
+            return self.store.list_jobs()
+
+    async def expired_jobs(self, cutoff: datetime) -> list[str]:
+        async with self.lock:
+            return self.store.expired(cutoff)
+
+    async def get_batch(self, batch_id: str) -> tuple[Batch, list[Job]] | None:
+        """A batch and those of its jobs that still exist, in upload order."""
+        async with self.lock:
+            batch = self.store.get_batch(batch_id)
+            if batch is None:
+                return None
+            jobs = [self.store.get(job_id) for job_id in batch.documents]
+        return batch, [job for job in jobs if job is not None]
 
     async def remove_job(self, job_id: str) -> None:
+        """
+        Remove a job, first stopping it if it is running. A running job is
+        cancelled and given `cancel_timeout_seconds` to stop at its next page
+        boundary, so its thread is done with the job's files before they are
+        deleted.
+        """
         async with self.lock:
-            self.jobs.pop(job_id, None)
-            task = self.tasks.pop(job_id, None)
-            if task:
-                task.cancel()
+            if self.scheduler.remove(job_id):
+                self.pending.pop(job_id, None)
+                self.backlog.pop(job_id, None)
+                self._release_lease(job_id)
+            task = self.tasks.get(job_id)
+            cancel = self.cancellations.get(job_id)
+        if task is not None and cancel is not None:
+            cancel.cancel()
+            await asyncio.wait({task}, timeout=settings.cancel_timeout_seconds)
+
+        async with self.lock:
+            job = self.store.get(job_id)
+            self.store.remove(job_id)
+            batch_id = job.metadata.get("batch_id") if job else None
+            if batch_id is not None:
+                batch = self.store.get_batch(batch_id)
+                # a batch goes away with the last of its jobs
+                if batch and not any(self.store.get(member) for member in batch.documents):
+                    self.store.remove_batch(batch_id)
+            # a job claimed by a queue worker is stopped by the worker itself
+            # once it sees the job is gone
+            if self.queue is not None:
+                self.queue.remove(job_id)
 
     async def shutdown(self) -> None:
         async with self.lock:
+            self.scheduler.clear()
+            self.pending.clear()
+            self.backlog.clear()
             tasks = list(self.tasks.values())
-        for task in tasks:
-            task.cancel()
-        for task in tasks:
-            try:
-                await task
-            except asyncio.CancelledError:
-                continue
+            cancellations = list(self.cancellations.values())
+        # processing threads can't be interrupted, only asked to stop
+        for cancel in cancellations:
+            cancel.cancel()
+        if tasks:
+            _, still_running = await asyncio.wait(tasks, timeout=settings.cancel_timeout_seconds)
+            for task in still_running:
+                task.cancel()
+            for task in still_running:
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    continue
+        # jobs left waiting are resumed by whichever process starts next
+        for job_id in list(self.leases):
+            self._release_lease(job_id)
 
     def _touch(self, path: Path) -> None:
         try:
@@ -119,61 +502,454 @@ class JobManager:
 class JobProcessor:
     """Performs synchronous PDF processing inside background threads."""
 
-    def __init__(self, storage: StorageManager) -> None:
+    def __init__(
+        self,
+        storage: StorageManager,
+        *,
+        threads: int | None = None,
+        inline_threads: int | None = None,
+    ) -> None:
         self.storage = storage
+        # loaded detectors are kept per processing thread (ultralytics models
+        # aren't safe to share between threads), so weights load once per
+        # thread instead of once per job; a fixed pool keeps those threads,
+        # and the detectors warmed up on them, around
+        self._local = threading.local()
+        self.threads = max(1, threads or settings.max_concurrent_jobs)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.threads, thread_name_prefix="commonforms-processor"
+        )
+        # small documents processed inside a request have threads (and
+        # detectors) of their own, so they never wait behind running jobs
+        self.inline_threads = max(1, inline_threads or settings.inline_threads)
+        self.inline_executor = ThreadPoolExecutor(
+            max_workers=self.inline_threads, thread_name_prefix="commonforms-inline"
+        )
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """Run `func` on one of the processing threads."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def run_inline(self, func: Callable[..., T], *args: Any) -> T:
+        """Run `func` on one of the threads kept for requests answered inline."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.inline_executor, functools.partial(func, *args))
 
     async def process(
         self,
         job: Job,
         paths: JobPaths,
         options: PrepareOptions | None,
+        *,
+        cancel: CancellationToken | None = None,
+    ) -> None:
+        await self.run(self.process_sync, job, paths, options, cancel)
+
+    async def warm_up(
+        self, model_or_path: str, *, device: str | int, fast: bool, cascade: bool = False
     ) -> None:
-        await asyncio.to_thread(self._process_sync, job, paths, options)
+        """Load and warm up the detector on every processing and inline thread."""
+        futures = []
+        for executor, threads in (
+            (self.executor, self.threads),
+            (self.inline_executor, self.inline_threads),
+        ):
+            barrier = threading.Barrier(threads)
+
+            def warm_thread(barrier: threading.Barrier = barrier) -> None:
+                try:
+                    self.warm_detector(model_or_path, device=device, fast=fast, cascade=cascade)
+                except BaseException:
+                    barrier.abort()
+                    raise
+                # hold this thread until all of the pool's are warm, so every
+                # task is picked up by a different thread of the pool
+                barrier.wait()
+
+            futures += [executor.submit(warm_thread) for _ in range(threads)]
+        await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
 
-    def _process_sync(
+    def warm_detector(
+        self, model_or_path: str, *, device: str | int, fast: bool, cascade: bool = False
+    ) -> None:
+        """
+        Load the detector for the current thread and run it once on a blank
+        Letter page, so the first real page doesn't pay for lazy setup (in
+        cascade mode the blank page is escalated, which warms both models).
+        """
+        detector = self.get_detector(
+            model_or_path, device=device, fast=fast, cascade=cascade, dedupe=settings.dedupe
+        )
+        blank = np.full((1100, 850, 3), 255, dtype=np.uint8)
+        detector.extract_widgets(
+            [Page(image=blank, width=612, height=792)], image_size=settings.image_size
+        )
+
+    def process_sync(
         self,
         job: Job,
         paths: JobPaths,
         options: PrepareOptions | None,
+        cancel: CancellationToken | None = None,
     ) -> None:
+        """Run a job on the calling thread (queue workers call this directly)."""
         self._touch(paths.base_dir)
         merged_options = self._merge_options(options)
 
         job.mark_stage(JobStatus.VALIDATING, "Validating input PDF")
         self._touch(paths.base_dir)
-        self._validate_pdf(paths.input_path)
-        job.complete_stage(JobStatus.VALIDATING)
+        output_path = paths.fields_path if merged_options["output"] == "json" else paths.output_path
+        monitor = PeakRssMonitor()
+        try:
+            with monitor:
+                document = self._open_document(paths.input_path)
+                try:
+                    self._check_pages(job, document, merged_options["pages"])
+                    job.complete_stage(JobStatus.VALIDATING)
+                    self._process_document(
+                        job,
+                        document,
+                        merged_options,
+                        output_path,
+                        job_dir=paths.base_dir,
+                        cancel=cancel,
+                    )
+                finally:
+                    document.close()
+        finally:
+            # next to the memory plan, once detection has made one
+            memory = job.metadata.get("memory")
+            if memory is not None:
+                memory["start_rss_mb"] = round(monitor.start_bytes / MB, 1)
+                memory["peak_rss_mb"] = round(monitor.peak_bytes / MB, 1)
 
-        job.mark_stage(JobStatus.RENDERING, "Rendering PDF pages")
+        if merged_options["output"] == "json":
+            job.mark_ready(output_path, "Detected fields ready for download")
+        else:
+            job.complete_stage(JobStatus.WRITING)
+            job.mark_ready(output_path, "PDF ready for download")
         self._touch(paths.base_dir)
+
+    def prepare_bytes(self, data: bytes, options: PrepareOptions | None) -> bytes | None:
+        """
+        Run the whole pipeline on an in-memory PDF and return the fillable PDF
+        (or the detected fields as JSON), or None if more than
+        `sync_max_pages` pages are selected for detection.
+        """
+        merged_options = self._merge_options(options)
+        with DocumentSession(data) as document:
+            if len(document.page_indices(merged_options["pages"])) > settings.sync_max_pages:
+                return None
+            # anything short of the plain path runs as a job, where it is
+            # degraded (or rejected) visibly
+            try:
+                if self._plan_memory(document, merged_options).strategy != "full":
+                    return None
+            except MemoryBudgetError:
+                return None
+            # progress of an inline request isn't reported anywhere
+            job = Job(job_id="inline")
+            output = io.BytesIO()
+            self._process_document(job, document, merged_options, output)
+        return output.getvalue()
+
+    def _process_document(
+        self,
+        job: Job,
+        document: DocumentSession,
+        merged_options: MergedOptions,
+        output: Path | BinaryIO,
+        *,
+        job_dir: Path | None = None,
+        cancel: CancellationToken | None = None,
+    ) -> None:
+        # jobs checkpoint their detections in the job directory, and a run
+        # with the same detection options (a retry, a restart, or a rerun
+        # with only post-detection options changed) reuses them
+        paths = JobPaths(job_id=job.job_id, base_dir=job_dir) if job_dir else None
+        widgets = self._resume_detections(job, document, merged_options, paths) if paths else None
+        if widgets is None:
+            widgets = self._detect_document(
+                job, document, merged_options, job_dir=job_dir, cancel=cancel
+            )
+            if paths is not None:
+                geometry = {
+                    page_ix: document.page_geometry(page_ix)
+                    for page_ix in document.page_indices(merged_options["pages"])
+                }
+                reports = {
+                    report: job.metadata[report]
+                    for report in DETECTION_REPORTS
+                    if report in job.metadata
+                }
+                save_detections(
+                    job,
+                    paths,
+                    widgets,
+                    geometry,
+                    self._detection_key(merged_options),
+                    reports,
+                    min_confidence=self._detection_confidence(merged_options),
+                )
+        widgets = filter_confidence(widgets, merged_options["confidence"])
+        if merged_options["output"] == "json":
+            # detection-only jobs skip the WRITING stage entirely
+            fields = page_fields(document, widgets, merged_options["pages"])
+            payload = FieldsResponse(pages=fields).model_dump_json().encode()
+            if isinstance(output, Path):
+                output.write_bytes(payload)
+            else:
+                output.write(payload)
+            return
+        self._write_document(
+            job, document, widgets, merged_options, output, job_dir=job_dir, cancel=cancel
+        )
+
+    def _resume_detections(
+        self,
+        job: Job,
+        document: DocumentSession,
+        merged_options: MergedOptions,
+        paths: JobPaths,
+    ) -> dict[int, list[Widget]] | None:
+        restored = load_detections(
+            paths, self._detection_key(merged_options), merged_options["confidence"]
+        )
+        if restored is None:
+            return None
+        widgets, geometry, reports = restored
+        if sorted(geometry) != document.page_indices(merged_options["pages"]):
+            return None
+
+        job.metadata.update(reports)
+        job.metadata["resumed_from"] = JobStatus.DETECTING.value
+        job.mark_stage(JobStatus.DETECTING, "Reusing detections saved by an earlier run")
+        job.complete_stage(JobStatus.DETECTING)
+        logger.info("Job %s resumed from its saved detections", job.job_id)
+        return widgets
+
+    def has_detections(self, paths: JobPaths, options: PrepareOptions | None) -> bool:
+        """Whether a run of the job with `options` would reuse its saved detections."""
+        merged_options = self._merge_options(options)
+        return has_detections(
+            paths, self._detection_key(merged_options), merged_options["confidence"]
+        )
+
+    def _detection_key(self, merged_options: MergedOptions) -> dict[str, Any]:
+        """
+        The options (and settings) that saved detections must have been made
+        with. The confidence threshold is applied after detection, except in
+        cascade mode, where it also decides which pages are escalated.
+        """
+        return {
+            "model_or_path": merged_options["model_or_path"],
+            "fast": merged_options["fast"],
+            "confidence": merged_options["confidence"] if merged_options["cascade"] else None,
+            "image_size": merged_options["image_size"],
+            "pages": merged_options["pages"],
+            "prefilter": merged_options["prefilter"],
+            # only the prefilter looks at existing fields before writing
+            "keep_existing_fields": merged_options["prefilter"]
+            and merged_options["keep_existing_fields"],
+            "cascade": merged_options["cascade"],
+            "dedupe": merged_options["dedupe"],
+            "grayscale": settings.render_grayscale,
+            "prefilter_blank_variance": settings.prefilter_blank_variance,
+            "prefilter_skip_image_only": settings.prefilter_skip_image_only,
+        }
+
+    def _detection_confidence(self, merged_options: MergedOptions) -> float:
+        """
+        The threshold the detector runs at: down to `rerun_confidence_floor`,
+        so a rerun with a lower confidence can reuse the detections, with the
+        requested threshold applied afterwards.
+        """
+        floor = settings.rerun_confidence_floor
+        if merged_options["cascade"] or floor is None:
+            return merged_options["confidence"]
+        return min(floor, merged_options["confidence"])
+
+    def _detect_document(
+        self,
+        job: Job,
+        document: DocumentSession,
+        merged_options: MergedOptions,
+        *,
+        job_dir: Path | None = None,
+        cancel: CancellationToken | None = None,
+    ) -> dict[int, list[Widget]]:
+        # sized up from the page sizes alone, before anything is rendered;
+        # raises MemoryBudgetError if the job can't fit at all
+        plan = self._plan_memory(document, merged_options)
+        job.metadata["memory"] = {
+            "strategy": plan.strategy,
+            "budget_mb": None if plan.budget_bytes is None else round(plan.budget_bytes / MB, 1),
+            "estimated_mb": round(plan.estimated_bytes / MB, 1),
+            "image_size": plan.image_size,
+            "batch_size": plan.batch_size,
+            "render_batch": plan.render_batch,
+        }
+        if plan.strategy != "full":
+            logger.info(
+                "Job %s exceeds the memory budget as a whole; running it %s (%s)",
+                job.job_id,
+                plan.strategy,
+                job.metadata["memory"],
+            )
+
+        # streamed jobs render and detect a few pages at a time, so only
+        # those pages' bitmaps are ever held
+        selected = document.page_indices(merged_options["pages"])
+        if plan.render_batch is None:
+            chunks: list[PageSelection | None] = [merged_options["pages"]]
+        else:
+            chunks = [
+                set(selected[start : start + plan.render_batch]).__contains__
+                for start in range(0, len(selected), plan.render_batch)
+            ]
+
+        detector = self.get_detector(
+            merged_options["model_or_path"],
+            device=merged_options["device"],
+            fast=merged_options["fast"],
+            cascade=merged_options["cascade"],
+            dedupe=merged_options["dedupe"],
+        )
+        widgets: dict[int, list[Widget]] = {}
+        skipped: list[SkipDecision] = []
+        detected_pages = 0
+        filter_seconds = detect_seconds = 0.0
+        cascade: CascadeReport | None = None
+        dedupe = DedupeReport()
+        done_pages = 0
+
+        job.mark_stage(JobStatus.RENDERING, "Rendering PDF pages")
+        self._touch(job_dir)
+        for chunk_ix, chunk in enumerate(chunks):
+            pages = self._render_pages(job, document, chunk, cancel)
+            if chunk_ix == 0:
+                job.complete_stage(JobStatus.RENDERING)
+                job.mark_stage(JobStatus.DETECTING, "Running field detection")
+                self._touch(job_dir)
+            rendered = len(pages)
+
+            if merged_options["prefilter"]:
+                started = time.perf_counter()
+                filtered = filter_pages(
+                    document,
+                    pages,
+                    keep_existing_fields=merged_options["keep_existing_fields"],
+                    page_filter=PageFilter(
+                        blank_variance=settings.prefilter_blank_variance,
+                        skip_image_only=settings.prefilter_skip_image_only,
+                    ),
+                )
+                filter_seconds += time.perf_counter() - started
+                pages = filtered.pages
+                skipped += filtered.skipped
+
+            def on_page(done: int, total: int, offset: int = done_pages) -> None:
+                # progress counts this chunk's pages on top of the earlier
+                # chunks' (prefiltered pages included)
+                done += offset
+                job.advance_stage(
+                    JobStatus.DETECTING,
+                    done / len(selected),
+                    f"Detected fields on page {done} of {len(selected)}",
+                )
+
+            started = time.perf_counter()
+            widgets.update(
+                detector.extract_widgets(
+                    pages,
+                    confidence=self._detection_confidence(merged_options),
+                    image_size=plan.image_size,
+                    on_page=on_page,
+                    cancel=cancel,
+                    batch_size=plan.batch_size,
+                )
+            )
+            detect_seconds += time.perf_counter() - started
+            detected_pages += len(pages)
+            done_pages += rendered
+            del pages, rendered
+
+            dedupe += detector.last_dedupe
+            if detector.last_cascade is not None:
+                cascade = cascade or CascadeReport()
+                cascade.pages += detector.last_cascade.pages
+                cascade.escalated += detector.last_cascade.escalated
+
+        if merged_options["prefilter"]:
+            job.metadata["prefilter"] = self._prefilter_report(
+                skipped, detected_pages, filter_seconds, detect_seconds
+            )
+        if cascade is not None:
+            job.metadata["cascade"] = self._cascade_report(cascade)
+        if detector.dedupe_policy is not None:
+            job.metadata["dedupe"] = {"before": dedupe.before, "after": dedupe.after}
+        job.complete_stage(JobStatus.DETECTING)
+        return widgets
+
+    def _render_pages(
+        self,
+        job: Job,
+        document: DocumentSession,
+        pages: PageSelection | None,
+        cancel: CancellationToken | None,
+    ) -> list[Page]:
         try:
-            pages = render_pdf(str(paths.input_path))
+            return render_pdf(
+                document,
+                pages=pages,
+                as_array=True,
+                grayscale=settings.render_grayscale,
+                cancel=cancel,
+            )
         except EncryptedPdfError as exc:
             job.mark_failed("EncryptedPdfError", str(exc) or "Encrypted PDF detected.")
             raise
         except pypdfium2._helpers.misc.PdfiumError as exc:  # type: ignore[attr-defined]
             job.mark_failed("PdfiumError", str(exc))
             raise
-        else:
-            job.complete_stage(JobStatus.RENDERING)
 
-        job.mark_stage(JobStatus.DETECTING, "Running field detection")
-        self._touch(paths.base_dir)
-        detector = FFDNetDetector(
-            merged_options["model_or_path"],
-            device=merged_options["device"],
-            fast=merged_options["fast"],
-        )
-        widgets = detector.extract_widgets(
-            pages,
-            confidence=merged_options["confidence"],
+    def _check_pages(self, job: Job, document: DocumentSession, pages: str | None) -> None:
+        try:
+            document.page_indices(pages)
+        except InvalidPageSelectionError as exc:
+            job.mark_failed("InvalidPageSelectionError", str(exc))
+            raise
+
+    def _plan_memory(self, document: DocumentSession, merged_options: MergedOptions) -> MemoryPlan:
+        page_sizes = []
+        for page_ix in document.page_indices(merged_options["pages"]):
+            geometry = document.page_geometry(page_ix)
+            page_sizes.append((geometry.width, geometry.height))
+        budget = settings.memory_budget_mb
+        return plan_memory(
+            page_sizes,
             image_size=merged_options["image_size"],
+            fast=merged_options["fast"],
+            grayscale=settings.render_grayscale,
+            budget_bytes=None if budget is None else int(budget * MB),
+            min_image_size=min(settings.memory_min_image_size, merged_options["image_size"]),
         )
-        job.complete_stage(JobStatus.DETECTING)
 
+    def _write_document(
+        self,
+        job: Job,
+        document: DocumentSession,
+        widgets: dict[int, list[Widget]],
+        merged_options: MergedOptions,
+        output: Path | BinaryIO,
+        *,
+        job_dir: Path | None = None,
+        cancel: CancellationToken | None = None,
+    ) -> None:
         job.mark_stage(JobStatus.WRITING, "Writing fillable PDF")
-        self._touch(paths.base_dir)
-        writer = PyPdfFormCreator(str(paths.input_path))
+        self._touch(job_dir)
+        writer = PyPdfFormCreator(document)
         try:
             if not merged_options["keep_existing_fields"]:
                 writer.clear_existing_fields()
@@ -182,6 +958,8 @@ class JobProcessor:
             processed_widgets = 0
 
             for page_ix, page_widgets in widgets.items():
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
                 for i, widget in enumerate(page_widgets):
                     name = f"{widget.widget_type.lower()}_{widget.page}_{i}"
                     if widget.widget_type == "TextBox":
@@ -194,31 +972,78 @@ class JobProcessor:
                         else:
                             writer.add_text_box(name, page_ix, widget.bounding_box)
 
-                    processed_widgets += 1
-                    if total_widgets > 0:
-                        fraction = processed_widgets / total_widgets
-                        job.advance_stage(JobStatus.WRITING, fraction)
+                # every progress update is a store write and an event, so
+                # report once per page rather than once per widget
+                processed_widgets += len(page_widgets)
+                if total_widgets > 0:
+                    fraction = processed_widgets / total_widgets
+                    job.advance_stage(JobStatus.WRITING, fraction)
 
-            writer.save(str(paths.output_path))
+            writer.save(output)
         finally:
             writer.close()
 
-        job.complete_stage(JobStatus.WRITING)
-        job.mark_ready(paths.output_path, "PDF ready for download")
-        self._touch(paths.base_dir)
+    def get_detector(
+        self,
+        model_or_path: str,
+        *,
+        device: str | int,
+        fast: bool,
+        cascade: bool = False,
+        dedupe: bool = True,
+    ) -> FFDNetDetector | StubDetector:
+        detectors = getattr(self._local, "detectors", None)
+        if detectors is None:
+            detectors = self._local.detectors = {}
+        key = (model_or_path, device, fast, cascade, dedupe)
+        if key not in detectors and settings.detector_backend == "stub":
+            detectors[key] = StubDetector(settings.stub_page_latency_ms / 1000)
+        elif key not in detectors:
+            detectors[key] = FFDNetDetector(
+                model_or_path, device=device, fast=fast, cascade=cascade, dedupe=dedupe
+            )
+        return detectors[key]
 
-    def _validate_pdf(self, pdf_path: Path) -> None:
+    def _prefilter_report(
+        self,
+        skipped: list[SkipDecision],
+        detected_pages: int,
+        filter_seconds: float,
+        detect_seconds: float,
+    ) -> dict:
+        # the time saved is estimated from this job's own per-page detection
+        # cost; it's unknown when every page was skipped
+        seconds_saved = None
+        if detected_pages:
+            seconds_saved = round(detect_seconds / detected_pages * len(skipped), 3)
+        return {
+            "skipped": [{"page": skip.page, "reason": skip.reason} for skip in skipped],
+            "skipped_pages": len(skipped),
+            "detected_pages": detected_pages,
+            "filter_seconds": round(filter_seconds, 3),
+            "estimated_seconds_saved": seconds_saved,
+        }
+
+    def _cascade_report(self, report: CascadeReport) -> dict:
+        return {
+            "detected_pages": report.pages,
+            "escalated_pages": len(report.escalated),
+            "escalation_rate": round(report.escalation_rate, 3),
+            "escalated": [
+                {"page": decision.page, "reasons": decision.reasons}
+                for decision in report.escalated
+            ],
+        }
+
+    def _open_document(self, pdf_path: Path) -> DocumentSession:
         if not pdf_path.exists():
             raise FileNotFoundError(f"Uploaded PDF not found: {pdf_path}")
         if pdf_path.stat().st_size == 0:
             raise ValueError("Uploaded PDF is empty.")
 
-        try:
-            doc = formalpdf.open(pdf_path)
-        except pypdfium2._helpers.misc.PdfiumError as exc:  # type: ignore[attr-defined]
-            raise EncryptedPdfError from exc
-        else:
-            doc.document.close()
+        # the session is the single parse of the input shared by rendering and
+        # writing; it raises EncryptedPdfError if pdfium can't open the file
+        return DocumentSession(pdf_path)
 
     def _merge_options(self, options: PrepareOptions | None) -> MergedOptions:
         merged: MergedOptions = {
@@ -229,16 +1054,43 @@ class JobProcessor:
             "use_signature_fields": settings.use_signature_fields,
             "confidence": settings.confidence,
             "image_size": settings.image_size,
+            "pages": None,
+            "prefilter": settings.prefilter,
+            "cascade": settings.cascade,
+            "dedupe": settings.dedupe,
+            "output": "pdf",
         }
         if options:
             for key, value in options.model_dump(exclude_none=True).items():
                 merged[key] = value  # type: ignore[literal-required]
         return merged
 
-    def _touch(self, path: Path) -> None:
+    def _touch(self, path: Path | None) -> None:
+        if path is None:
+            return
         try:
             os.utime(path, None)
         except FileNotFoundError:
             path.mkdir(parents=True, exist_ok=True)
         except PermissionError:
             logger.warning("Unable to update mtime for %s", path)
+
+
+def filter_confidence(
+    widgets: dict[int, list[Widget]], confidence: float
+) -> dict[int, list[Widget]]:
+    """The widgets detected with at least `confidence`, in their reading order."""
+    kept = {
+        page_ix: [
+            widget
+            for widget in page_widgets
+            if widget.confidence is None or widget.confidence >= confidence
+        ]
+        for page_ix, page_widgets in widgets.items()
+    }
+    return {page_ix: page_widgets for page_ix, page_widgets in kept.items() if page_widgets}
+
+
+def _utcnow() -> datetime:
+    """The current time as naive UTC, like the Job timestamps."""
+    return datetime.now(UTC).replace(tzinfo=None)
@@ -1,12 +1,20 @@
 from __future__ import annotations
 
 import asyncio
+import io
+import json
+import sqlite3
 import sys
+import threading
 import time
+import zipfile
+from datetime import UTC, datetime
 from pathlib import Path
 
+import httpx
 import pytest
 from fastapi.testclient import TestClient
+from pypdf import PdfReader
 
 REPO_ROOT = Path(__file__).resolve().parents[3]
 APP_PACKAGE_ROOT = REPO_ROOT / "apps" / "inference-api"
@@ -16,8 +24,23 @@ for path in (APP_PACKAGE_ROOT, CORE_PACKAGE_ROOT):
     sys.path.insert(0, str(path))
 
 from app import main  # noqa: E402
-from app.jobs import JobStatus  # noqa: E402
+from app.api import _event_stream
+from app.batches import result_files
+from app.checkpoint import save_detections, save_state
+from app.job_queue import JobQueue
+from app.job_store import InMemoryJobStore, SqliteJobStore
+from app.jobs import Batch, Job, JobStatus, QueueFullError  # noqa: E402
+from app.loadtest import LoadReport, percentile, run_load
+from app.memory import MB, MemoryBudgetError, plan_memory
+from app.queue_worker import QueueWorker
+from app.scheduler import JobScheduler, ThroughputMeter, estimate_cost
+from app.schemas import PrepareOptions
+from app.worker import JobManager, JobProcessor
+from commonforms.cascade import CascadeReport, EscalationDecision
+from commonforms.dedupe import DedupePolicy, DedupeReport
+from commonforms.document import DocumentSession
 from commonforms.exceptions import EncryptedPdfError  # noqa: E402
+from commonforms.utils import BoundingBox, Widget
 
 RESOURCES = CORE_PACKAGE_ROOT / "tests" / "resources"
 
@@ -25,8 +48,8 @@ RESOURCES = CORE_PACKAGE_ROOT / "tests" / "resources"
 @pytest.fixture(autouse=True)
 def isolate_settings(tmp_path, monkeypatch):
     asyncio.run(main.job_manager.shutdown())
-    main.job_manager.jobs.clear()
     main.job_manager.tasks.clear()
+    monkeypatch.setattr(main.job_manager, "store", InMemoryJobStore())
 
     monkeypatch.setattr(main.storage, "base_dir", tmp_path, raising=False)
     tmp_path.mkdir(parents=True, exist_ok=True)
@@ -43,19 +66,19 @@ def client():
         yield fastapi_client
 
 
-def _stub_success(self, job, paths, options):
+def _stub_success(self, job, paths, options, cancel=None):
     job.mark_stage(JobStatus.VALIDATING, "Validating input PDF")
     output = paths.output_path
     output.write_bytes(b"%PDF-1.4\n% Fake document for testing\n")
     job.mark_ready(output, "PDF ready")
 
 
-def _stub_failure(self, job, paths, options):
+def _stub_failure(self, job, paths, options, cancel=None):
     job.mark_stage(JobStatus.VALIDATING, "Validating input PDF")
     raise EncryptedPdfError("encrypted")
 
 
-def _stub_slow(self, job, paths, options):
+def _stub_slow(self, job, paths, options, cancel=None):
     job.mark_stage(JobStatus.VALIDATING, "Validating input PDF")
     time.sleep(0.2)
     output = paths.output_path
@@ -65,8 +88,8 @@ def _stub_slow(self, job, paths, options):
 
 def test_create_job_success(monkeypatch, client):
     monkeypatch.setattr(
-        main.job_manager.processor,
-        "_process_sync",
+        type(main.job_manager.processor),
+        "process_sync",
         _stub_success,
         raising=False,
     )
@@ -108,8 +131,8 @@ def test_non_pdf_rejected(client):
 
 def test_encrypted_pdf_marks_failure(monkeypatch, client):
     monkeypatch.setattr(
-        main.job_manager.processor,
-        "_process_sync",
+        type(main.job_manager.processor),
+        "process_sync",
         _stub_failure,
         raising=False,
     )
@@ -135,7 +158,7 @@ def test_encrypted_pdf_marks_failure(monkeypatch, client):
 
 def test_queue_capacity(monkeypatch, client):
     original_queue_size = main.job_manager.queue_size
-    monkeypatch.setattr(main.job_manager.processor, "_process_sync", _stub_slow, raising=False)
+    monkeypatch.setattr(type(main.job_manager.processor), "process_sync", _stub_slow, raising=False)
     try:
         main.job_manager.queue_size = 1
 
@@ -161,3 +184,1149 @@ def test_queue_capacity(monkeypatch, client):
             time.sleep(0.05)
     finally:
         main.job_manager.queue_size = original_queue_size
+
+
+def test_sqlite_store_shares_state(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    first_worker = SqliteJobStore(path)
+    second_worker = SqliteJobStore(path)
+    try:
+        job = Job(job_id="abc")
+        first_worker.add(job, max_active=1)
+
+        job.mark_stage(JobStatus.RENDERING, "Rendering PDF pages")
+        seen = second_worker.get("abc")
+        assert seen is not None
+        assert seen.status == JobStatus.RENDERING
+        assert seen.message == "Rendering PDF pages"
+
+        with pytest.raises(QueueFullError):
+            second_worker.add(Job(job_id="def"), max_active=1)
+
+        job.mark_ready(tmp_path / "output.pdf", "PDF ready")
+        seen = second_worker.get("abc")
+        assert seen.status == JobStatus.READY
+        assert seen.output_path == tmp_path / "output.pdf"
+        assert second_worker.active_count() == 0
+
+        second_worker.remove("abc")
+        assert first_worker.get("abc") is None
+    finally:
+        first_worker.close()
+        second_worker.close()
+
+
+def test_create_job_with_sqlite_store(monkeypatch, tmp_path, client):
+    monkeypatch.setattr(main.job_manager, "store", SqliteJobStore(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(
+        type(main.job_manager.processor),
+        "process_sync",
+        _stub_success,
+        raising=False,
+    )
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/jobs",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+        )
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    for _ in range(20):
+        data = client.get(f"/jobs/{job_id}").json()
+        if data["status"] == JobStatus.READY:
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail("Job did not complete in time")
+
+    result = client.get(data["download_url"])
+    assert result.status_code == 200
+    main.job_manager.store.close()
+
+
+def test_queue_executor_hands_jobs_to_worker(monkeypatch, tmp_path, client):
+    database = tmp_path / "jobs.sqlite3"
+    store = SqliteJobStore(database)
+    queue = JobQueue(database)
+    monkeypatch.setattr(main.job_manager, "store", store)
+    monkeypatch.setattr(main.job_manager, "queue", queue)
+    monkeypatch.setattr(JobProcessor, "process_sync", _stub_success)
+
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/jobs",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+        )
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    # nothing runs in the API process; the job waits in the durable queue
+    time.sleep(0.1)
+    assert client.get(f"/jobs/{job_id}").json()["status"] == JobStatus.QUEUED
+    assert queue.depth() == 1
+
+    worker = QueueWorker(SqliteJobStore(database), JobQueue(database), main.storage)
+    assert worker.run_once()
+    assert not worker.run_once()
+    assert queue.depth() == 0
+
+    data = client.get(f"/jobs/{job_id}").json()
+    assert data["status"] == JobStatus.READY
+    assert client.get(data["download_url"]).status_code == 200
+
+    worker.store.close()
+    worker.queue.close()
+    queue.close()
+    store.close()
+
+
+def test_queue_worker_stops_after_losing_its_lease(monkeypatch, tmp_path):
+    database = tmp_path / "jobs.sqlite3"
+    store = SqliteJobStore(database)
+    queue = JobQueue(database)
+    store.add(Job(job_id="leased"))
+    queue.enqueue("leased", None)
+    cancelled = threading.Event()
+
+    def _stub_stalled(self, job, paths, options, cancel=None):
+        job.mark_stage(JobStatus.RENDERING, "Rendering PDF pages")
+        # as if this worker stalled past its lease and another one claimed it
+        with sqlite3.connect(database) as conn:
+            conn.execute("UPDATE job_queue SET claimed_by = 'other-worker'")
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            try:
+                cancel.raise_if_cancelled()
+            except Exception:
+                cancelled.set()
+                raise
+            job.advance_stage(JobStatus.RENDERING, 0.5, "Still rendering")
+            time.sleep(0.01)
+
+    monkeypatch.setattr(JobProcessor, "process_sync", _stub_stalled)
+    worker = QueueWorker(
+        SqliteJobStore(database),
+        JobQueue(database, lease_seconds=0.3),
+        main.storage,
+        poll_interval=0.05,
+    )
+    try:
+        assert worker.run_once()
+        assert cancelled.is_set()
+
+        # the job and its queue entry now belong to the other worker, so the
+        # stopped worker neither failed the job nor completed the entry
+        assert store.get("leased").status == JobStatus.RENDERING
+        assert queue.depth() == 1
+    finally:
+        worker.store.close()
+        worker.queue.close()
+        queue.close()
+        store.close()
+
+
+def test_scheduler_runs_short_jobs_first_with_aging_and_fairness(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("app.scheduler.time.monotonic", lambda: clock[0])
+
+    scheduler = JobScheduler(aging_rate=1.0)
+    scheduler.push("long", 50.0)
+    scheduler.push("short", 1.0)
+    assert scheduler.pop() == "short"
+
+    # a long job that has waited long enough goes ahead of a fresh short one
+    clock[0] = 60.0
+    scheduler.push("fresh", 1.0)
+    assert scheduler.pop() == "long"
+    assert scheduler.pop() == "fresh"
+    assert scheduler.pop() is None
+
+    fair = JobScheduler(aging_rate=1.0, fair_share=True)
+    for ix in range(3):
+        fair.push(f"a{ix}", 1.0, client_id="a")
+    fair.push("b0", 5.0, client_id="b")
+    assert fair.pop() == "a0"
+    assert fair.pop() == "b0"
+    fair.remove("a1")
+    assert fair.pop() == "a2"
+
+
+def test_estimate_cost_counts_selected_pages():
+    cost = estimate_cost(RESOURCES / "input.pdf")
+    assert cost.pages == 2
+    assert cost.work_units == pytest.approx(2.0, rel=0.1)
+    assert estimate_cost(RESOURCES / "input.pdf", "2").pages == 1
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_store_counts_and_expires_finished_jobs(tmp_path, backend):
+    store = InMemoryJobStore() if backend == "memory" else SqliteJobStore(tmp_path / "jobs.db")
+    jobs = [Job(job_id=f"job-{ix}") for ix in range(3)]
+    for job in jobs:
+        store.add(job)
+
+    jobs[0].mark_stage(JobStatus.RENDERING)
+    jobs[1].mark_ready(tmp_path / "out.pdf")
+    jobs[2].mark_failed("Boom")
+    assert store.active_count() == 1
+    assert store.status_counts() == {
+        JobStatus.RENDERING: 1,
+        JobStatus.READY: 1,
+        JobStatus.FAILED: 1,
+    }
+
+    # job timestamps are naive UTC
+    cutoff = datetime.now(UTC).replace(tzinfo=None)
+    # a job that finishes after the cutoff is not expired yet
+    jobs[1].update(message="downloaded")
+    assert store.expired(cutoff) == ["job-2"]
+
+    store.remove("job-2")
+    assert store.active_count() == 1
+    assert store.status_counts() == {JobStatus.RENDERING: 1, JobStatus.READY: 1}
+    store.close()
+
+
+def test_job_events_stream_until_ready(monkeypatch, client):
+    def _stub_staged(self, job, paths, options, cancel=None):
+        # hold the job until the stream is listening, so the changes below
+        # arrive as notifications rather than as the initial state
+        for _ in range(500):
+            if job.job_id in main.job_manager.events._subscribers:
+                break
+            time.sleep(0.01)
+        job.mark_stage(JobStatus.DETECTING, "Running field detection")
+        for done in (1, 2):
+            job.advance_stage(JobStatus.DETECTING, done / 2, f"Detected fields on page {done} of 2")
+        _stub_success(self, job, paths, options)
+
+    monkeypatch.setattr(JobProcessor, "process_sync", _stub_staged)
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/jobs",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+        )
+    job_id = response.json()["job_id"]
+
+    events = []
+    with client.stream("GET", f"/jobs/{job_id}/events") as stream:
+        assert stream.headers["content-type"].startswith("text/event-stream")
+        event = None
+        for line in stream.iter_lines():
+            if line.startswith("event: "):
+                event = line.removeprefix("event: ")
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line.removeprefix("data: "))))
+
+    assert events[0][0] == "status"
+    assert events[0][1]["status"] == JobStatus.QUEUED
+    assert ("progress", "Detected fields on page 2 of 2") in [
+        (name, data["message"]) for name, data in events
+    ]
+    name, final = events[-1]
+    assert name == "status"
+    assert final["status"] == JobStatus.READY
+    assert final["download_url"] == f"/jobs/{job_id}/result"
+
+
+def test_job_events_follow_a_shared_store(monkeypatch, tmp_path):
+    monkeypatch.setattr(main.settings, "queue_poll_interval_seconds", 0.02)
+    database = tmp_path / "jobs.sqlite3"
+
+    async def scenario() -> None:
+        # the stream is served by one API process while another runs the job
+        manager = JobManager(main.storage, store=SqliteJobStore(database))
+        elsewhere = SqliteJobStore(database)
+        try:
+            job = Job(job_id="elsewhere")
+            elsewhere.add(job)
+            stream = _event_stream(manager, job.job_id)
+            assert "queued" in await anext(stream)
+
+            job.mark_stage(JobStatus.DETECTING, "Running field detection")
+            event = await asyncio.wait_for(anext(stream), timeout=1.0)
+            assert event.startswith("event: status") and "detecting" in event
+            await stream.aclose()
+        finally:
+            await manager.shutdown()
+            manager.processor.executor.shutdown()
+            manager.store.close()
+            elsewhere.close()
+
+    asyncio.run(scenario())
+
+
+def test_job_events_unknown_job(client):
+    assert client.get("/jobs/missing/events").status_code == 404
+
+
+def test_writing_reports_progress_per_page(tmp_path):
+    processor = JobProcessor(main.storage)
+    box = BoundingBox(x0=0.1, y0=0.1, x1=0.3, y1=0.15)
+    widgets = {
+        page_ix: [
+            Widget(widget_type="TextBox", bounding_box=box, page=page_ix, confidence=0.9)
+            for _ in range(200)
+        ]
+        for page_ix in (0, 1)
+    }
+    job = Job(job_id="writes")
+    updates = []
+    job.on_change = lambda changed: updates.append(changed.progress)
+    try:
+        with DocumentSession(RESOURCES / "input.pdf") as document:
+            processor._write_document(
+                job,
+                document,
+                widgets,
+                processor._merge_options(None),
+                tmp_path / "output.pdf",
+            )
+    finally:
+        processor.executor.shutdown()
+
+    # one update entering the stage, then one per page instead of per widget
+    assert len(updates) == 3
+    assert updates == sorted(updates)
+
+
+def _stub_document(self, job, document, merged_options, output, *, job_dir=None):
+    output.write(b"%PDF-1.4\n% Prepared inline\n")
+
+
+def test_prepare_returns_small_documents_inline(monkeypatch, client):
+    monkeypatch.setattr(JobProcessor, "_process_document", _stub_document)
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/prepare",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+        )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.content.startswith(b"%PDF-1.4\n% Prepared inline")
+    assert main.job_manager.store.list_jobs() == []
+
+
+def test_prepare_inline_does_not_wait_for_running_jobs(monkeypatch, client):
+    release = threading.Event()
+    running = []
+
+    def _stub_blocked(self, job, paths, options, cancel=None):
+        running.append(job.job_id)
+        release.wait(10)
+        _stub_success(self, job, paths, options)
+
+    monkeypatch.setattr(JobProcessor, "process_sync", _stub_blocked)
+    monkeypatch.setattr(JobProcessor, "_process_document", _stub_document)
+    try:
+        # slow jobs hold every processing thread
+        for _ in range(main.job_manager.processor.threads):
+            with (RESOURCES / "input.pdf").open("rb") as handle:
+                response = client.post(
+                    "/jobs", files={"file": ("input.pdf", handle, "application/pdf")}
+                )
+            assert response.status_code == 202
+        while len(running) < main.job_manager.processor.threads:
+            time.sleep(0.01)
+
+        started = time.monotonic()
+        with (RESOURCES / "input.pdf").open("rb") as handle:
+            response = client.post(
+                "/prepare", files={"file": ("input.pdf", handle, "application/pdf")}
+            )
+        assert response.status_code == 200
+        assert response.content.startswith(b"%PDF-1.4\n% Prepared inline")
+        assert time.monotonic() - started < 5
+    finally:
+        release.set()
+
+
+@pytest.mark.parametrize("limit", [("sync_max_pages", 1), ("sync_max_mb", 0.001)])
+def test_prepare_falls_back_to_job(monkeypatch, client, limit):
+    monkeypatch.setattr(main.settings, *limit)
+    monkeypatch.setattr(JobProcessor, "_process_document", _stub_document)
+    monkeypatch.setattr(JobProcessor, "process_sync", _stub_success)
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/prepare",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+        )
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert response.headers["location"] == f"/jobs/{job_id}"
+    stored = main.storage.job_paths(job_id).input_path.read_bytes()
+    assert stored == (RESOURCES / "input.pdf").read_bytes()
+
+
+def test_page_selection_past_the_end(monkeypatch, client):
+    # the sample has two pages
+    options = {"options": json.dumps({"pages": "50-60"})}
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/prepare",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+            data=options,
+        )
+    assert response.status_code == 422
+    assert "selects no pages" in response.json()["detail"]
+
+    monkeypatch.setattr(JobProcessor, "_process_document", _stub_document)
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/jobs",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+            data=options,
+        )
+    assert response.status_code == 202
+    data = _wait_for_job(client, response.json()["job_id"])
+    assert data["status"] == JobStatus.FAILED
+    assert data["error"]["type"] == "InvalidPageSelectionError"
+    assert "selects no pages" in data["error"]["detail"]
+
+
+def _stub_detect(self, job, document, merged_options, *, job_dir=None, cancel=None):
+    bounding_box = BoundingBox(x0=0.1, y0=0.1, x1=0.4, y1=0.15)
+    return {0: [Widget(widget_type="TextBox", bounding_box=bounding_box, page=0, confidence=0.9)]}
+
+
+def _fail_write(self, *args, **kwargs):
+    raise AssertionError("detection-only requests must not write a PDF")
+
+
+def test_detect_returns_fields_inline(monkeypatch, client):
+    monkeypatch.setattr(JobProcessor, "_detect_document", _stub_detect)
+    monkeypatch.setattr(JobProcessor, "_write_document", _fail_write)
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/detect",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+            data={"options": json.dumps({"pages": "1"})},
+        )
+    assert response.status_code == 200
+    pages = response.json()["pages"]
+    assert [page["page"] for page in pages] == [0]
+    assert pages[0]["geometry"]["width"] == 612
+    assert pages[0]["widgets"][0]["confidence"] == 0.9
+
+
+def test_json_output_job_skips_writing(monkeypatch, client):
+    monkeypatch.setattr(JobProcessor, "_detect_document", _stub_detect)
+    monkeypatch.setattr(JobProcessor, "_write_document", _fail_write)
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/jobs",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+            data={"options": json.dumps({"output": "json"})},
+        )
+    job_id = response.json()["job_id"]
+
+    for _ in range(40):
+        data = client.get(f"/jobs/{job_id}").json()
+        if data["status"] in (JobStatus.READY, JobStatus.FAILED):
+            break
+        time.sleep(0.05)
+    assert data["status"] == JobStatus.READY
+
+    result = client.get(data["download_url"])
+    assert result.headers["content-type"] == "application/json"
+    assert [page["page"] for page in result.json()["pages"]] == [0, 1]
+
+
+class _CascadeDetector:
+    """
+    Stands in for a cascade FFDNetDetector that escalated the second page and
+    merged two duplicate boxes.
+    """
+
+    def __init__(self):
+        self.last_cascade = None
+        self.dedupe_policy = DedupePolicy()
+        self.last_dedupe = DedupeReport()
+
+    def extract_widgets(self, pages, **kwargs):
+        self.last_cascade = CascadeReport(
+            pages=len(pages), escalated=[EscalationDecision(page=1, reasons=["dense"])]
+        )
+        self.last_dedupe = DedupeReport(before=5, after=3)
+        return {}
+
+
+def test_job_reports_cascade_and_dedupe(monkeypatch, client):
+    requested = []
+
+    def _get_detector(self, model_or_path, *, device, fast, cascade=False, dedupe=True):
+        requested.append((cascade, dedupe))
+        return _CascadeDetector()
+
+    monkeypatch.setattr(JobProcessor, "get_detector", _get_detector)
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/jobs",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+            data={"options": json.dumps({"cascade": True, "output": "json"})},
+        )
+    job_id = response.json()["job_id"]
+
+    for _ in range(40):
+        data = client.get(f"/jobs/{job_id}").json()
+        if data["status"] in (JobStatus.READY, JobStatus.FAILED):
+            break
+        time.sleep(0.05)
+    assert data["status"] == JobStatus.READY
+    assert requested == [(True, True)]
+    assert data["cascade"] == {
+        "detected_pages": 2,
+        "escalated_pages": 1,
+        "escalation_rate": 0.5,
+        "escalated": [{"page": 1, "reasons": ["dense"]}],
+    }
+    assert data["dedupe"] == {"before": 5, "after": 3}
+
+
+def test_memory_plan_degrades_before_rejecting():
+    letter = (612, 792)
+
+    def plan(pages, budget_mb, **kwargs):
+        return plan_memory(
+            [letter] * pages,
+            image_size=1600,
+            fast=kwargs.pop("fast", False),
+            grayscale=False,
+            budget_bytes=None if budget_mb is None else int(budget_mb * MB),
+            min_image_size=960,
+        )
+
+    assert plan(40, None).strategy == "full"
+    assert plan(2, 1536).strategy == "full"
+
+    batched = plan(40, 1536)
+    assert (batched.strategy, batched.batch_size, batched.render_batch) == ("batched", 8, None)
+    # the bitmaps of 2000 pages alone are over budget, so pages are rendered 8 at a time
+    streamed = plan(2000, 1536)
+    assert (streamed.strategy, streamed.batch_size, streamed.render_batch) == ("streamed", 8, 8)
+    fast = plan(2000, 1536, fast=True)
+    assert (fast.strategy, fast.batch_size, fast.render_batch) == ("streamed", None, 32)
+
+    reduced = plan(3, 100)
+    assert reduced.strategy == "reduced"
+    assert 960 <= reduced.image_size < 1600 and reduced.image_size % 32 == 0
+    assert reduced.estimated_bytes <= 100 * MB
+
+    with pytest.raises(MemoryBudgetError):
+        plan(3, 10)
+
+
+class _RecordingDetector(_CascadeDetector):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+        self.confidences = []
+
+    def extract_widgets(self, pages, **kwargs):
+        self.calls.append((len(pages), kwargs["batch_size"], kwargs["image_size"]))
+        self.last_dedupe = DedupeReport(before=1, after=1)
+        return {}
+
+
+def test_job_within_memory_budget(monkeypatch, client):
+    detector = _RecordingDetector()
+    monkeypatch.setattr(JobProcessor, "get_detector", lambda self, *args, **kwargs: detector)
+    options = json.dumps({"output": "json", "prefilter": False})
+
+    def run_job() -> dict:
+        with (RESOURCES / "input.pdf").open("rb") as handle:
+            response = client.post(
+                "/jobs",
+                files={"file": ("input.pdf", handle, "application/pdf")},
+                data={"options": options},
+            )
+        job_id = response.json()["job_id"]
+        for _ in range(40):
+            data = client.get(f"/jobs/{job_id}").json()
+            if data["status"] in (JobStatus.READY, JobStatus.FAILED):
+                return data
+            time.sleep(0.05)
+        return data
+
+    # room for one Letter page at a time, but not for both pages' bitmaps
+    monkeypatch.setattr(main.settings, "memory_budget_mb", 138.5)
+    data = run_job()
+    assert data["status"] == JobStatus.READY
+    assert detector.calls == [(1, 1, 1600), (1, 1, 1600)]
+    memory = data["memory"]
+    assert (memory["strategy"], memory["batch_size"], memory["render_batch"]) == (
+        "streamed",
+        1,
+        1,
+    )
+    assert memory["estimated_mb"] <= memory["budget_mb"] == 138.5
+    assert memory["peak_rss_mb"] >= memory["start_rss_mb"] > 0
+    # detections from both chunks are reported together
+    assert data["dedupe"] == {"before": 2, "after": 2}
+
+    monkeypatch.setattr(main.settings, "memory_budget_mb", 1.0)
+    data = run_job()
+    assert data["status"] == JobStatus.FAILED
+    assert data["error"]["type"] == "MemoryBudgetError"
+    assert len(detector.calls) == 2
+
+
+def test_ready_after_models_are_warm(monkeypatch):
+    release = threading.Event()
+    warmed_threads = set()
+
+    def _stub_warm(self, model_or_path, *, device, fast, cascade=False):
+        release.wait(5)
+        warmed_threads.add(threading.get_ident())
+
+    monkeypatch.setattr(JobProcessor, "warm_detector", _stub_warm)
+    monkeypatch.setattr(main.settings, "preload_models", True)
+    with TestClient(main.app) as fastapi_client:
+        response = fastapi_client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "starting"
+        assert fastapi_client.get("/health").status_code == 200
+
+        release.set()
+        for _ in range(40):
+            response = fastapi_client.get("/ready")
+            if response.status_code == 200:
+                break
+            time.sleep(0.05)
+
+    assert response.status_code == 200
+    assert response.json()["warm_up_seconds"] >= 0
+    # the detector is loaded on every processing and inline thread
+    processor = main.job_manager.processor
+    assert len(warmed_threads) == processor.threads + processor.inline_threads
+    assert response.json()["inline_threads"] == processor.inline_threads
+
+
+def test_admission_by_queued_work(monkeypatch, client):
+    release = threading.Event()
+
+    def _stub_blocked(self, job, paths, options, cancel=None):
+        release.wait(5)
+        _stub_success(self, job, paths, options)
+
+    monkeypatch.setattr(JobProcessor, "process_sync", _stub_blocked)
+    # two Letter pages per upload at half a page per second: 4s each
+    monkeypatch.setattr(main.job_manager, "throughput", ThroughputMeter(default_rate=0.5))
+    monkeypatch.setattr(main.settings, "admission_max_seconds", 6.0)
+
+    def submit():
+        with (RESOURCES / "input.pdf").open("rb") as handle:
+            return client.post(
+                "/jobs",
+                files={"file": ("input.pdf", handle, "application/pdf")},
+            )
+
+    try:
+        # both processing slots are free, so both jobs start right away
+        for _ in range(main.job_manager.max_concurrent_jobs):
+            response = submit()
+            assert response.status_code == 202
+            payload = response.json()
+            started = datetime.fromisoformat(payload["estimated_start_at"])
+            finished = datetime.fromisoformat(payload["estimated_finish_at"])
+            assert (finished - started).total_seconds() == pytest.approx(4.0, abs=0.5)
+
+        # a third would wait ~4s for a slot and finish after the 6s budget
+        response = submit()
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "2"
+    finally:
+        release.set()
+
+
+def test_throughput_meter():
+    meter = ThroughputMeter(default_rate=0.5, window=2)
+    assert meter.rate == 0.5
+    meter.record(2.0, 1.0)
+    meter.record(4.0, 1.0)
+    assert meter.rate == 3.0
+    meter.record(1.0, 1.0)
+    assert meter.rate == 2.5
+
+
+def test_batch_of_files_and_zip(monkeypatch, client):
+    monkeypatch.setattr(JobProcessor, "process_sync", _stub_success)
+    pdf = (RESOURCES / "input.pdf").read_bytes()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zipped:
+        zipped.writestr("forms/input.pdf", pdf)
+        zipped.writestr("forms/notes.txt", b"not a form")
+
+    response = client.post(
+        "/batches",
+        files=[
+            ("files", ("input.pdf", pdf, "application/pdf")),
+            ("files", ("other.pdf", pdf, "application/pdf")),
+            ("files", ("forms.zip", archive.getvalue(), "application/zip")),
+        ],
+    )
+    assert response.status_code == 202
+    batch = response.json()
+    assert [doc["filename"] for doc in batch["documents"]] == [
+        "input.pdf",
+        "other.pdf",
+        "input.pdf",
+    ]
+
+    for _ in range(40):
+        batch = client.get(f"/batches/{batch['batch_id']}").json()
+        if batch["status"] == "completed":
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail("Batch did not complete in time")
+    assert batch["progress"] == 1.0
+
+    result = client.get(batch["download_url"])
+    assert result.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(result.content)) as zipped:
+        assert zipped.namelist() == ["input.pdf", "other.pdf", "input-1.pdf"]
+        assert zipped.read("other.pdf").startswith(b"%PDF-1.4")
+
+
+def test_batch_result_names_stay_inside_the_archive(tmp_path):
+    names = ["../../x.pdf", "/etc/passwd.pdf", "..\\..\\win.pdf", "..", "forms/ok.pdf"]
+    batch = Batch(batch_id="b", documents={f"job{ix}": name for ix, name in enumerate(names)})
+    jobs = []
+    for job_id in batch.documents:
+        output = tmp_path / f"{job_id}.pdf"
+        output.write_bytes(b"%PDF")
+        job = Job(job_id=job_id)
+        job.mark_ready(output)
+        jobs.append(job)
+
+    archive_names = [name for name, _ in result_files(batch, jobs)]
+    assert archive_names == ["x.pdf", "passwd.pdf", "win.pdf", "job3.pdf", "ok.pdf"]
+
+
+def test_batch_rejects_too_many_documents(monkeypatch, client):
+    monkeypatch.setattr(main.settings, "batch_max_documents", 1)
+    pdf = (RESOURCES / "input.pdf").read_bytes()
+    response = client.post(
+        "/batches",
+        files=[
+            ("files", ("a.pdf", pdf, "application/pdf")),
+            ("files", ("b.pdf", pdf, "application/pdf")),
+        ],
+    )
+    assert response.status_code == 413
+    assert main.job_manager.store.list_jobs() == []
+
+
+def test_batch_maps_invalid_input_to_422(monkeypatch, client):
+    async def _invalid(*args, **kwargs):
+        PrepareOptions.model_validate({"confidence": "high"})
+
+    monkeypatch.setattr(main.job_manager, "submit_batch", _invalid)
+    pdf = (RESOURCES / "input.pdf").read_bytes()
+    response = client.post("/batches", files=[("files", ("a.pdf", pdf, "application/pdf"))])
+    # a ValidationError is a ValueError too, but not a size limit
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["confidence"]
+    assert list(main.storage.base_dir.iterdir()) == []
+
+
+def test_delete_stops_running_job(monkeypatch, client):
+    pages_done = []
+    stopped = threading.Event()
+
+    def _stub_pages(self, job, paths, options, cancel=None):
+        job.mark_stage(JobStatus.DETECTING, "Running field detection")
+        try:
+            for page in range(200):
+                cancel.raise_if_cancelled()
+                time.sleep(0.01)
+                pages_done.append(page)
+        finally:
+            stopped.set()
+
+    monkeypatch.setattr(JobProcessor, "process_sync", _stub_pages)
+
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/jobs",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+        )
+    job_id = response.json()["job_id"]
+    while not pages_done:
+        time.sleep(0.01)
+
+    response = client.delete(f"/jobs/{job_id}")
+    assert response.status_code == 204
+    # the processing thread stopped at a page boundary before the files went
+    assert stopped.is_set()
+    assert len(pages_done) < 200
+    assert not (main.storage.base_dir / job_id).exists()
+    assert client.get(f"/jobs/{job_id}").status_code == 404
+    assert client.delete(f"/jobs/{job_id}").status_code == 404
+
+
+def test_delete_from_another_process_stops_running_job(monkeypatch, tmp_path):
+    monkeypatch.setattr(main.settings, "queue_poll_interval_seconds", 0.02)
+    pages_done = []
+    stopped = threading.Event()
+
+    def _stub_pages(self, job, paths, options, cancel=None):
+        job.mark_stage(JobStatus.DETECTING, "Running field detection")
+        try:
+            for page in range(200):
+                cancel.raise_if_cancelled()
+                time.sleep(0.01)
+                pages_done.append(page)
+            paths.output_path.write_bytes(b"%PDF")
+        finally:
+            stopped.set()
+
+    monkeypatch.setattr(JobProcessor, "process_sync", _stub_pages)
+    database = tmp_path / "jobs.sqlite3"
+
+    async def scenario() -> None:
+        # the job runs in the first process; the DELETE lands on the second
+        owner = JobManager(main.storage, store=SqliteJobStore(database))
+        other = JobManager(main.storage, store=SqliteJobStore(database))
+        try:
+            paths = main.storage.job_paths("running")
+            paths.input_path.write_bytes((RESOURCES / "input.pdf").read_bytes())
+            await owner.submit_job("running", paths, None)
+            while not pages_done:
+                await asyncio.sleep(0.01)
+
+            await other.remove_job("running")
+            main.storage.delete_job("running")
+            for _ in range(100):
+                await asyncio.sleep(0.02)
+                if not owner.tasks:
+                    break
+            assert stopped.is_set()
+            assert len(pages_done) < 200
+            # the owner neither wrote output nor checkpointed the job back
+            assert not paths.base_dir.exists()
+        finally:
+            for manager in (owner, other):
+                await manager.shutdown()
+                manager.processor.executor.shutdown()
+                manager.store.close()
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_store_does_not_resurrect_removed_jobs(tmp_path):
+    store = SqliteJobStore(tmp_path / "jobs.db")
+    job = Job(job_id="removed")
+    store.add(job)
+    store.remove(job.job_id)
+
+    # a processing thread reporting progress after the removal
+    job.mark_stage(JobStatus.DETECTING, "Running field detection")
+    assert store.get(job.job_id) is None
+    store.close()
+
+
+class _WidgetDetector(_RecordingDetector):
+    """Detects a text box and a less certain signature on every page."""
+
+    def extract_widgets(self, pages, **kwargs):
+        super().extract_widgets(pages, **kwargs)
+        self.confidences.append(kwargs["confidence"])
+        text_box = BoundingBox(x0=0.1, y0=0.2, x1=0.5, y1=0.25)
+        signature = BoundingBox(x0=0.1, y0=0.8, x1=0.5, y1=0.85)
+        return {
+            page.index: [
+                Widget(
+                    widget_type="TextBox", bounding_box=text_box, page=page.index, confidence=0.8
+                ),
+                Widget(
+                    widget_type="Signature",
+                    bounding_box=signature,
+                    page=page.index,
+                    confidence=0.2,
+                ),
+            ]
+            for page in pages
+        }
+
+
+def _wait_for_job(client, job_id) -> dict:
+    for _ in range(40):
+        data = client.get(f"/jobs/{job_id}").json()
+        if data["status"] in (JobStatus.READY, JobStatus.FAILED):
+            return data
+        time.sleep(0.05)
+    return data
+
+
+def test_retry_resumes_from_saved_detections(monkeypatch, client):
+    detector = _WidgetDetector()
+    monkeypatch.setattr(JobProcessor, "get_detector", lambda self, *args, **kwargs: detector)
+
+    def _fail_writing(self, job, document, widgets, merged_options, output, **kwargs):
+        job.mark_stage(JobStatus.WRITING, "Writing fillable PDF")
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(JobProcessor, "_write_document", _fail_writing)
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/jobs",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+            data={"options": json.dumps({"prefilter": False})},
+        )
+    job_id = response.json()["job_id"]
+    data = _wait_for_job(client, job_id)
+    assert data["status"] == JobStatus.FAILED
+    assert len(detector.calls) == 1
+
+    job_dir = main.storage.base_dir / job_id
+    state = json.loads((job_dir / "metadata.json").read_text())
+    assert state["status"] == "failed"
+    assert state["metadata"]["options"] == {"prefilter": False}
+    assert sorted(state["detection"]["geometry"]) == ["0", "1"]
+    assert (job_dir / "detections.npz").is_file()
+
+    written = []
+
+    def _write(self, job, document, widgets, merged_options, output, **kwargs):
+        written.append({page: len(page_widgets) for page, page_widgets in widgets.items()})
+        output.write_bytes(b"%PDF-1.4\n% retried\n")
+
+    monkeypatch.setattr(JobProcessor, "_write_document", _write)
+    response = client.post(f"/jobs/{job_id}/retry")
+    assert response.status_code == 202
+    data = _wait_for_job(client, job_id)
+    assert data["status"] == JobStatus.READY
+    assert (data["runs"], data["resumed_from"]) == (2, JobStatus.DETECTING)
+    # the detector wasn't run again; its saved boxes were written
+    assert len(detector.calls) == 1
+    assert written == [{0: 1, 1: 1}]
+    assert data["dedupe"] == {"before": 1, "after": 1}
+
+    assert client.post(f"/jobs/{job_id}/retry").status_code == 409
+    assert client.post("/jobs/missing/retry").status_code == 404
+
+
+def test_restart_resumes_interrupted_jobs(monkeypatch, tmp_path):
+    detector = _WidgetDetector()
+    monkeypatch.setattr(JobProcessor, "get_detector", lambda self, *args, **kwargs: detector)
+    options = PrepareOptions(output="json", prefilter=False)
+    processor = main.job_manager.processor
+
+    def interrupted(job_id: str, status: JobStatus, detected: bool) -> None:
+        paths = main.storage.job_paths(job_id)
+        paths.input_path.write_bytes((RESOURCES / "input.pdf").read_bytes())
+        job = Job(job_id=job_id, status=status)
+        job.metadata["options"] = options.model_dump(exclude_none=True)
+        save_state(job, paths)
+        if detected:
+            box = BoundingBox(x0=0.1, y0=0.1, x1=0.3, y1=0.2)
+            widget = Widget(widget_type="Signature", bounding_box=box, page=1, confidence=0.7)
+            with DocumentSession(paths.input_path) as document:
+                geometry = {ix: document.page_geometry(ix) for ix in (0, 1)}
+            key = processor._detection_key(processor._merge_options(options))
+            reports = {"dedupe": {"before": 2, "after": 1}}
+            save_detections(job, paths, {1: [widget]}, geometry, key, reports, min_confidence=0.1)
+
+    # a process stopped mid-detection, after detecting, and before starting
+    interrupted("detecting", JobStatus.DETECTING, detected=False)
+    interrupted("writing", JobStatus.WRITING, detected=True)
+    interrupted("queued", JobStatus.QUEUED, detected=False)
+    finished = Job(job_id="finished", status=JobStatus.READY)
+    save_state(finished, main.storage.job_paths("finished"))
+
+    with TestClient(main.app) as fastapi_client:
+        results = {
+            job_id: _wait_for_job(fastapi_client, job_id)
+            for job_id in ("detecting", "writing", "queued")
+        }
+        assert fastapi_client.get("/jobs/finished").status_code == 404
+
+    assert {job_id: data["status"] for job_id, data in results.items()} == dict.fromkeys(
+        results, JobStatus.READY
+    )
+    assert results["writing"]["resumed_from"] == JobStatus.DETECTING
+    assert results["writing"]["dedupe"] == {"before": 2, "after": 1}
+    assert results["detecting"]["resumed_from"] is None
+    # only the two jobs without saved detections ran the detector
+    assert len(detector.calls) == 2
+    fields = json.loads((tmp_path / "writing" / "fields.json").read_text())
+    assert [len(page["widgets"]) for page in fields["pages"]] == [0, 1]
+    assert fields["pages"][1]["widgets"][0]["widget_type"] == "Signature"
+
+
+def test_managers_sharing_a_store_do_not_resume_each_others_jobs(monkeypatch, tmp_path):
+    release = threading.Event()
+
+    def _stub_blocked(self, job, paths, options, cancel=None):
+        job.mark_stage(JobStatus.RENDERING, "Rendering PDF pages")
+        release.wait(5)
+        _stub_success(self, job, paths, options)
+
+    monkeypatch.setattr(JobProcessor, "process_sync", _stub_blocked)
+    database = tmp_path / "jobs.sqlite3"
+
+    def upload(job_id: str):
+        paths = main.storage.job_paths(job_id)
+        paths.input_path.write_bytes((RESOURCES / "input.pdf").read_bytes())
+        return paths
+
+    async def scenario() -> None:
+        # two API processes (e.g. uvicorn --workers 2) on one store and
+        # storage directory; the second starts while the first runs a job
+        first = JobManager(main.storage, store=SqliteJobStore(database))
+        await first.submit_job("running", upload("running"), None)
+        # and one job was left behind by a process that crashed
+        save_state(Job(job_id="orphaned", status=JobStatus.DETECTING), upload("orphaned"))
+
+        second = JobManager(main.storage, store=SqliteJobStore(database))
+        try:
+            resumed = await second.resume_interrupted()
+            assert [job.job_id for job in resumed] == ["orphaned"]
+            assert "running" not in second.tasks
+            # the first process starting again now finds nothing to resume
+            assert await first.resume_interrupted() == []
+
+            release.set()
+            for _ in range(40):
+                await asyncio.sleep(0.05)
+                if not first.tasks and not second.tasks:
+                    break
+            jobs = {job.job_id: job for job in second.store.list_jobs()}
+            assert jobs["running"].status == JobStatus.READY
+            assert jobs["orphaned"].status == JobStatus.READY
+            assert jobs["orphaned"].metadata["runs"] == 2
+        finally:
+            release.set()
+            for manager in (first, second):
+                await manager.shutdown()
+                manager.processor.executor.shutdown()
+                manager.store.close()
+
+    asyncio.run(scenario())
+
+
+def test_rerun_with_post_detection_options_reuses_detections(monkeypatch, client):
+    monkeypatch.setattr(main.settings, "rerun_confidence_floor", 0.1)
+    detector = _WidgetDetector()
+    monkeypatch.setattr(JobProcessor, "get_detector", lambda self, *args, **kwargs: detector)
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/jobs",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+            data={"options": json.dumps({"prefilter": False, "confidence": 0.5})},
+        )
+    job_id = response.json()["job_id"]
+    data = _wait_for_job(client, job_id)
+    assert data["status"] == JobStatus.READY
+    # detection runs down to the floor; the job's own threshold applies after
+    assert detector.confidences == [0.1]
+
+    def field_types() -> list[str]:
+        fields = PdfReader(main.storage.base_dir / job_id / "output.pdf").get_fields() or {}
+        return sorted(str(field.get("/FT")) for field in fields.values())
+
+    assert field_types() == ["/Tx", "/Tx"]
+
+    options = {"confidence": 0.15, "use_signature_fields": True}
+    response = client.post(f"/jobs/{job_id}/rerun", json=options)
+    assert response.status_code == 202
+    data = _wait_for_job(client, job_id)
+    assert data["status"] == JobStatus.READY
+    assert (data["runs"], data["resumed_from"]) == (2, JobStatus.DETECTING)
+    assert len(detector.calls) == 1
+    assert field_types() == ["/Sig", "/Sig", "/Tx", "/Tx"]
+    job = asyncio.run(main.job_manager.get_job(job_id))
+    assert job.metadata["options"] == {"prefilter": False, **options}
+
+    # below the floor the detector has to run again
+    response = client.post(f"/jobs/{job_id}/rerun", json={"confidence": 0.05})
+    data = _wait_for_job(client, job_id)
+    assert data["status"] == JobStatus.READY and data["resumed_from"] is None
+    assert detector.confidences == [0.1, 0.05]
+
+    assert client.post(f"/jobs/{job_id}/rerun", json={"model": "x"}).status_code == 422
+    assert client.post("/jobs/missing/rerun").status_code == 404
+
+
+@pytest.mark.parametrize("executor", ["inline", "queue"])
+def test_concurrent_reruns_submit_once(monkeypatch, tmp_path, executor):
+    monkeypatch.setattr(JobProcessor, "process_sync", _stub_success)
+    database = tmp_path / "jobs.sqlite3"
+    paths = main.storage.job_paths("done")
+    paths.input_path.write_bytes((RESOURCES / "input.pdf").read_bytes())
+
+    async def scenario() -> list:
+        manager = JobManager(
+            main.storage,
+            store=SqliteJobStore(database),
+            queue=JobQueue(database) if executor == "queue" else None,
+        )
+        job = Job(job_id="done")
+        manager.store.add(job)
+        _stub_success(None, job, paths, None)
+        finished = manager.store.get("done")
+        try:
+            # both requests saw a finished job before either was resubmitted
+            return await asyncio.gather(
+                manager.retry_job(finished),
+                manager.retry_job(finished, PrepareOptions(confidence=0.5)),
+                return_exceptions=True,
+            )
+        finally:
+            await manager.shutdown()
+            manager.processor.executor.shutdown()
+            manager.store.close()
+            if manager.queue is not None:
+                manager.queue.close()
+
+    results = asyncio.run(scenario())
+    assert sorted(type(result).__name__ for result in results) == ["Job", "JobBusyError"]
+
+
+def test_stub_detector_backend(monkeypatch, client):
+    monkeypatch.setattr(main.settings, "detector_backend", "stub")
+    monkeypatch.setattr(main.settings, "stub_page_latency_ms", 1.0)
+    with (RESOURCES / "input.pdf").open("rb") as handle:
+        response = client.post(
+            "/jobs",
+            files={"file": ("input.pdf", handle, "application/pdf")},
+            data={"options": json.dumps({"output": "json", "prefilter": False})},
+        )
+    data = _wait_for_job(client, response.json()["job_id"])
+    assert data["status"] == JobStatus.READY
+    pages = client.get(data["download_url"]).json()["pages"]
+    assert [len(page["widgets"]) for page in pages] == [1, 1]
+
+
+def test_load_generator_reports_endpoints(monkeypatch):
+    monkeypatch.setattr(main.settings, "detector_backend", "stub")
+    monkeypatch.setattr(main.settings, "stub_page_latency_ms", 1.0)
+    pdf = (RESOURCES / "input.pdf").read_bytes()
+
+    async def load() -> LoadReport:
+        # the job manager's lock belongs to whichever loop uses it
+        monkeypatch.setattr(main.job_manager, "lock", asyncio.Lock())
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await run_load(client, pdf, rate=40, duration=0.2, poll_interval=0.02)
+
+    summary = asyncio.run(load()).summary()
+    assert summary["jobs"] == {**summary["jobs"], "submitted": 8, "completed": 8, "rejected": 0}
+    endpoints = summary["endpoints"]
+    assert (
+        endpoints["POST /jobs"]["requests"] == endpoints["GET /jobs/{id}/result"]["requests"] == 8
+    )
+    assert endpoints["GET /jobs/{id}"]["requests"] >= 8
+    for stats in endpoints.values():
+        seconds = stats["seconds"]
+        assert stats["errors"] == 0
+        assert 0 < seconds["p50"] <= seconds["p95"] <= seconds["p99"] <= seconds["max"]
+    assert summary["queue"]["max_in_flight"] >= 1
+    assert summary["throughput"]["jobs_per_second"] > 0
+
+    assert percentile([4.0, 1.0, 3.0, 2.0], 50) == 2.0
+    assert percentile([4.0, 1.0, 3.0, 2.0], 99) == 4.0
+    assert percentile([], 50) is None
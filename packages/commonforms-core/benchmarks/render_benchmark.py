@@ -0,0 +1,71 @@
+"""
+Compare the PIL and zero-copy NumPy render paths, from pdfium bitmap to the
+array ultralytics feeds its preprocessing (LoadPilAndNumpy._single_check).
+
+    PYTHONPATH=. python benchmarks/render_benchmark.py tests/resources/input.pdf
+
+Allocation is measured with tracemalloc (NumPy and ctypes buffers) plus the
+pixel buffers PIL allocates outside of Python's allocator.
+"""
+
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+
+from commonforms.document import DocumentSession
+from commonforms.inference import detector_input
+from PIL import Image
+from ultralytics.data.loaders import LoadPilAndNumpy
+
+
+def pil_bytes(image) -> int:
+    # PIL stores RGB/RGBA pixels in 4 bytes and L in 1, outside tracemalloc
+    if isinstance(image, Image.Image):
+        return image.width * image.height * (1 if image.mode == "L" else 4)
+    return 0
+
+
+def run(document: DocumentSession, dpi: int, **render_kwargs) -> tuple[float, float]:
+    """Mean seconds and peak bytes allocated per page for one render mode."""
+    seconds = 0.0
+    allocated = 0
+    for page_ix in range(len(document)):
+        tracemalloc.start()
+        started = time.perf_counter()
+        (page,) = document.render(
+            dpi=dpi, pages=lambda ix, page_ix=page_ix: ix == page_ix, **render_kwargs
+        )
+        LoadPilAndNumpy._single_check(detector_input(page.image))
+        seconds += time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        allocated += peak + pil_bytes(page.image)
+    return seconds / len(document), allocated / len(document)
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark page render paths")
+    parser.add_argument("input", type=Path)
+    parser.add_argument("--dpi", type=int, default=72)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    modes = {
+        "pil": {},
+        "numpy": {"as_array": True},
+        "numpy-grayscale": {"as_array": True, "grayscale": True},
+    }
+
+    with DocumentSession(args.input) as document:
+        print(f"{args.input} ({len(document)} pages at {args.dpi} dpi)")
+        print(f"{'mode':<16} {'ms/page':>9} {'MiB/page':>9}")
+        for name, kwargs in modes.items():
+            runs = [run(document, args.dpi, **kwargs) for _ in range(args.repeat)]
+            seconds = min(r[0] for r in runs)
+            allocated = min(r[1] for r in runs)
+            print(f"{name:<16} {seconds * 1000:>9.2f} {allocated / 2**20:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
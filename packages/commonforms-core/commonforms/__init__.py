@@ -1,4 +1,16 @@
-from commonforms.inference import prepare_form
+from commonforms.cancellation import CancellationToken
+from commonforms.document import DocumentSession
+from commonforms.export import read_detections
+
+
+def __getattr__(name):
+    # the detector stack (ultralytics, torch) is only imported once it's
+    # needed, so e.g. reading an export back stays light
+    if name in ("prepare_form", "detect_fields", "export_detections"):
+        from commonforms import inference
+
+        return getattr(inference, name)
+    raise AttributeError(f"module 'commonforms' has no attribute {name!r}")
 
 
 def main():
@@ -7,4 +19,12 @@ def main():
     cli_main()
 
 
-__all__ = ["prepare_form", "main"]
+__all__ = [
+    "prepare_form",
+    "detect_fields",
+    "export_detections",
+    "read_detections",
+    "CancellationToken",
+    "DocumentSession",
+    "main",
+]
@@ -1,18 +1,58 @@
-from commonforms.inference import prepare_form
-from argparse import ArgumentParser
+from __future__ import annotations
+
+import json
+import sys
+from argparse import ArgumentParser, Namespace
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from commonforms.daemon import DetectorCache
+
+
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["serve"]:
+        from commonforms.daemon import serve_main
+
+        serve_main(argv[1:])
+        return
+
+    args = build_parser().parse_args(argv)
+    if args.socket is not None:
+        # only the socket client is imported here, so a forwarded call never
+        # pays for loading torch and ultralytics
+        from commonforms.daemon import DaemonUnavailableError, forward
+
+        try:
+            message = forward(args.socket, argv, Path.cwd())
+        except DaemonUnavailableError:
+            # nothing is listening; run in this process instead
+            pass
+        else:
+            if message:
+                print(message)
+            return
+
+    message = run(args)
+    if message:
+        print(message)
 
 
-def main():
+def build_parser() -> ArgumentParser:
     parser = ArgumentParser(
         prog="commonforms", description="Automatically Prepare a Fillable PDF Form"
     )
     parser.add_argument(
         "input",
         type=Path,
-        help="Path to the input file (only .pdf files are supported for now.)",
+        help="Path to the input file (only .pdf files are supported for now), or a directory of PDFs when exporting to .npz",
+    )
+    parser.add_argument(
+        "output",
+        type=Path,
+        help="Path to save the output PDF file, a .json file to only write the detected fields, or a .npz file to export the detected boxes of one or many PDFs in columnar form.",
     )
-    parser.add_argument("output", type=Path, help="Path to save the output PDF file.")
     parser.add_argument(
         "--model",
         type=str,
@@ -50,8 +90,98 @@ def main():
         action="store_true",
         help="If running on a CPU, you can use --fast to get a 50% speedup with a small accuracy penalty",
     )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        help="Screen every page with FFDNet-S and run --model only on pages where its detections look ambiguous",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Merge overlapping duplicate detections of the same field",
+    )
+    parser.add_argument(
+        "--pages",
+        type=str,
+        default=None,
+        help="Only detect fields on these pages, e.g. 1-3,7 (default: all pages)",
+    )
+    parser.add_argument(
+        "--prefilter",
+        action="store_true",
+        help="Skip detection on blank pages (and, with --keep-existing-fields, pages that already have fields)",
+    )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        default=None,
+        help="Forward the work to a `commonforms serve` daemon listening on this Unix socket, running it here if none is",
+    )
+    return parser
+
+
+def run(args: Namespace, detectors: DetectorCache | None = None) -> str | None:
+    """
+    Carry out a parsed command line; returns the message to print, if any.
+    With `detectors`, loaded detectors are taken from (and kept in) the cache.
+    """
+    from commonforms.inference import detect_fields, export_detections, prepare_form
+
+    detector = None
+    if detectors is not None:
+        detector = detectors.get(
+            args.model,
+            device=args.device,
+            fast=args.fast,
+            cascade=args.cascade,
+            dedupe=args.dedupe,
+        )
+
+    if args.output.suffix.lower() == ".npz":
+        if args.input.is_dir():
+            # documents are identified by their path inside the directory
+            inputs = [
+                (str(path.relative_to(args.input)), path)
+                for path in sorted(args.input.rglob("*.pdf"))
+            ]
+        else:
+            inputs = [args.input]
+        rows = export_detections(
+            inputs,
+            args.output,
+            model_or_path=args.model,
+            device=args.device,
+            image_size=args.image_size,
+            confidence=args.confidence,
+            fast=args.fast,
+            pages=args.pages,
+            prefilter=args.prefilter,
+            keep_existing_fields=args.keep_existing_fields,
+            cascade=args.cascade,
+            dedupe=args.dedupe,
+            detector=detector,
+        )
+        return f"exported {rows} detections from {len(inputs)} documents"
 
-    args = parser.parse_args()
+    if args.output.suffix.lower() == ".json":
+        fields = detect_fields(
+            args.input,
+            model_or_path=args.model,
+            device=args.device,
+            image_size=args.image_size,
+            confidence=args.confidence,
+            fast=args.fast,
+            pages=args.pages,
+            prefilter=args.prefilter,
+            keep_existing_fields=args.keep_existing_fields,
+            cascade=args.cascade,
+            dedupe=args.dedupe,
+            detector=detector,
+        )
+        args.output.write_text(
+            json.dumps({"pages": [page.model_dump(mode="json") for page in fields]})
+        )
+        return None
 
     prepare_form(
         args.input,
@@ -63,7 +193,13 @@ def main():
         image_size=args.image_size,
         confidence=args.confidence,
         fast=args.fast,
+        pages=args.pages,
+        prefilter=args.prefilter,
+        cascade=args.cascade,
+        dedupe=args.dedupe,
+        detector=detector,
     )
+    return None
 
 
 if __name__ == "__main__":
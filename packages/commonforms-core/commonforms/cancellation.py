@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import threading
+
+from commonforms.exceptions import ProcessingCancelledError
+
+
+class CancellationToken:
+    """
+    Thread-safe flag for stopping a running pipeline. Rendering, detection and
+    writing check it between pages, so a cancelled run stops within about one
+    page of work by raising ProcessingCancelledError.
+    """
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise ProcessingCancelledError
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from commonforms.utils import Widget
+
+
+@dataclass
+class CascadePolicy:
+    """
+    When a page's first-stage (FFDNet-S) detections are ambiguous enough to be
+    worth running the large model on it. Every signal is computed from the
+    small model's boxes, so screening costs nothing beyond the small pass.
+    """
+
+    # detections scoring below this (but above the detection threshold) are
+    # uncertain; a page escalates once they make up `uncertain_share` of it
+    uncertain_confidence: float = 0.5
+    uncertain_share: float = 0.25
+    # escalate when boxes of different classes overlap by at least this IoU,
+    # i.e. the small model couldn't decide what a field is
+    class_overlap_iou: float = 0.3
+    # escalate when a cell of a grid_size x grid_size grid over the page holds
+    # the centers of more than max_cell_widgets boxes (dense tables and grids)
+    grid_size: int = 8
+    max_cell_widgets: int = 12
+    # pages that reach the detector aren't blank (the prefilter skips those),
+    # so finding nothing on one is more likely a miss than a fieldless page
+    escalate_empty: bool = True
+    # on escalated pages, first-stage detections at least this confident are
+    # kept when the large model has no box overlapping them by `match_iou`
+    keep_confidence: float = 0.8
+    match_iou: float = 0.5
+
+
+@dataclass
+class EscalationDecision:
+    page: int
+    reasons: list[str]
+
+
+@dataclass
+class CascadeReport:
+    pages: int = 0
+    escalated: list[EscalationDecision] = field(default_factory=list)
+
+    @property
+    def escalation_rate(self) -> float:
+        return len(self.escalated) / self.pages if self.pages else 0.0
+
+
+def escalation_reasons(widgets: list[Widget], policy: CascadePolicy) -> list[str]:
+    """Why a page's first-stage detections should be re-checked, if at all."""
+    if not widgets:
+        return ["empty"] if policy.escalate_empty else []
+
+    boxes, classes, scores = widget_arrays(widgets)
+    reasons = []
+    if np.mean(scores < policy.uncertain_confidence) >= policy.uncertain_share:
+        reasons.append("low_confidence")
+
+    overlaps = iou_matrix(boxes, boxes)
+    different_class = classes[:, np.newaxis] != classes[np.newaxis, :]
+    if np.any(overlaps[different_class] >= policy.class_overlap_iou):
+        reasons.append("class_overlap")
+
+    centers = np.clip((boxes[:, :2] + boxes[:, 2:]) / 2, 0.0, np.nextafter(1.0, 0))
+    cells = (centers * policy.grid_size).astype(np.int64)
+    _, counts = np.unique(
+        cells[:, 1] * policy.grid_size + cells[:, 0], return_counts=True
+    )
+    if counts.max() > policy.max_cell_widgets:
+        reasons.append("dense")
+
+    return reasons
+
+
+def merge_detections(
+    first: list[Widget], second: list[Widget], policy: CascadePolicy
+) -> list[Widget]:
+    """
+    Merge the two stages on an escalated page: the large model's detections,
+    plus confident small-model detections it has nothing overlapping.
+    """
+    confident = [
+        widget
+        for widget in first
+        if widget.confidence is None or widget.confidence >= policy.keep_confidence
+    ]
+    if not confident or not second:
+        return second + confident
+
+    overlaps = iou_matrix(widget_arrays(confident)[0], widget_arrays(second)[0])
+    missed = overlaps.max(axis=1) < policy.match_iou
+    return second + [widget for widget, keep in zip(confident, missed) if keep]
+
+
+def widget_arrays(
+    widgets: list[Widget],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Boxes (N x 4, x0 y0 x1 y1), class names and scores of `widgets`."""
+    boxes = np.array(
+        [
+            (w.bounding_box.x0, w.bounding_box.y0, w.bounding_box.x1, w.bounding_box.y1)
+            for w in widgets
+        ],
+        dtype=np.float64,
+    ).reshape(-1, 4)
+    classes = np.array([w.widget_type for w in widgets])
+    # widgets that didn't come from the detector count as certain
+    scores = np.array(
+        [1.0 if w.confidence is None else w.confidence for w in widgets],
+        dtype=np.float64,
+    )
+    return boxes, classes, scores
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of two sets of (x0, y0, x1, y1) boxes, as an N x M array."""
+    top_left = np.maximum(a[:, np.newaxis, :2], b[np.newaxis, :, :2])
+    bottom_right = np.minimum(a[:, np.newaxis, 2:], b[np.newaxis, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0.0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    union = area_a[:, np.newaxis] + area_b[np.newaxis, :] - intersection
+    return np.divide(
+        intersection, union, out=np.zeros_like(intersection), where=union > 0
+    )
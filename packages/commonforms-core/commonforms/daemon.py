@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import traceback
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from commonforms import exceptions
+
+if TYPE_CHECKING:
+    from commonforms.inference import FFDNetDetector
+
+# requests and replies are single JSON lines; a request is a command line,
+# so this is generous
+MAX_REQUEST_BYTES = 1 << 20
+
+
+class DaemonUnavailableError(Exception):
+    """Raised when no daemon is listening on the socket."""
+
+
+class DaemonError(Exception):
+    """Raised for a failure inside the daemon that has no local equivalent."""
+
+
+class DetectorCache:
+    """Loaded detectors, one per model configuration, kept for the daemon's life."""
+
+    def __init__(self) -> None:
+        self._detectors: dict[tuple, FFDNetDetector] = {}
+
+    def get(
+        self,
+        model_or_path: str,
+        *,
+        device: int | str = "cpu",
+        fast: bool = False,
+        cascade: bool = False,
+        dedupe: bool = False,
+    ) -> FFDNetDetector:
+        from commonforms.inference import FFDNetDetector
+
+        key = (model_or_path, device, fast, cascade, dedupe)
+        if key not in self._detectors:
+            self._detectors[key] = FFDNetDetector(
+                model_or_path, device=device, fast=fast, cascade=cascade, dedupe=dedupe
+            )
+        return self._detectors[key]
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: DetectorDaemon
+
+    def handle(self) -> None:
+        line = self.rfile.readline(MAX_REQUEST_BYTES)
+        try:
+            request = json.loads(line)
+            message = self.server.execute(request["argv"], Path(request["cwd"]))
+            reply = {"ok": True, "message": message}
+        except SystemExit as exc:
+            # argparse rejected the command line
+            reply = {"ok": False, "error": "UsageError", "detail": str(exc.code)}
+        except Exception as exc:  # noqa: BLE001
+            traceback.print_exc()
+            reply = {"ok": False, "error": type(exc).__name__, "detail": str(exc)}
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class DetectorDaemon(socketserver.UnixStreamServer):
+    """
+    Runs `commonforms` command lines sent over a Unix socket with detectors
+    that stay loaded between them. Requests are handled one at a time, in
+    order of arrival, since a detector can't be shared between threads.
+    """
+
+    def __init__(self, socket_path: str | Path) -> None:
+        self.socket_path = Path(socket_path)
+        self.detectors = DetectorCache()
+        _remove_stale_socket(self.socket_path)
+        super().__init__(str(self.socket_path), _RequestHandler)
+
+    def server_bind(self) -> None:
+        # only the owner may hand the daemon work (and paths to read and
+        # write); the socket is created owner-only rather than chmod-ed after
+        # bind, which would leave it open to others for a moment
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def execute(self, argv: list[str], cwd: Path) -> str | None:
+        from commonforms.__main__ import build_parser, run
+
+        args = build_parser().parse_args(argv)
+        # paths are relative to the client's working directory, not ours
+        args.input = cwd / args.input
+        args.output = cwd / args.output
+        model = cwd / args.model
+        if not Path(args.model).is_absolute() and model.exists():
+            args.model = str(model)
+        return run(args, self.detectors)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.socket_path.unlink(missing_ok=True)
+
+
+def forward(socket_path: str | Path, argv: list[str], cwd: Path) -> str | None:
+    """
+    Have the daemon on `socket_path` run a command line and return its
+    message. Raises DaemonUnavailableError if nothing is listening; errors
+    inside the daemon are raised here as the same exception type where the
+    package defines it.
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            client.connect(str(socket_path))
+        except (FileNotFoundError, ConnectionRefusedError, PermissionError) as exc:
+            # a socket we may not use (another user's daemon) counts as none
+            raise DaemonUnavailableError(str(exc)) from exc
+
+        request = {"argv": argv, "cwd": str(cwd)}
+        client.sendall(json.dumps(request).encode() + b"\n")
+        with client.makefile("rb") as replies:
+            line = replies.readline()
+    finally:
+        client.close()
+
+    if not line:
+        raise DaemonError("The daemon closed the connection without replying.")
+    reply = json.loads(line)
+    if reply["ok"]:
+        return reply["message"]
+
+    error = getattr(exceptions, reply["error"], None)
+    if isinstance(error, type) and issubclass(error, Exception):
+        raise error(reply["detail"])
+    if reply["error"] == "UsageError":
+        sys.exit(reply["detail"])
+    raise DaemonError(f"{reply['error']}: {reply['detail']}")
+
+
+def serve_main(argv: list[str]) -> None:
+    parser = ArgumentParser(
+        prog="commonforms serve",
+        description="Keep detectors loaded and run `commonforms ... --socket PATH` calls sent to them",
+    )
+    parser.add_argument(
+        "--socket", type=Path, required=True, help="Unix socket to listen on"
+    )
+    parser.add_argument(
+        "--model",
+        action="append",
+        default=None,
+        help="Load and warm up this model at startup (repeatable; others load on first use)",
+    )
+    parser.add_argument(
+        "--device", default="cpu", help="Device of the preloaded models"
+    )
+    parser.add_argument(
+        "--fast", action="store_true", help="Preload the ONNX (--fast) models"
+    )
+    args = parser.parse_args(argv)
+
+    daemon = DetectorDaemon(args.socket)
+    for model in args.model or []:
+        _warm_up(daemon.detectors.get(model, device=args.device, fast=args.fast))
+
+    # a plain `kill` should still remove the socket file
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"commonforms daemon listening on {args.socket}", flush=True)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.server_close()
+
+
+def _warm_up(detector: FFDNetDetector) -> None:
+    """Run the detector once on a blank Letter page, so lazy setup is done."""
+    import numpy as np
+
+    from commonforms.utils import Page
+
+    blank = np.full((792, 612, 3), 255, dtype=np.uint8)
+    detector.extract_widgets([Page(image=blank, width=612, height=792)])
+
+
+def _remove_stale_socket(socket_path: Path) -> None:
+    """Remove a socket file left behind by a daemon that is no longer running."""
+    if not socket_path.exists():
+        return
+    if not stat.S_ISSOCK(socket_path.stat().st_mode):
+        raise OSError(f"{socket_path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(socket_path))
+    except ConnectionRefusedError:
+        socket_path.unlink()
+        return
+    finally:
+        probe.close()
+    raise OSError(f"A daemon is already listening on {socket_path}")
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class DedupePolicy:
+    """
+    How duplicate detections are suppressed after the detector has run. The
+    fast path predicts with NMS effectively disabled and the accurate path's
+    test-time augmentation leaves near-copies behind, and every duplicate
+    would otherwise become a stacked field in the output PDF.
+    """
+
+    # boxes of the same class overlapping by at least this IoU are duplicates
+    iou_threshold: float = 0.5
+    # as are boxes covering this much of the smaller one (nested near-copies
+    # that TTA produces at different scales have a low IoU)
+    containment_threshold: float = 0.9
+    # replace each kept box by the score-weighted mean of its duplicates
+    # instead of keeping the top-scoring box as-is
+    merge: bool = True
+    # only boxes of the same class suppress each other
+    class_aware: bool = True
+    # side of the spatial index cells, as a fraction of the page; boxes are
+    # only compared with boxes sharing a cell
+    cell_size: float = 0.05
+
+
+@dataclass
+class DedupeReport:
+    before: int = 0
+    after: int = 0
+
+    def __add__(self, other: DedupeReport) -> DedupeReport:
+        return DedupeReport(self.before + other.before, self.after + other.after)
+
+
+def dedupe_boxes(
+    boxes: np.ndarray,
+    classes: np.ndarray,
+    scores: np.ndarray,
+    policy: DedupePolicy,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Class-aware NMS over one page of detections: `boxes` is N x 4 (x0, y0, x1,
+    y1, normalized to the page), with a class id and score per box. Returns
+    the surviving boxes, classes and scores, highest score first.
+
+    Candidate pairs come from a uniform grid over the page, so the work grows
+    with the number of nearby boxes rather than quadratically with the page.
+    """
+    count = len(boxes)
+    if count < 2:
+        return boxes, classes, scores
+
+    first, second = _candidate_pairs(
+        boxes, classes if policy.class_aware else None, policy
+    )
+    iou, containment = _overlaps(boxes[first], boxes[second])
+    duplicate = (iou >= policy.iou_threshold) | (
+        containment >= policy.containment_threshold
+    )
+    first, second = first[duplicate], second[duplicate]
+
+    # greedy NMS in score order over the (sparse) duplicate graph
+    order = np.argsort(-scores, kind="stable")
+    rank = np.empty(count, dtype=np.int64)
+    rank[order] = np.arange(count)
+    # orient every edge from the higher-scoring box to the lower-scoring one
+    swap = rank[first] > rank[second]
+    winner = np.where(swap, second, first)
+    loser = np.where(swap, first, second)
+    edge_order = np.argsort(winner, kind="stable")
+    winner, loser = winner[edge_order], loser[edge_order]
+    starts = np.searchsorted(winner, np.arange(count + 1))
+
+    keeper = np.full(count, -1, dtype=np.int64)
+    for box in order:
+        if keeper[box] >= 0:
+            continue
+        keeper[box] = box
+        neighbours = loser[starts[box] : starts[box + 1]]
+        neighbours = neighbours[keeper[neighbours] < 0]
+        keeper[neighbours] = box
+
+    kept = order[keeper[order] == order]
+    if not policy.merge:
+        return boxes[kept], classes[kept], scores[kept]
+
+    # score-weighted mean of every cluster, gathered with one bincount per side
+    slot = np.empty(count, dtype=np.int64)
+    slot[kept] = np.arange(len(kept))
+    cluster = slot[keeper]
+    weights = np.bincount(cluster, weights=scores, minlength=len(kept))
+    sums = np.stack(
+        [
+            np.bincount(cluster, weights=boxes[:, side] * scores, minlength=len(kept))
+            for side in range(4)
+        ],
+        axis=1,
+    )
+    merged = sums / np.maximum(weights, np.finfo(np.float64).tiny)[:, np.newaxis]
+    return merged.astype(boxes.dtype), classes[kept], scores[kept]
+
+
+def _candidate_pairs(
+    boxes: np.ndarray,
+    classes: np.ndarray | None,
+    policy: DedupePolicy,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Index pairs (i < j) of boxes sharing at least one grid cell (and class)."""
+    cells = max(1, int(np.ceil(1.0 / policy.cell_size)))
+    lower = np.clip((boxes[:, :2] / policy.cell_size).astype(np.int64), 0, cells - 1)
+    upper = np.clip((boxes[:, 2:] / policy.cell_size).astype(np.int64), 0, cells - 1)
+    upper = np.maximum(upper, lower)
+    spans = upper - lower + 1
+    covered = spans[:, 0] * spans[:, 1]
+
+    # one entry per (box, covered cell)
+    box_ids = np.repeat(np.arange(len(boxes)), covered)
+    offsets = np.arange(covered.sum()) - np.repeat(
+        np.cumsum(covered) - covered, covered
+    )
+    columns = np.repeat(spans[:, 0], covered)
+    cell_x = np.repeat(lower[:, 0], covered) + offsets % columns
+    cell_y = np.repeat(lower[:, 1], covered) + offsets // columns
+    keys = cell_y * cells + cell_x
+    if classes is not None:
+        keys = np.repeat(classes.astype(np.int64), covered) * cells * cells + keys
+
+    entry_order = np.argsort(keys, kind="stable")
+    keys, box_ids = keys[entry_order], box_ids[entry_order]
+    # every entry pairs with the entries after it in the same cell
+    group_end = np.searchsorted(keys, keys, side="right")
+    following = group_end - np.arange(len(keys)) - 1
+    left = np.repeat(np.arange(len(keys)), following)
+    step = np.arange(following.sum()) - np.repeat(
+        np.cumsum(following) - following, following
+    )
+    right = left + step + 1
+
+    first = np.minimum(box_ids[left], box_ids[right])
+    second = np.maximum(box_ids[left], box_ids[right])
+    # boxes sharing several cells show up once per shared cell
+    pairs = np.unique(first * len(boxes) + second)
+    first, second = np.divmod(pairs, len(boxes))
+    distinct = first != second
+    return first[distinct], second[distinct]
+
+
+def _overlaps(a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """IoU and intersection over the smaller area of box pairs."""
+    size = np.clip(
+        np.minimum(a[:, 2:], b[:, 2:]) - np.maximum(a[:, :2], b[:, :2]), 0, None
+    )
+    intersection = size[:, 0] * size[:, 1]
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    union = area_a + area_b - intersection
+    smaller = np.minimum(area_a, area_b)
+    zeros = np.zeros_like(intersection)
+    iou = np.divide(intersection, union, out=zeros.copy(), where=union > 0)
+    containment = np.divide(intersection, smaller, out=zeros, where=smaller > 0)
+    return iou, containment
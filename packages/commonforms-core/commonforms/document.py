@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import io
+import mmap
+import threading
+from pathlib import Path
+from typing import BinaryIO, Self
+
+import pypdfium2
+import pypdfium2.raw as pdfium_c
+
+from commonforms.cancellation import CancellationToken
+from commonforms.exceptions import EncryptedPdfError
+from commonforms.utils import (
+    Page,
+    PageContent,
+    PageGeometry,
+    PageSelection,
+    select_pages,
+)
+
+# a PDF on disk, in memory, or in an open binary file
+PdfSource = str | Path | bytes | bytearray | memoryview | BinaryIO
+
+# pdfium is not thread-safe, even across documents, and ctypes releases the
+# GIL around its calls; every call into it holds this lock. Renders take it
+# page by page, so concurrent jobs interleave rather than queue
+PDFIUM_LOCK = threading.RLock()
+
+
+class _BufferStream(io.RawIOBase):
+    """
+    Read-only, seekable stream over a shared buffer (bytes, memoryview or mmap).
+
+    Every consumer (pdfium, pypdf) gets its own cursor over the same memory, so
+    the file is read from disk once no matter how many parsers look at it.
+    """
+
+    def __init__(self, buffer: bytes | memoryview | mmap.mmap) -> None:
+        super().__init__()
+        self._buffer = buffer
+        self._size = len(buffer)
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        self._position = max(0, position)
+        return self._position
+
+    def readinto(self, target) -> int:
+        end = min(self._position + len(target), self._size)
+        chunk = self._buffer[self._position : end]
+        target[: len(chunk)] = chunk
+        self._position = end
+        return len(chunk)
+
+
+class DocumentSession:
+    """
+    A PDF opened once and shared by every stage of the pipeline.
+
+    The file is memory-mapped (falling back to a single read for files that
+    can't be mapped) and parsed by pdfium a single time; validation, page
+    geometry and rendering are all served from that handle, and the writer
+    re-uses the same buffer and the precomputed geometry instead of going back
+    to disk. A document that is already in memory can be passed as bytes, a
+    bytearray or memoryview (used in place, so don't modify it while the
+    session is open) or an open binary file, which is read from its current
+    position.
+    """
+
+    def __init__(self, pdf_path: PdfSource) -> None:
+        self._mmap = None
+        if isinstance(pdf_path, (str, Path)):
+            self.path = Path(pdf_path)
+            self._buffer = self._map(self.path)
+        else:
+            self.path = None
+            self._buffer = read_buffer(pdf_path)
+
+        with PDFIUM_LOCK:
+            try:
+                self.document = pypdfium2.PdfDocument(_BufferStream(self._buffer))
+            except pypdfium2._helpers.misc.PdfiumError as exc:
+                self._release()
+                raise EncryptedPdfError from exc
+
+            # mirror formalpdf: initialize the form environment so existing
+            # fields are drawn into the rendered page images
+            if self.document.get_formtype() != pdfium_c.FORMTYPE_NONE:
+                self.document.init_forms()
+            self._page_count = len(self.document)
+
+        self._geometry: dict[int, PageGeometry] = {}
+
+    def _map(self, path: Path) -> bytes | memoryview | mmap.mmap:
+        # the mapping keeps its own handle, so the file needn't stay open
+        with open(path, "rb") as file:
+            try:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # empty files and some special files can't be mapped
+                return file.read()
+        return self._mmap
+
+    def __len__(self) -> int:
+        return self._page_count
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    @property
+    def geometry(self) -> list[PageGeometry]:
+        """Per-page geometry (the rendered area in PDF points) for every page."""
+        return [self.page_geometry(ix) for ix in range(len(self))]
+
+    def page_geometry(self, page_ix: int) -> PageGeometry:
+        """Geometry of a single page, computed on first use and cached."""
+        if page_ix not in self._geometry:
+            self._geometry[page_ix] = self._compute_geometry(page_ix)
+        return self._geometry[page_ix]
+
+    def page_indices(self, pages: PageSelection | None = None) -> list[int]:
+        """Zero-based indices of the selected pages (all pages by default)."""
+        return select_pages(pages, len(self))
+
+    def _compute_geometry(self, page_ix: int) -> PageGeometry:
+        with PDFIUM_LOCK:
+            return self._read_geometry(page_ix)
+
+    def _read_geometry(self, page_ix: int) -> PageGeometry:
+        page = self.document[page_ix]
+        try:
+            # the bounding box is the CropBox clipped to the MediaBox, with
+            # inherited boxes resolved; i.e. exactly the area pdfium renders
+            rect = pdfium_c.FS_RECTF()
+            pdfium_c.FPDF_GetPageBoundingBox(page, rect)
+            width, height = page.get_size()
+            return PageGeometry(
+                width=width,
+                height=height,
+                left=rect.left,
+                bottom=rect.bottom,
+                right=rect.right,
+                top=rect.top,
+            )
+        finally:
+            page.close()
+
+    def page_content(self, page_ix: int) -> PageContent:
+        """Count text characters, page objects and widget annotations on a page."""
+        with PDFIUM_LOCK:
+            return self._read_content(page_ix)
+
+    def _read_content(self, page_ix: int) -> PageContent:
+        page = self.document[page_ix]
+        textpage = page.get_textpage()
+        try:
+            total_objects = pdfium_c.FPDFPage_CountObjects(page)
+            image_objects = sum(
+                1
+                for i in range(total_objects)
+                if pdfium_c.FPDFPageObj_GetType(pdfium_c.FPDFPage_GetObject(page, i))
+                == pdfium_c.FPDF_PAGEOBJ_IMAGE
+            )
+
+            widget_annotations = 0
+            for i in range(pdfium_c.FPDFPage_GetAnnotCount(page)):
+                annotation = pdfium_c.FPDFPage_GetAnnot(page, i)
+                if (
+                    pdfium_c.FPDFAnnot_GetSubtype(annotation)
+                    == pdfium_c.FPDF_ANNOT_WIDGET
+                ):
+                    widget_annotations += 1
+                pdfium_c.FPDFPage_CloseAnnot(annotation)
+
+            return PageContent(
+                text_chars=textpage.count_chars(),
+                image_objects=image_objects,
+                total_objects=total_objects,
+                widget_annotations=widget_annotations,
+            )
+        finally:
+            textpage.close()
+            page.close()
+
+    def render(
+        self,
+        dpi: int = 72,
+        pages: PageSelection | None = None,
+        *,
+        as_array: bool = False,
+        grayscale: bool = False,
+        cancel: CancellationToken | None = None,
+    ) -> list[Page]:
+        """
+        Render the selected pages. With `as_array`, each image is a NumPy view of
+        the pdfium bitmap buffer in BGR order (HxWx3), which is exactly what
+        the detector consumes, so no PIL image or channel swap is ever made.
+        `grayscale` renders single-channel (HxW) bitmaps at a third of the
+        memory; the detector expands them to three channels on the way in.
+        """
+        rendered = []
+        for page_ix in self.page_indices(pages):
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            with PDFIUM_LOCK:
+                page = self.document[page_ix]
+                try:
+                    bitmap = page.render(
+                        scale=dpi / 72, rotation=0, grayscale=grayscale
+                    )
+                    # new_native bitmaps own a ctypes buffer that the array
+                    # view keeps alive, so the view outlives the bitmap safely
+                    image = bitmap.to_numpy() if as_array else bitmap.to_pil()
+                    bitmap.close()
+                finally:
+                    page.close()
+            rendered.append(
+                Page(
+                    image=image,
+                    width=bitmap.width,
+                    height=bitmap.height,
+                    index=page_ix,
+                )
+            )
+        return rendered
+
+    def stream(self) -> io.RawIOBase:
+        """A fresh read-only stream over the document bytes (e.g. for pypdf)."""
+        return _BufferStream(self._buffer)
+
+    def close(self) -> None:
+        with PDFIUM_LOCK:
+            self.document.close()
+        self._release()
+
+    def _release(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+def read_buffer(
+    source: bytes | bytearray | memoryview | BinaryIO,
+) -> bytes | memoryview:
+    """The bytes of an in-memory PDF, without copying where possible."""
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, (bytearray, memoryview)):
+        return memoryview(source).cast("B")
+    return source.read()
+
+
+def pdf_stream(source: PdfSource) -> str | Path | io.RawIOBase:
+    """`source` in a form pypdf can read: a path, or a stream over its bytes."""
+    if isinstance(source, (str, Path)):
+        return source
+    return _BufferStream(read_buffer(source))
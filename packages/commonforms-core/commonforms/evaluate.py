@@ -0,0 +1,367 @@
+from __future__ import annotations
+
+import json
+import multiprocessing
+import resource
+import sys
+import time
+from argparse import ArgumentParser
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from commonforms.cascade import iou_matrix
+from commonforms.utils import Page
+
+CLASS_NAMES = ("TextBox", "ChoiceButton", "Signature")
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff"}
+# COCO-style IoU thresholds for mAP@[.5:.95]
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+@dataclass(frozen=True)
+class DetectorConfig:
+    model: str = "FFDNet-L"
+    fast: bool = False
+    image_size: int = 1600
+    confidence: float = 0.3
+
+    @property
+    def label(self) -> str:
+        runtime = "onnx" if self.fast else "pt"
+        return f"{self.model}/{runtime}/{self.image_size}/conf={self.confidence:g}"
+
+
+@dataclass
+class LabeledPage:
+    image_path: Path
+    # N x 4 normalized (x0, y0, x1, y1) and class ids, as in the detector output
+    boxes: np.ndarray
+    classes: np.ndarray
+
+
+@dataclass
+class EvalResult:
+    config: DetectorConfig
+    pages: int
+    seconds: float
+    pages_per_second: float
+    peak_rss_mb: float
+    map50: float
+    map50_95: float
+    # per class name: ap50, ap50_95, recall (at IoU 0.5) and label count
+    per_class: dict[str, dict[str, float]] = field(default_factory=dict)
+
+
+def load_labeled_pages(root: str | Path, limit: int | None = None) -> list[LabeledPage]:
+    """
+    Read a labeled page set in the ultralytics/YOLO layout the FFDNet models
+    are trained on: `images/**/<name>.<ext>` with `labels/**/<name>.txt`
+    holding one `class cx cy w h` line (normalized) per field. Pages without
+    a label file have no fields.
+    """
+    root = Path(root)
+    images = sorted(
+        path
+        for path in (root / "images").rglob("*")
+        if path.suffix.lower() in IMAGE_SUFFIXES
+    )
+    pages = []
+    for image_path in images[:limit]:
+        label_path = (
+            root / "labels" / image_path.relative_to(root / "images")
+        ).with_suffix(".txt")
+        rows = np.zeros((0, 5))
+        if label_path.exists():
+            rows = np.loadtxt(label_path, ndmin=2).reshape(-1, 5)
+        cx, cy, w, h = rows[:, 1:].T
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        pages.append(LabeledPage(image_path, boxes, rows[:, 0].astype(np.int64)))
+    return pages
+
+
+def average_precision(
+    detections: list[tuple[np.ndarray, np.ndarray, np.ndarray]],
+    labels: list[LabeledPage],
+    cls_id: int,
+    iou_threshold: float,
+) -> tuple[float, float, int]:
+    """
+    AP (101-point interpolated, as in COCO) and recall of one class at one IoU
+    threshold, from per-page detector output (boxes, classes, scores) and the
+    matching labels. Returns (ap, recall, number of labeled fields).
+    """
+    scores, matched = [], []
+    total = 0
+    for (boxes, classes, page_scores), label in zip(detections, labels):
+        truth = label.boxes[label.classes == cls_id]
+        total += len(truth)
+        mine = classes == cls_id
+        boxes, page_scores = boxes[mine], page_scores[mine]
+        order = np.argsort(-page_scores, kind="stable")
+        boxes, page_scores = boxes[order], page_scores[order]
+
+        hits = np.zeros(len(boxes), dtype=bool)
+        if len(truth) and len(boxes):
+            overlaps = iou_matrix(boxes, truth)
+            taken = np.zeros(len(truth), dtype=bool)
+            # greedy matching, highest score first
+            for ix, row in enumerate(overlaps):
+                candidates = np.where(~taken & (row >= iou_threshold))[0]
+                if len(candidates):
+                    best = candidates[np.argmax(row[candidates])]
+                    taken[best] = True
+                    hits[ix] = True
+        scores.append(page_scores)
+        matched.append(hits)
+
+    if total == 0:
+        return float("nan"), float("nan"), 0
+    scores = np.concatenate(scores) if scores else np.zeros(0)
+    matched = np.concatenate(matched) if matched else np.zeros(0, dtype=bool)
+    order = np.argsort(-scores, kind="stable")
+    true_positives = np.cumsum(matched[order])
+    recall = true_positives / total
+    precision = true_positives / np.arange(1, len(order) + 1)
+    if len(order) == 0:
+        return 0.0, 0.0, total
+
+    # precision envelope, sampled at 101 recall points
+    envelope = np.maximum.accumulate(precision[::-1])[::-1]
+    points = np.linspace(0, 1, 101)
+    positions = np.searchsorted(recall, points, side="left")
+    sampled = np.where(
+        positions < len(envelope),
+        envelope[np.minimum(positions, len(envelope) - 1)],
+        0.0,
+    )
+    return float(sampled.mean()), float(recall[-1]), total
+
+
+def score(
+    config: DetectorConfig,
+    detections: list[tuple[np.ndarray, np.ndarray, np.ndarray]],
+    labels: list[LabeledPage],
+    *,
+    seconds: float,
+    peak_rss_mb: float,
+) -> EvalResult:
+    per_class = {}
+    for cls_id, name in enumerate(CLASS_NAMES):
+        ap50, recall, count = average_precision(detections, labels, cls_id, 0.5)
+        if count == 0:
+            continue
+        ap50_95 = np.mean(
+            [
+                average_precision(detections, labels, cls_id, threshold)[0]
+                for threshold in IOU_THRESHOLDS
+            ]
+        )
+        per_class[name] = {
+            "ap50": round(ap50, 4),
+            "ap50_95": round(float(ap50_95), 4),
+            "recall": round(recall, 4),
+            "labels": count,
+        }
+
+    def mean(metric: str) -> float:
+        values = [metrics[metric] for metrics in per_class.values()]
+        return round(float(np.mean(values)), 4) if values else 0.0
+
+    return EvalResult(
+        config=config,
+        pages=len(labels),
+        seconds=round(seconds, 3),
+        pages_per_second=round(len(labels) / seconds, 3) if seconds > 0 else 0.0,
+        peak_rss_mb=round(peak_rss_mb, 1),
+        map50=mean("ap50"),
+        map50_95=mean("ap50_95"),
+        per_class=per_class,
+    )
+
+
+def evaluate_config(
+    config: DetectorConfig, labels: list[LabeledPage], device: int | str = "cpu"
+) -> EvalResult:
+    """
+    Detect every labeled page with one configuration and score it. Only the
+    detector calls are timed (images are decoded beforehand and the model is
+    warmed up on the first page); peak RSS is that of the whole process, so
+    run each configuration in a fresh process (as `evaluate` does) to compare
+    them.
+    """
+    from commonforms.inference import FFDNetDetector
+
+    detector = FFDNetDetector(config.model, device=device, fast=config.fast)
+    detections = []
+    seconds = 0.0
+    for ix, label in enumerate(labels):
+        with Image.open(label.image_path) as image:
+            image = image.convert("RGB")
+        page = Page(image=image, width=image.width, height=image.height, index=0)
+        if ix == 0:
+            detector.extract_boxes([page], config.confidence, config.image_size)
+
+        started = time.perf_counter()
+        result = detector.extract_boxes([page], config.confidence, config.image_size)
+        seconds += time.perf_counter() - started
+        empty = (np.zeros((0, 4)), np.zeros(0, dtype=np.int64), np.zeros(0))
+        detections.append(tuple(result.get(0, empty)))
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+    return score(config, detections, labels, seconds=seconds, peak_rss_mb=peak_mb)
+
+
+def sweep(
+    models: list[str],
+    fast_modes: list[bool],
+    image_sizes: list[int],
+    confidences: list[float],
+) -> list[DetectorConfig]:
+    configs = []
+    for model in models:
+        for fast in fast_modes:
+            # the ONNX models only run at 1216
+            sizes = [1216] if fast else image_sizes
+            for image_size in sizes:
+                for confidence in confidences:
+                    configs.append(DetectorConfig(model, fast, image_size, confidence))
+    return configs
+
+
+def pareto_frontier(results: list[EvalResult]) -> list[EvalResult]:
+    """
+    Results no other result beats on accuracy (mAP@.5), throughput and peak
+    memory at once, fastest first.
+    """
+
+    def dominates(a: EvalResult, b: EvalResult) -> bool:
+        better_or_equal = (
+            a.map50 >= b.map50
+            and a.pages_per_second >= b.pages_per_second
+            and a.peak_rss_mb <= b.peak_rss_mb
+        )
+        strictly_better = (
+            a.map50 > b.map50
+            or a.pages_per_second > b.pages_per_second
+            or a.peak_rss_mb < b.peak_rss_mb
+        )
+        return better_or_equal and strictly_better
+
+    frontier = [
+        result
+        for result in results
+        if not any(dominates(other, result) for other in results)
+    ]
+    return sorted(frontier, key=lambda result: -result.pages_per_second)
+
+
+def evaluate(
+    dataset: str | Path,
+    configs: list[DetectorConfig],
+    *,
+    device: int | str = "cpu",
+    limit: int | None = None,
+) -> list[EvalResult]:
+    """Evaluate each configuration in its own process, so peak RSS is its own."""
+    labels = load_labeled_pages(dataset, limit)
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for config in configs:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(evaluate_config, (config, labels, device)))
+    return results
+
+
+def format_table(results: list[EvalResult], frontier: list[EvalResult]) -> str:
+    on_frontier = {id(result) for result in frontier}
+    header = ["config", "mAP50", "mAP50-95", *CLASS_NAMES, "pages/s", "peak MB", ""]
+    rows = [header]
+    for result in results:
+        recalls = [
+            f"{result.per_class[name]['recall']:.3f}"
+            if name in result.per_class
+            else "-"
+            for name in CLASS_NAMES
+        ]
+        rows.append(
+            [
+                result.config.label,
+                f"{result.map50:.3f}",
+                f"{result.map50_95:.3f}",
+                *recalls,
+                f"{result.pages_per_second:.2f}",
+                f"{result.peak_rss_mb:.0f}",
+                "*" if id(result) in on_frontier else "",
+            ]
+        )
+    widths = [max(len(row[ix]) for row in rows) for ix in range(len(header))]
+    lines = [
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows
+    ]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    lines.append("per-class columns are recall at IoU 0.5; * = Pareto frontier")
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def main() -> None:
+    parser = ArgumentParser(
+        prog="commonforms-eval",
+        description="Measure detection accuracy and cost of detector configurations on a labeled page set",
+    )
+    parser.add_argument(
+        "dataset",
+        type=Path,
+        help="Directory with images/ and YOLO-format labels/ (class cx cy w h per line)",
+    )
+    parser.add_argument("--models", nargs="+", default=["FFDNet-S", "FFDNet-L"])
+    parser.add_argument(
+        "--fast",
+        choices=["off", "on", "both"],
+        default="both",
+        help="Evaluate the PyTorch models, the ONNX (--fast) models, or both",
+    )
+    parser.add_argument("--image-sizes", nargs="+", type=int, default=[1216, 1600])
+    parser.add_argument("--confidences", nargs="+", type=float, default=[0.3])
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument(
+        "--limit", type=int, default=None, help="Only evaluate the first N pages"
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="Write the results and frontier as JSON",
+    )
+    args = parser.parse_args()
+
+    fast_modes = {"off": [False], "on": [True], "both": [False, True]}[args.fast]
+    configs = sweep(args.models, fast_modes, args.image_sizes, args.confidences)
+    results = evaluate(args.dataset, configs, device=args.device, limit=args.limit)
+    frontier = pareto_frontier(results)
+
+    print(format_table(results, frontier))
+    if args.output:
+        args.output.write_text(
+            json.dumps(
+                {
+                    "results": [_to_json(result) for result in results],
+                    "pareto_frontier": [_to_json(result) for result in frontier],
+                },
+                indent=2,
+            )
+        )
+
+
+def _to_json(result: EvalResult) -> dict:
+    payload = asdict(result)
+    payload["config"]["label"] = result.config.label
+    return payload
+
+
+if __name__ == "__main__":
+    main()
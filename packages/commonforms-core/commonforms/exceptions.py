@@ -1,2 +1,10 @@
 class EncryptedPdfError(Exception):
     pass
+
+
+class InvalidPageSelectionError(ValueError):
+    """Raised when a page selection matches no page of the document."""
+
+
+class ProcessingCancelledError(Exception):
+    """Raised when processing is stopped through a CancellationToken."""
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import zipfile
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+
+from commonforms.utils import Detections, PageGeometry
+
+# an export is a zip of .npy members (so np.load can open it too), written
+# as a series of chunks; each chunk holds these columns, one row per box
+COLUMNS = (
+    "document",
+    "page",
+    "page_width",
+    "page_height",
+    "widget_type",
+    "confidence",
+    "x0",
+    "y0",
+    "x1",
+    "y1",
+)
+DEFAULT_CHUNK_ROWS = 1 << 16
+
+
+class DetectionWriter:
+    """
+    Streams detections into a chunked `.npz` export without holding more than
+    `chunk_rows` boxes in memory.
+
+    Columns are stored compactly: page sizes (in PDF points), confidences and
+    box corners (fractions of the page, origin top-left) as float32, page
+    indices as int32, and document ids and widget types dictionary-encoded
+    as small integer codes next to the strings they stand for.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        class_names: Sequence[str],
+        *,
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    ) -> None:
+        self.archive = zipfile.ZipFile(
+            path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True
+        )
+        self.class_names = np.array(class_names)
+        self.chunk_rows = max(1, chunk_rows)
+        self.rows = 0
+        self.chunks = 0
+        self._documents: dict[str, int] = {}
+        self._pending: list[tuple[np.ndarray, ...]] = []
+        self._pending_rows = 0
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def add_page(
+        self,
+        document_id: str,
+        page: int,
+        geometry: PageGeometry,
+        detections: Detections,
+    ) -> None:
+        count = len(detections.boxes)
+        if count == 0:
+            return
+        code = self._documents.setdefault(document_id, len(self._documents))
+        boxes = np.asarray(detections.boxes, dtype=np.float32).reshape(-1, 4)
+        self._pending.append(
+            (
+                np.full(count, code, dtype=np.int32),
+                np.full(count, page, dtype=np.int32),
+                np.full(count, geometry.width, dtype=np.float32),
+                np.full(count, geometry.height, dtype=np.float32),
+                np.asarray(detections.classes, dtype=np.uint8),
+                np.asarray(detections.scores, dtype=np.float32),
+                *boxes.T,
+            )
+        )
+        self._pending_rows += count
+        if self._pending_rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        prefix = f"chunk{self.chunks:06d}"
+        columns = [np.concatenate(parts) for parts in zip(*self._pending)]
+        for name, column in zip(COLUMNS, columns):
+            self._write(f"{prefix}.{name}", column)
+        # the strings behind the codes; document ids are per chunk, so a chunk
+        # can be read on its own
+        self._write(f"{prefix}.document_ids", np.array(list(self._documents)))
+        self._write(f"{prefix}.class_names", self.class_names)
+
+        self.rows += self._pending_rows
+        self.chunks += 1
+        self._documents = {}
+        self._pending = []
+        self._pending_rows = 0
+
+    def close(self) -> None:
+        if self.archive.fp is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.archive.close()
+
+    def _write(self, name: str, array: np.ndarray) -> None:
+        with self.archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+            np.lib.format.write_array(member, array, allow_pickle=False)
+
+
+def iter_detections(path: str | Path) -> Iterator[dict[str, np.ndarray]]:
+    """
+    Read an export one chunk at a time, as a dict of column arrays with the
+    `document` and `widget_type` codes decoded back to strings. Only NumPy is
+    needed; the detector stack is never imported.
+    """
+    with zipfile.ZipFile(path) as archive:
+        prefixes = sorted({name.split(".", 1)[0] for name in archive.namelist()})
+        for prefix in prefixes:
+            chunk = {column: _read(archive, prefix, column) for column in COLUMNS}
+            documents = _read(archive, prefix, "document_ids")
+            chunk["document"] = documents[chunk["document"]]
+            class_names = _read(archive, prefix, "class_names")
+            chunk["widget_type"] = class_names[chunk["widget_type"]]
+            yield chunk
+
+
+def _read(archive: zipfile.ZipFile, prefix: str, column: str) -> np.ndarray:
+    with archive.open(f"{prefix}.{column}.npy") as member:
+        return np.lib.format.read_array(member, allow_pickle=False)
+
+
+def read_detections(path: str | Path) -> dict[str, np.ndarray]:
+    """Read a whole export into memory as one dict of column arrays."""
+    chunks = list(iter_detections(path))
+    if not chunks:
+        return {column: np.array([]) for column in COLUMNS}
+    return {
+        column: np.concatenate([chunk[column] for chunk in chunks])
+        for column in COLUMNS
+    }
@@ -1,3 +1,7 @@
+import io
+from pathlib import Path
+from typing import BinaryIO
+
 from pypdf import PdfWriter, PdfReader
 from pypdf.annotations import AnnotationDictionary
 from pypdf.generic import (
@@ -8,13 +12,16 @@ from pypdf.generic import (
     DictionaryObject,
 )
 
-from commonforms.utils import BoundingBox
+from commonforms.document import DocumentSession, PdfSource, pdf_stream
+from commonforms.utils import BoundingBox, PageGeometry
 
 
 def rect_for(bounding_box: BoundingBox, page) -> ArrayObject:
     # because the PDFs are rendered to images with the CropBox, we need to use
-    # that as the offset for where we insert the widgets
-    page = page.cropbox if page.cropbox else page.mediabox
+    # that as the offset for where we insert the widgets; precomputed geometry
+    # from a DocumentSession already describes exactly that box
+    if not isinstance(page, PageGeometry):
+        page = page.cropbox if page.cropbox else page.mediabox
     # here I'm flipping the page.top/page.bottom to change from top-left origin
     # to bottom-right origin; this results in a negative height, but the math
     # works out in the end
@@ -112,8 +119,15 @@ class Signature(AnnotationDictionary):
 
 
 class PyPdfFormCreator:
-    def __init__(self, input_path: str):
-        self.reader = PdfReader(input_path)
+    def __init__(self, input_path: PdfSource | DocumentSession):
+        # when handed an open DocumentSession, parse the already-mapped buffer
+        # and reuse its page geometry instead of reading the file again
+        if isinstance(input_path, DocumentSession):
+            self.document = input_path
+            self.reader = PdfReader(input_path.stream())
+        else:
+            self.document = None
+            self.reader = PdfReader(pdf_stream(input_path))
         # NOTE: Commenting out add_form_topname as it causes lazy loading issues with pages
         # self.reader.add_form_topname("original")
         self.writer = PdfWriter(clone_from=self.reader)
@@ -153,24 +167,42 @@ class PyPdfFormCreator:
         bounding_box: BoundingBox,
         multiline: bool = False,
     ) -> None:
-        rect = rect_for(bounding_box, self.writer.pages[page])
+        rect = rect_for(bounding_box, self._page_box(page))
         textbox = Textbox(name=name, rect=rect, multiline=multiline)
         self.writer.add_annotation(page_number=page, annotation=textbox)
 
     def add_checkbox(self, name: str, page: int, bounding_box: BoundingBox) -> None:
-        rect = rect_for(bounding_box, self.writer.pages[page])
+        rect = rect_for(bounding_box, self._page_box(page))
         checkbox = Checkbox(name=name, rect=rect)
         self.writer.add_annotation(page_number=page, annotation=checkbox)
 
     def add_signature(self, name: str, page: int, bounding_box: BoundingBox) -> None:
-        rect = rect_for(bounding_box, self.writer.pages[page])
+        rect = rect_for(bounding_box, self._page_box(page))
         signature = Signature(name=name, rect=rect)
         self.writer.add_annotation(page_number=page, annotation=signature)
 
-    def save(self, output_path: str) -> None:
+    def _page_box(self, page: int):
+        if self.document is not None:
+            return self.document.page_geometry(page)
+        return self.writer.pages[page]
+
+    def save(self, output_path: str | Path | BinaryIO | None = None) -> bytes | None:
+        """
+        Write the PDF to a path or an open binary stream (e.g. a BytesIO), or
+        return it as bytes when no output is given.
+        """
         self.writer.reattach_fields()
+        if output_path is None:
+            buffer = io.BytesIO()
+            self.writer.write(buffer)
+            return buffer.getvalue()
+        if not isinstance(output_path, (str, Path)):
+            # an already-open binary stream
+            self.writer.write(output_path)
+            return None
         with open(output_path, "wb") as fp:
             self.writer.write(fp)
+        return None
 
     def close(self) -> None:
         self.writer.close()
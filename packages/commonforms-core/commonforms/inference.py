@@ -1,18 +1,48 @@
 from __future__ import annotations
+from dataclasses import replace
 from ultralytics import YOLO
 from pathlib import Path
+from typing import BinaryIO
+from collections.abc import Callable, Iterable
+import numpy as np
 
-from commonforms.utils import BoundingBox, Page, Widget
+from commonforms.cancellation import CancellationToken
+from commonforms.cascade import (
+    CascadePolicy,
+    CascadeReport,
+    EscalationDecision,
+    escalation_reasons,
+    merge_detections,
+    widget_arrays,
+)
+from commonforms.dedupe import DedupePolicy, DedupeReport, dedupe_boxes
+from commonforms.utils import (
+    BoundingBox,
+    Detections,
+    Page,
+    PageFields,
+    PageSelection,
+    Widget,
+)
+from commonforms.document import DocumentSession, PdfSource
+from commonforms.exceptions import InvalidPageSelectionError
+from commonforms.export import DEFAULT_CHUNK_ROWS, DetectionWriter
 from commonforms.form_creator import PyPdfFormCreator
-from commonforms.exceptions import EncryptedPdfError
+from commonforms.prefilter import PageFilter, filter_pages
 
-import formalpdf
-import pypdfium2
+# pages per model call on the accurate path when a run can be cancelled, so a
+# cancel is noticed after at most this many pages' forward pass
+CANCEL_BATCH_PAGES = 2
 
 
 class FFDNetDetector:
     def __init__(
-        self, model_or_path: str, device: int | str = "cpu", fast: bool = False
+        self,
+        model_or_path: str,
+        device: int | str = "cpu",
+        fast: bool = False,
+        cascade: bool | CascadePolicy = False,
+        dedupe: bool | DedupePolicy = False,
     ) -> None:
         self.device = device
         self.fast = fast
@@ -22,6 +52,30 @@ class FFDNetDetector:
 
         self.id_to_cls = {0: "TextBox", 1: "ChoiceButton", 2: "Signature"}
 
+        # in cascade mode FFDNet-S screens every page first and this model
+        # only runs on the pages the policy escalates
+        self.cascade_policy: CascadePolicy | None = None
+        self.first_stage: FFDNetDetector | None = None
+        if cascade:
+            self.cascade_policy = (
+                cascade if isinstance(cascade, CascadePolicy) else CascadePolicy()
+            )
+            self.first_stage = FFDNetDetector(
+                "FFDNet-S", device=device, fast=fast, dedupe=dedupe
+            )
+        # escalations of the most recent extract_widgets call in cascade mode
+        self.last_cascade: CascadeReport | None = None
+
+        # duplicate boxes are suppressed after every detector pass
+        self.dedupe_policy: DedupePolicy | None = None
+        if dedupe:
+            self.dedupe_policy = (
+                dedupe if isinstance(dedupe, DedupePolicy) else DedupePolicy()
+            )
+        # boxes before and after deduplication in the most recent call,
+        # summed over both stages in cascade mode
+        self.last_dedupe = DedupeReport()
+
     def get_model_path(
         self, model_or_path: str, device: int | str = "cpu", fast: bool = False
     ) -> str:
@@ -43,54 +97,216 @@ class FFDNetDetector:
         return model_path
 
     def extract_widgets(
-        self, pages: list[Page], confidence: float = 0.3, image_size: int = 1600
+        self,
+        pages: list[Page],
+        confidence: float = 0.3,
+        image_size: int = 1600,
+        on_page: Callable[[int, int], None] | None = None,
+        cancel: CancellationToken | None = None,
+        batch_size: int | None = None,
+    ) -> dict[int, list[Widget]]:
+        """
+        Run the detector over `pages`. `on_page(done, total)` is called after
+        each page's detections are in; `cancel` is checked between pages. In
+        cascade mode progress follows the first stage, which sees every page.
+        The accurate path hands the model `batch_size` pages at a time (all of
+        them by default, at most `CANCEL_BATCH_PAGES` when `cancel` is given);
+        its working memory grows with the batch.
+        """
+        if self.first_stage is None:
+            return self._predict(
+                pages, confidence, image_size, on_page, cancel, batch_size
+            )
+
+        # number pages by position so the escalated subset keeps its page numbers
+        pages = [
+            page if page.index is not None else replace(page, index=position)
+            for position, page in enumerate(pages)
+        ]
+        first = self.first_stage._predict(
+            pages, confidence, image_size, on_page, cancel, batch_size
+        )
+
+        report = CascadeReport(pages=len(pages))
+        for page in pages:
+            reasons = escalation_reasons(first.get(page.index, []), self.cascade_policy)
+            if reasons:
+                report.escalated.append(EscalationDecision(page.index, reasons))
+        self.last_cascade = report
+
+        escalated = {decision.page for decision in report.escalated}
+        second = self._predict(
+            [page for page in pages if page.index in escalated],
+            confidence,
+            image_size,
+            cancel=cancel,
+            batch_size=batch_size,
+        )
+        self.last_dedupe = self.first_stage.last_dedupe + self.last_dedupe
+
+        widgets = dict(first)
+        for page_ix in escalated:
+            merged = merge_detections(
+                first.get(page_ix, []), second.get(page_ix, []), self.cascade_policy
+            )
+            if merged:
+                widgets[page_ix] = sort_widgets(merged)
+            else:
+                widgets.pop(page_ix, None)
+        return widgets
+
+    def extract_boxes(
+        self,
+        pages: list[Page],
+        confidence: float = 0.3,
+        image_size: int = 1600,
+        on_page: Callable[[int, int], None] | None = None,
+        cancel: CancellationToken | None = None,
+        batch_size: int | None = None,
+    ) -> dict[int, Detections]:
+        """
+        Like `extract_widgets`, but each page's detections come back as arrays
+        (class ids index `id_to_cls`) and no Widget objects are built, which is
+        what bulk exports want. Boxes are not sorted into reading order.
+        """
+        if self.first_stage is None:
+            return self._predict_boxes(
+                pages, confidence, image_size, on_page, cancel, batch_size
+            )
+
+        # the cascade policy works on widgets
+        widgets = self.extract_widgets(
+            pages, confidence, image_size, on_page, cancel, batch_size
+        )
+        cls_to_id = {name: cls_id for cls_id, name in self.id_to_cls.items()}
+        detections = {}
+        for page_ix, page_widgets in widgets.items():
+            boxes, classes, scores = widget_arrays(page_widgets)
+            ids = np.array([cls_to_id[name] for name in classes], dtype=np.int64)
+            detections[page_ix] = Detections(boxes, ids, scores)
+        return detections
+
+    def _predict(
+        self,
+        pages: list[Page],
+        confidence: float,
+        image_size: int,
+        on_page: Callable[[int, int], None] | None = None,
+        cancel: CancellationToken | None = None,
+        batch_size: int | None = None,
     ) -> dict[int, list[Widget]]:
+        detections = self._predict_boxes(
+            pages, confidence, image_size, on_page, cancel, batch_size
+        )
+        widgets = {}
+        for page_ix, (boxes, classes, scores) in detections.items():
+            # do our best to sort the widgets into something resembling reading
+            # order; this is important for being able to Tab/Shift-Tab back and
+            # forth to navigate the page.
+            widgets[page_ix] = sort_widgets(
+                [
+                    Widget(
+                        widget_type=self.id_to_cls[int(cls_id)],
+                        bounding_box=BoundingBox(
+                            x0=float(x0), y0=float(y0), x1=float(x1), y1=float(y1)
+                        ),
+                        page=page_ix,
+                        confidence=float(score),
+                    )
+                    for (x0, y0, x1, y1), cls_id, score in zip(boxes, classes, scores)
+                ]
+            )
+        return widgets
+
+    def _predict_boxes(
+        self,
+        pages: list[Page],
+        confidence: float,
+        image_size: int,
+        on_page: Callable[[int, int], None] | None = None,
+        cancel: CancellationToken | None = None,
+        batch_size: int | None = None,
+    ) -> dict[int, Detections]:
+        self.last_dedupe = DedupeReport()
+        if not pages:
+            return {}
+
         if self.fast:
             # overrides the image size to 1216, since that's all ONNX supports
-            results = [
+            results = (
                 self.model.predict(
-                    p.image, iou=1, conf=confidence, augment=False, imgsz=1216
+                    detector_input(p.image),
+                    iou=1,
+                    conf=confidence,
+                    augment=False,
+                    imgsz=1216,
                 )
                 for p in pages
-            ]
+            )
         else:
-            results = self.model.predict(
-                [p.image for p in pages],
-                iou=0.1,
-                conf=confidence,
-                augment=True,
-                imgsz=image_size,
-                device=self.device,
+            # ultralytics stacks a list of images into a single batch, so the
+            # pages go in `batch_size` at a time; streamed, so results arrive
+            # (and can be reported) page by page
+            step = batch_size or len(pages)
+            if cancel is not None:
+                step = min(step, CANCEL_BATCH_PAGES)
+            results = (
+                result
+                for start in range(0, len(pages), step)
+                for result in self.model.predict(
+                    [detector_input(p.image) for p in pages[start : start + step]],
+                    iou=0.1,
+                    conf=confidence,
+                    augment=True,
+                    imgsz=image_size,
+                    device=self.device,
+                    stream=True,
+                )
             )
 
-        widgets = {}
-        for page_ix, result in enumerate(results):
+        detections = {}
+        for result_ix, result in enumerate(results):
+            # results are produced lazily, so stopping here skips the rest
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            if on_page is not None:
+                on_page(result_ix + 1, len(pages))
+            # widgets are keyed by their page in the source document, which
+            # differs from the list position when only some pages were rendered
+            page = pages[result_ix]
+            page_ix = page.index if page.index is not None else result_ix
             if isinstance(result, list):
                 result = result[0]
             # no predictions, skip page
             if result is None or result.boxes is None:
                 continue
 
-            widgets[page_ix] = []
-            for box in result.boxes.cpu().numpy():
-                x, y, w, h = box.xywhn[0]
-                cls_id = int(box.cls.item())
-                widget_type = self.id_to_cls[cls_id]
-
-                widgets[page_ix].append(
-                    Widget(
-                        widget_type=widget_type,
-                        bounding_box=BoundingBox.from_yolo(cx=x, cy=y, w=w, h=h),
-                        page=page_ix,
-                    )
+            boxes = result.boxes.cpu().numpy()
+            cx, cy, w, h = boxes.xywhn.T
+            corners = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+            classes = boxes.cls.astype(np.int64)
+            scores = boxes.conf
+            # duplicates are dropped on the arrays, before any Widget is built
+            self.last_dedupe.before += len(corners)
+            if self.dedupe_policy is not None:
+                corners, classes, scores = dedupe_boxes(
+                    corners, classes, scores, self.dedupe_policy
                 )
+            self.last_dedupe.after += len(corners)
+            detections[page_ix] = Detections(corners, classes, scores)
 
-            # do our best to sort the widgets into something resembling reading
-            # order; this is important for being able to Tab/Shift-Tab back and
-            # forth to navigate the page.
-            widgets[page_ix] = sort_widgets(widgets[page_ix])
+        return detections
 
-        return widgets
+
+def detector_input(image):
+    """
+    Hand images to ultralytics in a form it won't copy again: PIL images go
+    through as-is, BGR arrays are already in the layout it wants, and
+    grayscale arrays are expanded to three channels once, here.
+    """
+    if isinstance(image, np.ndarray) and image.ndim == 2:
+        return np.repeat(image[:, :, np.newaxis], 3, axis=2)
+    return image
 
 
 def sort_widgets(widgets: list[Widget]) -> list[Widget]:
@@ -135,21 +351,28 @@ def sort_widgets(widgets: list[Widget]) -> list[Widget]:
     return [widget for line in lines for widget in line]
 
 
-def render_pdf(pdf_path: str) -> list[Page]:
-    pages = []
-    doc = formalpdf.open(pdf_path)
-    try:
-        for page in doc:
-            image = page.render()
-            pages.append(Page(image=image, width=image.width, height=image.height))
-        return pages
-    finally:
-        doc.document.close()
+def render_pdf(
+    pdf_path: PdfSource | DocumentSession,
+    pages: PageSelection | None = None,
+    *,
+    as_array: bool = False,
+    grayscale: bool = False,
+    cancel: CancellationToken | None = None,
+) -> list[Page]:
+    if isinstance(pdf_path, DocumentSession):
+        return pdf_path.render(
+            pages=pages, as_array=as_array, grayscale=grayscale, cancel=cancel
+        )
+
+    with DocumentSession(pdf_path) as document:
+        return document.render(
+            pages=pages, as_array=as_array, grayscale=grayscale, cancel=cancel
+        )
 
 
 def prepare_form(
-    input_path: str | Path,
-    output_path: str | Path,
+    input_path: PdfSource,
+    output_path: str | Path | BinaryIO | None = None,
     *,
     model_or_path: str = "FFDNet-L",
     keep_existing_fields: bool = False,
@@ -158,35 +381,266 @@ def prepare_form(
     image_size: int = 1600,
     confidence: float = 0.3,
     fast: bool = False,
-):
-    detector = FFDNetDetector(model_or_path, device=device, fast=fast)
+    pages: PageSelection | None = None,
+    prefilter: bool | PageFilter = False,
+    grayscale: bool = False,
+    cascade: bool | CascadePolicy = False,
+    dedupe: bool | DedupePolicy = False,
+    cancel: CancellationToken | None = None,
+    detector: FFDNetDetector | None = None,
+) -> bytes | None:
+    """
+    Detect form fields in `input_path` and write a fillable copy to
+    `output_path`. Both sides can stay in memory: the input may be bytes, a
+    memoryview or an open binary file, and the output an open binary stream,
+    or omitted to get the PDF back as bytes. `pages` limits detection to a
+    subset of pages, either as a 1-based range string ("1-3,7") or a predicate
+    over zero-based page indices; the whole document is still written out.
+    `prefilter` skips the detector on blank pages (and, with
+    `keep_existing_fields`, pages that already have fields) when True or given
+    a PageFilter to tune it. `grayscale` renders pages in grayscale to cut
+    render memory to a third. With `cascade`, FFDNet-S runs on every page and
+    `model_or_path` only on the pages whose small-model detections look
+    ambiguous. `dedupe` suppresses duplicate detections of the same field when
+    True or given a DedupePolicy to tune it. Cancelling `cancel` from another
+    thread stops the run between pages with ProcessingCancelledError. Pass an
+    already loaded `detector` to reuse it across calls; the model options are
+    then taken from it.
+    """
+    if detector is None:
+        detector = FFDNetDetector(
+            model_or_path, device=device, fast=fast, cascade=cascade, dedupe=dedupe
+        )
 
-    try:
-        pages = render_pdf(input_path)
-    except pypdfium2._helpers.misc.PdfiumError:
-        raise EncryptedPdfError
+    # raises EncryptedPdfError if pdfium can't open the document
+    with DocumentSession(input_path) as document:
+        results = _detect(
+            detector,
+            document,
+            pages=pages,
+            prefilter=prefilter,
+            keep_existing_fields=keep_existing_fields,
+            grayscale=grayscale,
+            confidence=confidence,
+            image_size=image_size,
+            cancel=cancel,
+        )
+        writer = PyPdfFormCreator(document)
+        if not keep_existing_fields:
+            writer.clear_existing_fields()
 
-    results = detector.extract_widgets(
-        pages, confidence=confidence, image_size=image_size
-    )
+        for page_ix, widgets in results.items():
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            for i, widget in enumerate(widgets):
+                name = f"{widget.widget_type.lower()}_{widget.page}_{i}"
 
-    writer = PyPdfFormCreator(input_path)
-    if not keep_existing_fields:
-        writer.clear_existing_fields()
-
-    for page_ix, widgets in results.items():
-        for i, widget in enumerate(widgets):
-            name = f"{widget.widget_type.lower()}_{widget.page}_{i}"
-
-            if widget.widget_type == "TextBox":
-                writer.add_text_box(name, page_ix, widget.bounding_box)
-            elif widget.widget_type == "ChoiceButton":
-                writer.add_checkbox(name, page_ix, widget.bounding_box)
-            elif widget.widget_type == "Signature":
-                if use_signature_fields:
-                    writer.add_signature(name, page_ix, widget.bounding_box)
-                else:
+                if widget.widget_type == "TextBox":
                     writer.add_text_box(name, page_ix, widget.bounding_box)
+                elif widget.widget_type == "ChoiceButton":
+                    writer.add_checkbox(name, page_ix, widget.bounding_box)
+                elif widget.widget_type == "Signature":
+                    if use_signature_fields:
+                        writer.add_signature(name, page_ix, widget.bounding_box)
+                    else:
+                        writer.add_text_box(name, page_ix, widget.bounding_box)
+
+        try:
+            return writer.save(output_path)
+        finally:
+            writer.close()
+
+
+def detect_fields(
+    input_path: PdfSource,
+    *,
+    model_or_path: str = "FFDNet-L",
+    device: int | str = "cpu",
+    image_size: int = 1600,
+    confidence: float = 0.3,
+    fast: bool = False,
+    pages: PageSelection | None = None,
+    prefilter: bool | PageFilter = False,
+    keep_existing_fields: bool = False,
+    grayscale: bool = False,
+    cascade: bool | CascadePolicy = False,
+    dedupe: bool | DedupePolicy = False,
+    cancel: CancellationToken | None = None,
+    detector: FFDNetDetector | None = None,
+) -> list[PageFields]:
+    """
+    Detect form fields in `input_path` without writing a PDF. Returns one
+    entry per selected page (pages the prefilter skipped have no widgets),
+    with each widget's confidence and the page geometry needed to place the
+    boxes in PDF coordinates. Options mean the same as for `prepare_form`.
+    """
+    if detector is None:
+        detector = FFDNetDetector(
+            model_or_path, device=device, fast=fast, cascade=cascade, dedupe=dedupe
+        )
+
+    with DocumentSession(input_path) as document:
+        results = _detect(
+            detector,
+            document,
+            pages=pages,
+            prefilter=prefilter,
+            keep_existing_fields=keep_existing_fields,
+            grayscale=grayscale,
+            confidence=confidence,
+            image_size=image_size,
+            cancel=cancel,
+        )
+        return page_fields(document, results, pages)
+
+
+def export_detections(
+    inputs: Iterable[PdfSource | tuple[str, PdfSource]],
+    output_path: str | Path,
+    *,
+    model_or_path: str = "FFDNet-L",
+    device: int | str = "cpu",
+    image_size: int = 1600,
+    confidence: float = 0.3,
+    fast: bool = False,
+    pages: PageSelection | None = None,
+    prefilter: bool | PageFilter = False,
+    keep_existing_fields: bool = False,
+    grayscale: bool = False,
+    cascade: bool | CascadePolicy = False,
+    dedupe: bool | DedupePolicy = False,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    page_batch: int = 16,
+    cancel: CancellationToken | None = None,
+    detector: FFDNetDetector | None = None,
+) -> int:
+    """
+    Run detection over many documents and stream the boxes into a chunked
+    `.npz` export at `output_path` (read it back with
+    `commonforms.export.read_detections`). Each input is a path, whose id in
+    the export is the path itself, or a `(document_id, source)` pair. Pages
+    are rendered and detected `page_batch` at a time and rows are written out
+    every `chunk_rows` boxes, so memory stays bounded however much goes
+    through. Options mean the same as for `prepare_form`, except that a
+    `pages` selection past the end of a short document leaves that document
+    out rather than failing the export; it only raises
+    InvalidPageSelectionError when it selects no pages of any document.
+    Returns the number of boxes written.
+    """
+    if detector is None:
+        detector = FFDNetDetector(
+            model_or_path, device=device, fast=fast, cascade=cascade, dedupe=dedupe
+        )
+    class_names = [detector.id_to_cls[cls_id] for cls_id in sorted(detector.id_to_cls)]
+
+    unselected: InvalidPageSelectionError | None = None
+    selected_any = False
+    with DetectionWriter(output_path, class_names, chunk_rows=chunk_rows) as writer:
+        for position, item in enumerate(inputs):
+            if isinstance(item, tuple):
+                document_id, source = item
+            else:
+                source = item
+                document_id = (
+                    str(item) if isinstance(item, (str, Path)) else str(position)
+                )
 
-    writer.save(output_path)
-    writer.close()
+            with DocumentSession(source) as document:
+                try:
+                    selected = document.page_indices(pages)
+                except InvalidPageSelectionError as exc:
+                    # the document has no rows, same as one with no detections
+                    unselected = exc
+                    continue
+                selected_any = True
+                for start in range(0, len(selected), page_batch):
+                    batch = set(selected[start : start + page_batch])
+                    rendered = _render_for_detection(
+                        document,
+                        pages=batch.__contains__,
+                        prefilter=prefilter,
+                        keep_existing_fields=keep_existing_fields,
+                        grayscale=grayscale,
+                        cancel=cancel,
+                    )
+                    detections = detector.extract_boxes(
+                        rendered,
+                        confidence=confidence,
+                        image_size=image_size,
+                        cancel=cancel,
+                    )
+                    for page_ix in sorted(detections):
+                        writer.add_page(
+                            document_id,
+                            page_ix,
+                            document.page_geometry(page_ix),
+                            detections[page_ix],
+                        )
+        if unselected is not None and not selected_any:
+            raise unselected
+        writer.flush()
+        return writer.rows
+
+
+def page_fields(
+    document: DocumentSession,
+    widgets: dict[int, list[Widget]],
+    pages: PageSelection | None = None,
+) -> list[PageFields]:
+    """Pair detector output with the geometry of every selected page."""
+    return [
+        PageFields(
+            page=page_ix,
+            geometry=document.page_geometry(page_ix),
+            widgets=widgets.get(page_ix, []),
+        )
+        for page_ix in document.page_indices(pages)
+    ]
+
+
+def _detect(
+    detector: FFDNetDetector,
+    document: DocumentSession,
+    *,
+    pages: PageSelection | None,
+    prefilter: bool | PageFilter,
+    keep_existing_fields: bool,
+    grayscale: bool,
+    confidence: float,
+    image_size: int,
+    cancel: CancellationToken | None = None,
+) -> dict[int, list[Widget]]:
+    rendered = _render_for_detection(
+        document,
+        pages=pages,
+        prefilter=prefilter,
+        keep_existing_fields=keep_existing_fields,
+        grayscale=grayscale,
+        cancel=cancel,
+    )
+    return detector.extract_widgets(
+        rendered, confidence=confidence, image_size=image_size, cancel=cancel
+    )
+
+
+def _render_for_detection(
+    document: DocumentSession,
+    *,
+    pages: PageSelection | None,
+    prefilter: bool | PageFilter,
+    keep_existing_fields: bool,
+    grayscale: bool,
+    cancel: CancellationToken | None = None,
+) -> list[Page]:
+    # pages go to the detector as NumPy views of the pdfium bitmaps
+    rendered = render_pdf(
+        document, pages=pages, as_array=True, grayscale=grayscale, cancel=cancel
+    )
+    if prefilter:
+        rendered = filter_pages(
+            document,
+            rendered,
+            keep_existing_fields=keep_existing_fields,
+            page_filter=prefilter if isinstance(prefilter, PageFilter) else None,
+        ).pages
+    return rendered
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+import numpy as np
+from PIL import Image, ImageStat
+
+from commonforms.document import DocumentSession
+from commonforms.utils import Page
+
+
+@dataclass
+class PageFilter:
+    """
+    Rules for skipping detection on pages that can't (or shouldn't) get new
+    fields. Every signal is cheap compared to a detector forward pass.
+    """
+
+    # pages without text whose downsampled grayscale variance falls below
+    # this are blank; a page with any text (a label, a signature line's
+    # caption) may still need fields, however empty it looks
+    blank_variance: float = 2.0
+    # side of the downsampled image used for the variance check, in pixels
+    sample_size: int = 64
+    # skip pages that already carry widget annotations when the existing
+    # fields are kept, so detection doesn't stack duplicate fields on them
+    skip_fielded: bool = True
+    # skip pages without text whose content is only images (e.g. cover
+    # pages); off by default since scanned forms look exactly the same
+    skip_image_only: bool = False
+
+
+@dataclass
+class SkipDecision:
+    page: int
+    reason: str
+
+
+@dataclass
+class FilterResult:
+    pages: list[Page]
+    skipped: list[SkipDecision] = field(default_factory=list)
+
+
+def filter_pages(
+    document: DocumentSession,
+    pages: list[Page],
+    *,
+    keep_existing_fields: bool = False,
+    page_filter: PageFilter | None = None,
+) -> FilterResult:
+    """
+    Split rendered pages into those worth running the detector on and those
+    that can be skipped, along with the reason for each skip.
+    """
+    page_filter = page_filter or PageFilter()
+    result = FilterResult(pages=[])
+
+    for position, page in enumerate(pages):
+        page_ix = page.index if page.index is not None else position
+        reason = skip_reason(
+            document,
+            page,
+            page_ix,
+            keep_existing_fields=keep_existing_fields,
+            page_filter=page_filter,
+        )
+        if reason is None:
+            result.pages.append(page)
+        else:
+            result.skipped.append(SkipDecision(page=page_ix, reason=reason))
+
+    return result
+
+
+def skip_reason(
+    document: DocumentSession,
+    page: Page,
+    page_ix: int,
+    *,
+    keep_existing_fields: bool,
+    page_filter: PageFilter,
+) -> str | None:
+    # cheapest signals first: pdfium object/annotation counts, then pixels
+    content = document.page_content(page_ix)
+
+    if (
+        keep_existing_fields
+        and page_filter.skip_fielded
+        and content.widget_annotations > 0
+    ):
+        return "existing_fields"
+
+    if (
+        page_filter.skip_image_only
+        and content.text_chars == 0
+        and content.total_objects > 0
+        and content.image_objects == content.total_objects
+    ):
+        return "image_only"
+
+    if (
+        content.text_chars == 0
+        and pixel_variance(page.image, page_filter.sample_size)
+        < page_filter.blank_variance
+    ):
+        return "blank"
+
+    return None
+
+
+def pixel_variance(image: Image.Image | np.ndarray, sample_size: int = 64) -> float:
+    """Grayscale pixel variance of a small thumbnail of the page."""
+    if isinstance(image, np.ndarray):
+        return _array_variance(image, sample_size)
+
+    # aspect ratio doesn't matter for the variance, so squash to a square
+    thumbnail = image.resize((sample_size, sample_size), Image.Resampling.BOX)
+    thumbnail = thumbnail.convert("L")
+    return ImageStat.Stat(thumbnail).var[0]
+
+
+def _array_variance(image: np.ndarray, sample_size: int) -> float:
+    # box-average blocks of the (BGR or grayscale) array down to roughly
+    # sample_size x sample_size, matching the PIL thumbnail path
+    height, width = image.shape[:2]
+    block_y = max(1, height // sample_size)
+    block_x = max(1, width // sample_size)
+    rows, cols = height // block_y, width // block_x
+
+    blocks = image[: rows * block_y, : cols * block_x]
+    if blocks.ndim == 3:
+        blocks = blocks.reshape(rows, block_y, cols, block_x, blocks.shape[2])
+        thumbnail = blocks.mean(axis=(1, 3, 4))
+    else:
+        thumbnail = blocks.reshape(rows, block_y, cols, block_x).mean(axis=(1, 3))
+    return float(thumbnail.var())
@@ -1,8 +1,12 @@
 from __future__ import annotations
-from typing import Literal
+from collections.abc import Callable
+from typing import Literal, NamedTuple
 from pydantic import BaseModel
 from dataclasses import dataclass
 from PIL import Image
+import numpy as np
+
+from commonforms.exceptions import InvalidPageSelectionError
 
 
 class BoundingBox(BaseModel):
@@ -24,10 +28,121 @@ class Widget(BaseModel):
     ]
     bounding_box: BoundingBox
     page: int
+    # detector score; None for widgets that didn't come from the detector
+    confidence: float | None = None
+
+
+class Detections(NamedTuple):
+    """
+    One page of detector output as arrays: N x 4 `boxes` (x0, y0, x1, y1 as
+    fractions of the rendered page, origin top-left), class ids and scores.
+    """
+
+    boxes: np.ndarray
+    classes: np.ndarray
+    scores: np.ndarray
 
 
 @dataclass
 class Page:
-    image: Image.Image
+    # a PIL image, or a BGR (HxWx3) / grayscale (HxW) uint8 array
+    image: Image.Image | np.ndarray
     width: float
     height: float
+    # zero-based index of the page in the source document; None means "the
+    # position of this page in the list handed to the detector"
+    index: int | None = None
+
+
+@dataclass
+class PageGeometry:
+    """
+    The rendered area of a PDF page, in PDF points. width/height are the page
+    size as rendered; left/bottom/right/top locate the CropBox in page space.
+    """
+
+    width: float
+    height: float
+    left: float
+    bottom: float
+    right: float
+    top: float
+
+
+class PageFields(BaseModel):
+    """
+    Detected widgets on one page. Bounding boxes are fractions of the rendered
+    page area (origin top-left); `geometry` maps them back to PDF points.
+    """
+
+    page: int
+    geometry: PageGeometry
+    widgets: list[Widget]
+
+
+@dataclass
+class PageContent:
+    """Cheap structural facts about a page, read from pdfium without rendering."""
+
+    text_chars: int
+    image_objects: int
+    total_objects: int
+    widget_annotations: int
+
+
+# either a 1-based range string such as "1-3,7" or "5-", or a predicate that
+# receives each zero-based page index
+PageSelection = str | Callable[[int], bool]
+
+
+def parse_page_ranges(spec: str) -> list[tuple[int, int | None]]:
+    """
+    Parse a 1-based page range string ("1-3,7", "10-") into zero-based,
+    inclusive (start, end) pairs; an end of None means "to the last page".
+    """
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+
+        start, sep, end = part.partition("-")
+        try:
+            first = int(start)
+            last = int(end) if end.strip() else None
+        except ValueError:
+            raise ValueError(f"invalid page range: {part!r}") from None
+        if not sep:
+            last = first
+
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"invalid page range: {part!r}")
+        ranges.append((first - 1, None if last is None else last - 1))
+
+    if not ranges:
+        raise ValueError(f"no pages selected by {spec!r}")
+    return ranges
+
+
+def select_pages(pages: PageSelection | None, page_count: int) -> list[int]:
+    """
+    Resolve a page selection to sorted, zero-based page indices. Ranges that
+    run past the end of the document are clipped to it; a selection left with
+    no pages raises InvalidPageSelectionError.
+    """
+    if pages is None:
+        return list(range(page_count))
+
+    if callable(pages):
+        return [ix for ix in range(page_count) if pages(ix)]
+
+    selected = set()
+    for first, last in parse_page_ranges(pages):
+        last = page_count - 1 if last is None else min(last, page_count - 1)
+        selected.update(range(first, last + 1))
+
+    if not selected:
+        raise InvalidPageSelectionError(
+            f"{pages!r} selects no pages of a {page_count}-page document"
+        )
+    return sorted(selected)
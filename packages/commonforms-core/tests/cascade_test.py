@@ -0,0 +1,73 @@
+from commonforms.cascade import CascadePolicy, escalation_reasons, merge_detections
+from commonforms.document import DocumentSession
+from commonforms.inference import FFDNetDetector
+from commonforms.utils import BoundingBox, Widget
+
+
+def widget(widget_type, x0, y0, x1, y1, confidence=0.9):
+    return Widget(
+        widget_type=widget_type,
+        bounding_box=BoundingBox(x0=x0, y0=y0, x1=x1, y1=y1),
+        page=0,
+        confidence=confidence,
+    )
+
+
+def test_clear_page_not_escalated():
+    widgets = [
+        widget("TextBox", 0.1, 0.1, 0.4, 0.15),
+        widget("ChoiceButton", 0.5, 0.1, 0.52, 0.12),
+    ]
+    assert escalation_reasons(widgets, CascadePolicy()) == []
+
+
+def test_escalation_reasons():
+    policy = CascadePolicy()
+    assert escalation_reasons([], policy) == ["empty"]
+
+    uncertain = [
+        widget("TextBox", 0.1, 0.1, 0.4, 0.15, confidence=0.35),
+        widget("TextBox", 0.1, 0.5, 0.4, 0.55),
+    ]
+    assert escalation_reasons(uncertain, policy) == ["low_confidence"]
+
+    # the same box called both a text box and a checkbox
+    conflicting = [
+        widget("TextBox", 0.1, 0.1, 0.2, 0.15),
+        widget("ChoiceButton", 0.11, 0.1, 0.2, 0.15),
+    ]
+    assert escalation_reasons(conflicting, policy) == ["class_overlap"]
+
+    # a grid of small checkboxes packed into one corner of the page
+    dense = [
+        widget("ChoiceButton", 0.01 * i, 0.01 * j, 0.01 * i + 0.008, 0.01 * j + 0.008)
+        for i in range(4)
+        for j in range(4)
+    ]
+    assert escalation_reasons(dense, policy) == ["dense"]
+
+
+def test_merge_keeps_confident_first_stage_misses():
+    policy = CascadePolicy()
+    first = [
+        widget("TextBox", 0.1, 0.1, 0.4, 0.15, confidence=0.95),
+        widget("TextBox", 0.1, 0.5, 0.4, 0.55, confidence=0.95),
+        widget("TextBox", 0.1, 0.7, 0.4, 0.75, confidence=0.4),
+    ]
+    second = [widget("TextBox", 0.1, 0.1, 0.41, 0.15)]
+
+    merged = merge_detections(first, second, policy)
+    assert [w.bounding_box.y0 for w in merged] == [0.1, 0.5]
+    assert merged[0] is second[0]
+
+
+def test_cascade_reports_escalations():
+    detector = FFDNetDetector("FFDNet-L", fast=True, cascade=True)
+    with DocumentSession("./tests/resources/input.pdf") as document:
+        pages = document.render(as_array=True)
+    detector.extract_widgets(pages)
+
+    report = detector.last_cascade
+    assert report.pages == len(pages)
+    assert 0.0 <= report.escalation_rate <= 1.0
+    assert all(decision.reasons for decision in report.escalated)
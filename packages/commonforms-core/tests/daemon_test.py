@@ -0,0 +1,92 @@
+import json
+import shutil
+import stat
+import threading
+from pathlib import Path
+
+import pytest
+from commonforms.__main__ import main
+from commonforms.daemon import (
+    DaemonUnavailableError,
+    DetectorDaemon,
+    forward,
+)
+from commonforms.exceptions import EncryptedPdfError
+
+RESOURCES = Path(__file__).parent / "resources"
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    daemon = DetectorDaemon(tmp_path / "commonforms.sock")
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    yield daemon
+    daemon.shutdown()
+    daemon.server_close()
+    thread.join()
+
+
+def test_cli_forwards_to_daemon(daemon, tmp_path, monkeypatch):
+    # relative paths are resolved against the client's working directory
+    monkeypatch.chdir(tmp_path)
+    argv = [str(RESOURCES / "input.pdf"), "fields.json", "--model", "FFDNet-S"]
+    argv += ["--fast", "--socket", str(daemon.socket_path)]
+
+    main(argv)
+    main(argv)
+
+    pages = json.loads((tmp_path / "fields.json").read_text())["pages"]
+    assert [page["page"] for page in pages] == [0, 1]
+    # both calls ran on the same loaded detector
+    assert len(daemon.detectors._detectors) == 1
+
+    with pytest.raises(EncryptedPdfError):
+        forward(
+            daemon.socket_path,
+            [str(RESOURCES / "encrypted.pdf"), "out.pdf", "--fast"],
+            tmp_path,
+        )
+
+
+def test_daemon_resolves_relative_model_and_owns_socket(daemon, tmp_path, monkeypatch):
+    assert stat.S_IMODE(daemon.socket_path.stat().st_mode) == 0o600
+
+    # a custom model given relative to the client is loaded from the
+    # client's directory, not the daemon's
+    client = tmp_path / "client"
+    client.mkdir()
+    models = Path(__file__).parents[1] / "commonforms" / "models"
+    shutil.copy(models / "FFDNet-S.pt", client / "my.pt")
+    monkeypatch.chdir(tmp_path)
+    argv = [str(RESOURCES / "input.pdf"), "fields.json", "--model", "my.pt"]
+    forward(daemon.socket_path, argv, client)
+
+    assert (client / "fields.json").exists()
+    [key] = daemon.detectors._detectors
+    assert key[0] == str(client / "my.pt")
+
+
+def test_cli_runs_in_process_without_daemon(tmp_path):
+    socket_path = tmp_path / "missing.sock"
+    with pytest.raises(DaemonUnavailableError):
+        forward(socket_path, [], tmp_path)
+
+    output = tmp_path / "fields.json"
+    argv = [str(RESOURCES / "input.pdf"), str(output), "--model", "FFDNet-S"]
+    main(argv + ["--fast", "--socket", str(socket_path)])
+    assert len(json.loads(output.read_text())["pages"]) == 2
+
+
+def test_daemon_replaces_stale_socket(tmp_path):
+    socket_path = tmp_path / "commonforms.sock"
+    first = DetectorDaemon(socket_path)
+    # a daemon that died without cleaning up leaves its socket file behind
+    first.socket.close()
+    assert socket_path.exists()
+
+    second = DetectorDaemon(socket_path)
+    with pytest.raises(OSError):
+        DetectorDaemon(socket_path)
+    second.server_close()
+    assert not socket_path.exists()
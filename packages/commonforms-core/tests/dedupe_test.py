@@ -0,0 +1,81 @@
+import numpy as np
+from commonforms.dedupe import DedupePolicy, dedupe_boxes
+
+
+def brute_force_nms(boxes, classes, scores, policy):
+    kept = []
+    for ix in np.argsort(-scores, kind="stable"):
+        duplicate = False
+        for other in kept:
+            if policy.class_aware and classes[ix] != classes[other]:
+                continue
+            x0, y0 = np.maximum(boxes[ix, :2], boxes[other, :2])
+            x1, y1 = np.minimum(boxes[ix, 2:], boxes[other, 2:])
+            intersection = max(0.0, x1 - x0) * max(0.0, y1 - y0)
+            areas = [np.prod(boxes[i, 2:] - boxes[i, :2]) for i in (ix, other)]
+            iou = intersection / (sum(areas) - intersection)
+            if iou >= policy.iou_threshold or (
+                intersection / min(areas) >= policy.containment_threshold
+            ):
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(ix)
+    return kept
+
+
+def test_duplicates_suppressed_per_class():
+    boxes = np.array(
+        [
+            [0.10, 0.10, 0.40, 0.15],
+            [0.11, 0.10, 0.40, 0.15],  # near-copy of the first
+            [0.20, 0.11, 0.30, 0.14],  # nested inside the first
+            [0.10, 0.10, 0.40, 0.15],  # same box, different class
+            [0.60, 0.60, 0.62, 0.62],
+        ]
+    )
+    classes = np.array([0, 0, 0, 1, 1])
+    scores = np.array([0.9, 0.8, 0.5, 0.4, 0.7])
+
+    kept_boxes, kept_classes, kept_scores = dedupe_boxes(
+        boxes, classes, scores, DedupePolicy(merge=False)
+    )
+    assert kept_scores.tolist() == [0.9, 0.7, 0.4]
+    assert kept_classes.tolist() == [0, 1, 1]
+    assert kept_boxes.tolist() == [
+        boxes[0].tolist(),
+        boxes[4].tolist(),
+        boxes[3].tolist(),
+    ]
+
+    _, agnostic_classes, _ = dedupe_boxes(
+        boxes, classes, scores, DedupePolicy(merge=False, class_aware=False)
+    )
+    assert agnostic_classes.tolist() == [0, 1]
+
+
+def test_merge_averages_duplicates():
+    boxes = np.array([[0.10, 0.10, 0.30, 0.20], [0.12, 0.10, 0.32, 0.20]])
+    merged, _, scores = dedupe_boxes(
+        boxes, np.array([0, 0]), np.array([0.75, 0.25]), DedupePolicy()
+    )
+    assert scores.tolist() == [0.75]
+    np.testing.assert_allclose(merged, [[0.105, 0.10, 0.305, 0.20]])
+
+
+def test_grid_matches_brute_force():
+    rng = np.random.default_rng(0)
+    corners = rng.random((300, 2)) * 0.9
+    boxes = np.concatenate([corners, corners + rng.random((300, 2)) * 0.1], axis=1)
+    # duplicates of a third of the boxes, jittered
+    copies = boxes[:100] + rng.normal(0, 0.002, (100, 4))
+    boxes = np.concatenate([boxes, copies])
+    classes = np.concatenate([rng.integers(0, 3, 300), np.zeros(100, dtype=int)])
+    classes[:100] = 0
+    scores = rng.random(len(boxes))
+    policy = DedupePolicy(merge=False)
+
+    kept_boxes, _, _ = dedupe_boxes(boxes, classes, scores, policy)
+    expected = brute_force_nms(boxes, classes, scores, policy)
+    assert kept_boxes.tolist() == boxes[expected].tolist()
+    assert len(kept_boxes) < len(boxes)
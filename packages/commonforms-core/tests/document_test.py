@@ -0,0 +1,123 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import commonforms.exceptions
+import formalpdf
+import numpy as np
+import pytest
+from commonforms.cancellation import CancellationToken
+from commonforms.document import DocumentSession
+from commonforms.form_creator import PyPdfFormCreator
+from commonforms.utils import BoundingBox, select_pages
+
+
+def test_session_geometry_and_render():
+    with DocumentSession("./tests/resources/input.pdf") as document:
+        pages = document.render()
+
+        assert len(pages) == len(document) == len(document.geometry)
+        for page, geometry in zip(pages, document.geometry):
+            assert (page.width, page.height) == (
+                round(geometry.width),
+                round(geometry.height),
+            )
+
+
+def test_session_shared_with_writer(tmp_path):
+    output_path = tmp_path / "output.pdf"
+
+    with DocumentSession("./tests/resources/input.pdf") as document:
+        writer = PyPdfFormCreator(document)
+        writer.add_text_box(
+            "textbox_0_0", 0, BoundingBox(x0=0.1, y0=0.1, x1=0.4, y1=0.15)
+        )
+        writer.save(output_path)
+        writer.close()
+
+    doc = formalpdf.open(output_path)
+    names = [widget.field_name for widget in doc[0].widgets()]
+    assert "textbox_0_0" in names
+
+    doc.document.close()
+
+
+def test_concurrent_render_of_separate_documents():
+    # pdfium shares global state between documents; unserialized renders on
+    # several threads corrupt the bitmaps or crash the process
+    with DocumentSession("./tests/resources/input.pdf") as document:
+        expected = [page.image for page in document.render(as_array=True)]
+
+    def render(_):
+        with DocumentSession("./tests/resources/input.pdf") as document:
+            return [page.image for page in document.render(as_array=True)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(render, range(32)))
+
+    for images in results:
+        assert len(images) == len(expected)
+        for image, reference in zip(images, expected):
+            assert np.array_equal(image, reference)
+
+
+def test_session_and_writer_in_memory():
+    with open("./tests/resources/input.pdf", "rb") as handle:
+        data = handle.read()
+
+    for source in (data, bytearray(data), memoryview(data), io.BytesIO(data)):
+        with DocumentSession(source) as document:
+            assert document.path is None
+            assert len(document.render(pages="1")) == 1
+
+            writer = PyPdfFormCreator(document)
+            writer.add_text_box(
+                "textbox_0_0", 0, BoundingBox(x0=0.1, y0=0.1, x1=0.4, y1=0.15)
+            )
+            output = writer.save()
+            writer.close()
+        assert output.startswith(b"%PDF")
+
+    # the writer also reads in-memory PDFs without a session
+    writer = PyPdfFormCreator(memoryview(data))
+    assert writer.save().startswith(b"%PDF")
+    writer.close()
+
+
+def test_session_encrypted_failure():
+    with pytest.raises(commonforms.exceptions.EncryptedPdfError):
+        DocumentSession("./tests/resources/encrypted.pdf")
+
+
+def test_render_page_selection():
+    with DocumentSession("./tests/resources/input.pdf") as document:
+        pages = document.render(pages="2")
+        assert [page.index for page in pages] == [1]
+
+        pages = document.render(pages=lambda ix: ix == 0)
+        assert [page.index for page in pages] == [0]
+
+
+def test_render_stops_when_cancelled():
+    cancel = CancellationToken()
+    with DocumentSession("./tests/resources/input.pdf") as document:
+        assert len(document.render(cancel=CancellationToken())) == len(document)
+
+        cancel.cancel()
+        with pytest.raises(commonforms.exceptions.ProcessingCancelledError):
+            document.render(cancel=cancel)
+
+
+def test_select_pages():
+    assert select_pages(None, 3) == [0, 1, 2]
+    assert select_pages("1-3,7", 10) == [0, 1, 2, 6]
+    assert select_pages("8-", 10) == [7, 8, 9]
+    assert select_pages("2, 2-3", 10) == [1, 2]
+    # ranges past the end of the document are clipped
+    assert select_pages("2-20", 3) == [1, 2]
+
+    with pytest.raises(commonforms.exceptions.InvalidPageSelectionError):
+        select_pages("5", 3)
+    with pytest.raises(ValueError):
+        select_pages("3-1", 10)
+    with pytest.raises(ValueError):
+        select_pages("a-b", 10)
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from commonforms.evaluate import (
+    DetectorConfig,
+    EvalResult,
+    LabeledPage,
+    average_precision,
+    load_labeled_pages,
+    pareto_frontier,
+    score,
+    sweep,
+)
+from PIL import Image
+
+
+def labeled(boxes, classes):
+    return LabeledPage(None, np.array(boxes, dtype=float), np.array(classes))
+
+
+def test_average_precision_counts_matches_and_misses():
+    labels = [
+        labeled([[0.1, 0.1, 0.3, 0.2], [0.5, 0.5, 0.7, 0.6]], [0, 0]),
+        labeled([[0.1, 0.1, 0.2, 0.2]], [1]),
+    ]
+    detections = [
+        (
+            # a hit, a false positive scoring in between, and a duplicate
+            np.array(
+                [[0.1, 0.1, 0.3, 0.2], [0.8, 0.8, 0.9, 0.9], [0.1, 0.1, 0.3, 0.2]]
+            ),
+            np.array([0, 0, 0]),
+            np.array([0.9, 0.8, 0.7]),
+        ),
+        (np.zeros((0, 4)), np.zeros(0, dtype=int), np.zeros(0)),
+    ]
+
+    ap, recall, count = average_precision(detections, labels, 0, 0.5)
+    assert count == 2
+    assert recall == 0.5
+    # precision 1 up to recall 0.5, nothing after
+    assert ap == pytest.approx(51 / 101)
+
+    ap, recall, count = average_precision(detections, labels, 1, 0.5)
+    assert (ap, recall, count) == (0.0, 0.0, 1)
+
+
+def test_score_skips_unlabeled_classes():
+    labels = [labeled([[0.1, 0.1, 0.3, 0.2]], [0])]
+    detections = [(labels[0].boxes, labels[0].classes, np.array([0.9]))]
+
+    result = score(DetectorConfig(), detections, labels, seconds=0.5, peak_rss_mb=10)
+    assert list(result.per_class) == ["TextBox"]
+    assert result.map50 == result.map50_95 == 1.0
+    assert result.pages_per_second == 2.0
+
+
+def test_load_labeled_pages(tmp_path):
+    (tmp_path / "images").mkdir()
+    (tmp_path / "labels").mkdir()
+    for name in ("a", "b"):
+        Image.new("RGB", (10, 10)).save(tmp_path / "images" / f"{name}.png")
+    (tmp_path / "labels" / "a.txt").write_text("2 0.5 0.5 0.2 0.4\n")
+
+    a, b = load_labeled_pages(tmp_path)
+    np.testing.assert_allclose(a.boxes, [[0.4, 0.3, 0.6, 0.7]])
+    assert a.classes.tolist() == [2]
+    assert len(b.boxes) == 0
+
+
+def test_sweep_and_pareto_frontier():
+    configs = sweep(["FFDNet-S"], [False, True], [1216, 1600], [0.3])
+    assert [(c.fast, c.image_size) for c in configs] == [
+        (False, 1216),
+        (False, 1600),
+        (True, 1216),
+    ]
+
+    def result(map50, speed, rss):
+        return EvalResult(DetectorConfig(), 1, 1.0, speed, rss, map50, map50)
+
+    accurate, fast, dominated, lean = (
+        result(0.9, 1.0, 500),
+        result(0.7, 5.0, 500),
+        result(0.6, 4.0, 600),
+        result(0.5, 1.0, 100),
+    )
+    frontier = pareto_frontier([accurate, fast, dominated, lean])
+    assert frontier == [fast, accurate, lean]
@@ -0,0 +1,105 @@
+import io
+
+import numpy as np
+import pypdf
+import pytest
+from commonforms.exceptions import InvalidPageSelectionError
+from commonforms.export import DetectionWriter, iter_detections, read_detections
+from commonforms.inference import FFDNetDetector, export_detections
+from commonforms.utils import Detections, PageGeometry
+
+LETTER = PageGeometry(width=612, height=792, left=0, bottom=0, right=612, top=792)
+
+
+def detections(count, cls_id=0):
+    boxes = np.tile([0.1, 0.2, 0.3, 0.25], (count, 1))
+    return Detections(
+        boxes, np.full(count, cls_id), np.linspace(0.5, 0.9, count, dtype=np.float32)
+    )
+
+
+def test_writer_round_trip_in_chunks(tmp_path):
+    path = tmp_path / "detections.npz"
+    with DetectionWriter(
+        path, ["TextBox", "ChoiceButton", "Signature"], chunk_rows=4
+    ) as writer:
+        writer.add_page("a.pdf", 0, LETTER, detections(3))
+        writer.add_page("a.pdf", 1, LETTER, detections(0))
+        writer.add_page("b.pdf", 2, LETTER, detections(2, cls_id=1))
+        writer.add_page("c.pdf", 0, LETTER, detections(1, cls_id=2))
+    assert writer.rows == 6
+    assert writer.chunks == 2
+
+    chunks = list(iter_detections(path))
+    assert [len(chunk["page"]) for chunk in chunks] == [5, 1]
+
+    columns = read_detections(path)
+    assert columns["document"].tolist() == ["a.pdf"] * 3 + ["b.pdf"] * 2 + ["c.pdf"]
+    assert columns["page"].tolist() == [0, 0, 0, 2, 2, 0]
+    assert columns["widget_type"].tolist()[2:] == [
+        "TextBox",
+        "ChoiceButton",
+        "ChoiceButton",
+        "Signature",
+    ]
+    assert columns["page_width"].dtype == np.float32
+    np.testing.assert_allclose(columns["x1"], 0.3)
+    np.testing.assert_allclose(columns["page_height"], 792)
+
+    # the export is a plain .npz as well
+    with np.load(path) as archive:
+        assert archive["chunk000000.page"].tolist() == [0, 0, 0, 2, 2]
+
+
+def test_export_detections(tmp_path):
+    path = tmp_path / "detections.npz"
+    with open("./tests/resources/input.pdf", "rb") as handle:
+        data = handle.read()
+
+    rows = export_detections(
+        ["./tests/resources/input.pdf", ("in-memory", data)],
+        path,
+        fast=True,
+        page_batch=1,
+    )
+
+    columns = read_detections(path)
+    assert len(columns["page"]) == rows
+    assert set(columns["document"].tolist()) <= {
+        "./tests/resources/input.pdf",
+        "in-memory",
+    }
+    assert rows > 0
+
+
+def test_export_skips_documents_without_selected_pages(tmp_path, monkeypatch):
+    writer = pypdf.PdfWriter()
+    writer.append("./tests/resources/input.pdf")
+    writer.append("./tests/resources/input.pdf")
+    longer = io.BytesIO()
+    writer.write(longer)
+
+    detector = FFDNetDetector("FFDNet-S", fast=True)
+    extract_boxes = detector.extract_boxes
+    detected = []
+
+    def recording_extract_boxes(pages, **kwargs):
+        detected.extend(page.index for page in pages)
+        return extract_boxes(pages, **kwargs)
+
+    monkeypatch.setattr(detector, "extract_boxes", recording_extract_boxes)
+    inputs = [("short", "./tests/resources/input.pdf"), ("long", longer.getvalue())]
+    export_detections(
+        inputs, tmp_path / "detections.npz", pages="3-4", detector=detector
+    )
+
+    assert sorted(detected) == [2, 3]
+    assert set(read_detections(tmp_path / "detections.npz")["document"].tolist()) <= {
+        "long"
+    }
+
+    # a selection that matches no document is still an error
+    with pytest.raises(InvalidPageSelectionError):
+        export_detections(
+            inputs[:1], tmp_path / "short.npz", pages="3-4", detector=detector
+        )
@@ -1,7 +1,13 @@
+from dataclasses import replace
+import io
+
 import commonforms
+from commonforms.cancellation import CancellationToken
 import commonforms.exceptions
+from commonforms.inference import FFDNetDetector, render_pdf
 
 import formalpdf
+import numpy as np
 import pytest
 
 
@@ -30,6 +36,23 @@ def test_inference_fast(tmp_path):
     doc.document.close()
 
 
+def test_inference_in_memory():
+    with open("./tests/resources/input.pdf", "rb") as handle:
+        data = handle.read()
+
+    output = commonforms.prepare_form(memoryview(data), fast=True)
+    assert output.startswith(b"%PDF")
+
+    buffer = io.BytesIO()
+    commonforms.prepare_form(io.BytesIO(data), buffer, fast=True)
+    assert buffer.getvalue().startswith(b"%PDF")
+
+    doc = formalpdf.open(output)
+    assert len(doc[0].widgets()) > 0
+
+    doc.document.close()
+
+
 def test_encrypted_failure(tmp_path):
     # Reminder to future Joe: password for encrypted PDF is "kanbanery"
     output_path = tmp_path / "output.pdf"
@@ -42,3 +65,46 @@ def test_encrypted_failure(tmp_path):
 #   1. add a --password flag and test that inference doesn't fail
 #   2. if a password is provided, ensure that the _output_ PDF remains encrpyted
 #      with the same password
+
+
+def test_detect_fields():
+    fields = commonforms.detect_fields("./tests/resources/input.pdf", fast=True)
+
+    assert [page.page for page in fields] == [0, 1]
+    assert fields[0].geometry.width > 0
+    assert len(fields[0].widgets) > 0
+    assert all(widget.confidence >= 0.3 for widget in fields[0].widgets)
+
+
+def test_batched_detection_matches_single_batch():
+    rendered = render_pdf("./tests/resources/input.pdf", as_array=True) * 3
+    pages = [replace(page, index=ix) for ix, page in enumerate(rendered)]
+    detector = FFDNetDetector("FFDNet-S")
+    together = detector.extract_boxes(pages, confidence=0.05)
+    batched = detector.extract_boxes(pages, confidence=0.05, batch_size=2)
+
+    assert together.keys() == batched.keys()
+    for page_ix, (boxes, classes, scores) in together.items():
+        np.testing.assert_allclose(batched[page_ix].boxes, boxes, atol=1e-3)
+        np.testing.assert_array_equal(batched[page_ix].classes, classes)
+
+
+def test_cancel_stops_accurate_detection_early(monkeypatch):
+    rendered = render_pdf("./tests/resources/input.pdf", as_array=True) * 8
+    pages = [replace(page, index=ix) for ix, page in enumerate(rendered)]
+    detector = FFDNetDetector("FFDNet-S")
+    predict = detector.model.predict
+    predicted = []
+
+    def counting_predict(source, **kwargs):
+        predicted.append(len(source))
+        return predict(source, **kwargs)
+
+    monkeypatch.setattr(detector.model, "predict", counting_predict)
+    cancel = CancellationToken()
+    with pytest.raises(commonforms.exceptions.ProcessingCancelledError):
+        detector.extract_boxes(
+            pages, on_page=lambda done, total: cancel.cancel(), cancel=cancel
+        )
+
+    assert 0 < sum(predicted) < len(pages)
@@ -0,0 +1,70 @@
+from commonforms.document import DocumentSession
+from commonforms.form_creator import PyPdfFormCreator
+from commonforms.prefilter import PageFilter, filter_pages, pixel_variance
+from commonforms.utils import BoundingBox
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+
+def test_blank_page_skipped(tmp_path):
+    pdf_path = tmp_path / "with_blank.pdf"
+    writer = PdfWriter(clone_from="./tests/resources/input.pdf")
+    writer.add_blank_page(width=612, height=792)
+    writer.write(pdf_path)
+
+    with DocumentSession(pdf_path) as document:
+        result = filter_pages(document, document.render())
+
+    assert [page.index for page in result.pages] == [0, 1]
+    assert [(skip.page, skip.reason) for skip in result.skipped] == [(2, "blank")]
+
+
+def test_fielded_page_skipped_when_keeping_fields(tmp_path):
+    pdf_path = tmp_path / "fielded.pdf"
+    with DocumentSession("./tests/resources/input.pdf") as document:
+        writer = PyPdfFormCreator(document)
+        writer.add_text_box(
+            "textbox_1_0", 1, BoundingBox(x0=0.1, y0=0.1, x1=0.4, y1=0.15)
+        )
+        writer.save(pdf_path)
+        writer.close()
+
+    with DocumentSession(pdf_path) as document:
+        pages = document.render()
+        kept = filter_pages(document, pages, keep_existing_fields=True)
+        replaced = filter_pages(document, pages, keep_existing_fields=False)
+
+    assert [(skip.page, skip.reason) for skip in kept.skipped] == [
+        (1, "existing_fields")
+    ]
+    assert replaced.skipped == []
+
+
+def test_near_blank_page_with_text_kept(tmp_path):
+    # a caption alone barely moves the pixel variance, but a page with any
+    # text may still need a field
+    pdf_path = tmp_path / "caption.pdf"
+    writer = PdfWriter(clone_from="./tests/resources/input.pdf")
+    page = writer.add_blank_page(width=612, height=792)
+    font = DictionaryObject(
+        {
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+        }
+    )
+    page[NameObject("/Resources")] = DictionaryObject(
+        {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})}
+    )
+    caption = DecodedStreamObject()
+    caption.set_data(b"BT /F1 8 Tf 72 72 Td (Signature) Tj ET")
+    page.replace_contents(caption)
+    writer.write(pdf_path)
+
+    with DocumentSession(pdf_path) as document:
+        pages = document.render()
+        assert pixel_variance(pages[2].image) < PageFilter().blank_variance
+        result = filter_pages(document, pages)
+
+    assert [page.index for page in result.pages] == [0, 1, 2]
+    assert result.skipped == []